@@ -0,0 +1,399 @@
+"""
+Streaming Adapter Archive Packer
+
+pack_directory writes a tar of the adapter directory straight into an
+upload, without a temporary tarball and without holding the archive in
+memory:
+
+- tar output is cut into ARTIFACT_CHUNK_MB chunks (default 4MB), and the
+  chunks are compressed in parallel on ARTIFACT_THREADS threads (default:
+  all cores). Each chunk becomes an independent gzip member or zstd frame;
+  concatenated members/frames are a valid .tar.gz / .tar.zst that stock
+  tar, gunzip and zstd read as one stream.
+- ARTIFACT_COMPRESSION selects zstd or gzip (default gzip, which keeps the
+  adapters/<job_id>.tar.gz contract; zstd needs the zstandard package).
+- Files matching ARTIFACT_STORE_PATTERNS (default *.safetensors) are
+  stored rather than compressed: fp16 weights barely shrink, so
+  compressing them only costs time. Stored chunks are gzip members at
+  level 0 or raw-block zstd frames.
+- Compressed chunks go to a sink in order. TusUploader sends them to
+  Supabase Storage as a resumable (TUS) upload in 6MB chunks, resuming
+  from the server's offset after a failed chunk. LocalFileSink writes
+  them to a file.
+
+At most 2 x threads chunks are in flight, plus one upload chunk.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import gzip
+import time
+import base64
+import fnmatch
+import logging
+import tarfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Sequence
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = ('zstd', 'gzip')
+EXTENSIONS = {'zstd': '.tar.zst', 'gzip': '.tar.gz'}
+CONTENT_TYPES = {'zstd': 'application/zstd', 'gzip': 'application/gzip'}
+DEFAULT_LEVELS = {'zstd': 3, 'gzip': 6}
+
+DEFAULT_CHUNK_MB = 4
+DEFAULT_STORE_PATTERNS = '*.safetensors'
+
+# Supabase's resumable endpoint requires 6MB chunks (except the last)
+TUS_CHUNK_BYTES = 6 * 1024 * 1024
+TUS_MAX_RETRIES = 5
+TUS_TIMEOUT_SECONDS = 120
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZSTD_MAX_BLOCK = 128 * 1024
+
+
+class UploadError(Exception):
+    """Raised when an artifact upload cannot be completed."""
+
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    """
+    Compression codec from the argument or ARTIFACT_COMPRESSION.
+
+    zstd falls back to gzip when the zstandard package is not installed.
+    """
+    codec = (codec or os.environ.get('ARTIFACT_COMPRESSION', 'gzip')).lower()
+    if codec not in CODECS:
+        raise ValueError(f"ARTIFACT_COMPRESSION must be one of {', '.join(CODECS)}")
+    if codec == 'zstd' and zstandard is None:
+        logger.warning("zstandard is not installed - packing the adapter with gzip")
+        codec = 'gzip'
+    return codec
+
+
+def _zstd_stored_frame(data: bytes) -> bytes:
+    """A zstd frame of raw (uncompressed) blocks."""
+    # Single-segment frame with a 4-byte content size
+    parts = [ZSTD_MAGIC, bytes([0xA0]), len(data).to_bytes(4, 'little')]
+    offset = 0
+    while True:
+        block = data[offset:offset + ZSTD_MAX_BLOCK]
+        offset += len(block)
+        last = offset >= len(data)
+        # Block header: last-block bit, type 0 (raw), 21-bit size
+        parts.append((int(last) | len(block) << 3).to_bytes(3, 'little'))
+        parts.append(block)
+        if last:
+            return b''.join(parts)
+
+
+def compress_chunk(codec: str, level: int, data: bytes, store: bool = False) -> bytes:
+    """Compress one chunk as a self-contained gzip member or zstd frame."""
+    if codec == 'gzip':
+        return gzip.compress(data, compresslevel=0 if store else level, mtime=0)
+    if store:
+        return _zstd_stored_frame(data)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+class ParallelCompressor:
+    """
+    Write-only file object that compresses chunks on a thread pool.
+
+    Compressed chunks are handed to sink.write() in order. tarfile only
+    needs write() and tell().
+
+    Args:
+        sink: Receives compressed bytes (write / close / abort)
+        codec: 'zstd' or 'gzip'
+        level: Compression level (default per codec)
+        threads: Compression threads (default: ARTIFACT_THREADS or all cores)
+        chunk_bytes: Uncompressed bytes per chunk (default: ARTIFACT_CHUNK_MB)
+    """
+
+    def __init__(
+        self,
+        sink,
+        codec: str,
+        level: Optional[int] = None,
+        threads: Optional[int] = None,
+        chunk_bytes: Optional[int] = None
+    ):
+        self.sink = sink
+        self.codec = codec
+        self.level = level if level is not None else DEFAULT_LEVELS[codec]
+        self.threads = threads or int(os.environ.get('ARTIFACT_THREADS', 0)) or os.cpu_count() or 1
+        self.chunk_bytes = chunk_bytes or int(os.environ.get('ARTIFACT_CHUNK_MB', DEFAULT_CHUNK_MB)) * 1024 * 1024
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='artifact-compress')
+        self.in_flight: Deque[Future] = deque()
+        self.buffer = bytearray()
+        self.store = False
+        self.position = 0
+        self.stored_bytes = 0
+        self.compressed_bytes = 0
+
+    def set_store(self, store: bool) -> None:
+        """Store (rather than compress) what is written from here on."""
+        if store != self.store:
+            self._submit(len(self.buffer))
+            self.store = store
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        while len(self.buffer) >= self.chunk_bytes:
+            self._submit(self.chunk_bytes)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def _submit(self, size: int) -> None:
+        if size == 0:
+            return
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        if self.store:
+            self.stored_bytes += len(chunk)
+        self.in_flight.append(self.executor.submit(compress_chunk, self.codec, self.level, chunk, self.store))
+        self._drain(2 * self.threads)
+
+    def _drain(self, limit: int) -> None:
+        while len(self.in_flight) > limit:
+            data = self.in_flight.popleft().result()
+            self.compressed_bytes += len(data)
+            self.sink.write(data)
+
+    def close(self) -> None:
+        """Compress what is buffered and hand everything to the sink."""
+        self._submit(len(self.buffer))
+        self._drain(0)
+        self.executor.shutdown()
+
+    def abort(self) -> None:
+        for future in self.in_flight:
+            future.cancel()
+        self.in_flight.clear()
+        self.executor.shutdown(wait=False)
+
+
+class LocalFileSink:
+    """Writes the archive to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'wb')
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+
+    def close(self) -> str:
+        self.file.close()
+        return f"local://{self.path}"
+
+    def abort(self) -> None:
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class TusUploader:
+    """
+    Streams an object into Supabase Storage with the TUS resumable protocol.
+
+    The total size is not known up front, so the upload is created with
+    Upload-Defer-Length and the length is sent with the last chunk. A
+    failed chunk is retried from the offset the server reports.
+
+    Args:
+        supabase_url: Project URL (SUPABASE_URL)
+        key: Service role key
+        bucket: Storage bucket
+        object_name: Object path within the bucket
+        content_type: Content type stored with the object
+        session: HTTP session (default: a new pooled session)
+        chunk_bytes: Bytes per PATCH request
+    """
+
+    def __init__(
+        self,
+        supabase_url: str,
+        key: str,
+        bucket: str,
+        object_name: str,
+        content_type: str,
+        session: Optional[requests.Session] = None,
+        chunk_bytes: int = TUS_CHUNK_BYTES
+    ):
+        self.endpoint = f"{supabase_url.rstrip('/')}/storage/v1/upload/resumable"
+        self.bucket = bucket
+        self.object_name = object_name
+        self.content_type = content_type
+        self.chunk_bytes = chunk_bytes
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f"Bearer {key}",
+            'apikey': key,
+            'Tus-Resumable': '1.0.0',
+        })
+        self.location: Optional[str] = None
+        self.offset = 0
+        self.buffer = bytearray()
+
+    def _create(self) -> None:
+        metadata = ','.join(
+            f"{name} {base64.b64encode(value.encode('utf-8')).decode('ascii')}"
+            for name, value in (
+                ('bucketName', self.bucket),
+                ('objectName', self.object_name),
+                ('contentType', self.content_type),
+            )
+        )
+        response = self.session.post(
+            self.endpoint,
+            headers={'Upload-Defer-Length': '1', 'Upload-Metadata': metadata, 'x-upsert': 'true'},
+            timeout=TUS_TIMEOUT_SECONDS
+        )
+        if response.status_code != 201 or 'Location' not in response.headers:
+            raise UploadError(f"Creating upload failed: HTTP {response.status_code} {response.text[:200]}")
+        self.location = urljoin(self.endpoint, response.headers['Location'])
+
+    def _server_offset(self) -> int:
+        response = self.session.head(self.location, timeout=TUS_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return int(response.headers['Upload-Offset'])
+
+    def _send(self, chunk: bytes, final: bool) -> None:
+        if self.location is None:
+            self._create()
+
+        total = self.offset + len(chunk)
+        for attempt in range(TUS_MAX_RETRIES + 1):
+            headers = {'Upload-Offset': str(self.offset), 'Content-Type': 'application/offset+octet-stream'}
+            if final:
+                headers['Upload-Length'] = str(total)
+            try:
+                response = self.session.patch(self.location, data=chunk, headers=headers, timeout=TUS_TIMEOUT_SECONDS)
+                if response.status_code == 204:
+                    self.offset = total
+                    return
+                if response.status_code < 500 and response.status_code not in (409, 423, 429):
+                    raise UploadError(f"Upload chunk rejected: HTTP {response.status_code} {response.text[:200]}")
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+
+            if attempt == TUS_MAX_RETRIES:
+                raise UploadError(f"Upload failed at offset {self.offset} after {attempt + 1} attempts: {error}")
+
+            delay = min(2 ** attempt, 30)
+            logger.warning(f"Upload chunk at offset {self.offset} failed ({error}); retrying in {delay}s")
+            time.sleep(delay)
+
+            # Part of the chunk may have been stored; resume from where the server is
+            try:
+                server_offset = self._server_offset()
+            except (requests.RequestException, KeyError, ValueError):
+                continue
+            if self.offset < server_offset <= total:
+                chunk = chunk[server_offset - self.offset:]
+                self.offset = server_offset
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_bytes:
+            self._send(bytes(self.buffer[:self.chunk_bytes]), final=False)
+            del self.buffer[:self.chunk_bytes]
+
+    def close(self) -> str:
+        """Send the last chunk with the total length; returns "<bucket>/<object_name>"."""
+        self._send(bytes(self.buffer), final=True)
+        self.buffer.clear()
+        self.session.close()
+        return f"{self.bucket}/{self.object_name}"
+
+    def abort(self) -> None:
+        """Discard the partial upload."""
+        if self.location:
+            try:
+                self.session.delete(self.location, timeout=TUS_TIMEOUT_SECONDS)
+            except requests.RequestException:
+                pass
+        self.session.close()
+
+
+def _store_patterns() -> List[str]:
+    value = os.environ.get('ARTIFACT_STORE_PATTERNS', DEFAULT_STORE_PATTERNS)
+    return [pattern.strip() for pattern in value.split(',') if pattern.strip()]
+
+
+def pack_directory(
+    source_dir: str,
+    sink,
+    codec: str,
+    store_patterns: Optional[Sequence[str]] = None,
+    level: Optional[int] = None,
+    threads: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Stream a compressed tar of source_dir into sink.
+
+    Args:
+        source_dir: Directory to archive (stored under its base name)
+        sink: LocalFileSink, TusUploader or any object with write / close / abort
+        codec: 'zstd' or 'gzip' (see resolve_codec)
+        store_patterns: File name patterns stored uncompressed (default: ARTIFACT_STORE_PATTERNS)
+        level: Compression level (default per codec)
+        threads: Compression threads
+
+    Returns:
+        Dictionary with the sink's path and archive sizes
+    """
+    if store_patterns is None:
+        store_patterns = _store_patterns()
+    start = time.time()
+    stream = ParallelCompressor(sink, codec, level=level, threads=threads)
+
+    def select(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+        name = os.path.basename(tarinfo.name)
+        stream.set_store(tarinfo.isfile() and any(fnmatch.fnmatch(name, pattern) for pattern in store_patterns))
+        return tarinfo
+
+    try:
+        with tarfile.open(fileobj=stream, mode='w', format=tarfile.PAX_FORMAT) as tar:
+            tar.add(source_dir, arcname=os.path.basename(os.path.normpath(source_dir)), filter=select)
+        stream.close()
+        path = sink.close()
+    except BaseException:
+        stream.abort()
+        sink.abort()
+        raise
+
+    return {
+        'path': path,
+        'codec': codec,
+        'tar_bytes': stream.position,
+        'stored_bytes': stream.stored_bytes,
+        'archive_bytes': stream.compressed_bytes,
+        'threads': stream.threads,
+        'seconds': time.time() - start,
+    }
@@ -0,0 +1,179 @@
+"""
+Automatic Micro-Batch and Gradient-Accumulation Tuning
+
+With auto_batch_size enabled, the job no longer fails when the requested
+batch_size does not fit in GPU memory. Instead it probes the largest
+micro-batch that fits at the job's max_seq_length and makes up the
+difference with gradient accumulation, so the effective batch size (and
+therefore the learning-rate schedule) is exactly what was requested.
+
+Only divisors of the requested batch size are probed, so micro_batch *
+accumulation always equals the request. Fit is monotone in batch size,
+which lets the search binary-search the divisor list.
+
+Probing is separated from the search: find_micro_batch takes any
+`fits(batch_size) -> bool` callable, and StepMemoryProbe implements it by
+running one forward/backward pass against an optional memory limit. On CPU
+the limit is checked against parameter bytes plus the activations saved
+for backward, so the logic can be exercised without a GPU.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import logging
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Share of GPU memory a probe may use; the rest covers fragmentation and eval
+DEFAULT_MEMORY_FRACTION = 0.9
+
+
+def is_oom_error(error: BaseException) -> bool:
+    """True for CUDA out-of-memory errors, whichever exception type carries them."""
+    oom_type = getattr(torch.cuda, 'OutOfMemoryError', None)
+    if oom_type is not None and isinstance(error, oom_type):
+        return True
+    return isinstance(error, RuntimeError) and 'out of memory' in str(error).lower()
+
+
+def divisors(n: int) -> List[int]:
+    """All positive divisors of n in ascending order."""
+    small = [d for d in range(1, int(n ** 0.5) + 1) if n % d == 0]
+    return sorted(set(small + [n // d for d in small]))
+
+
+def find_micro_batch(requested_batch_size: int, fits: Callable[[int], bool]) -> Optional[int]:
+    """
+    Find the largest divisor of the requested batch size that fits.
+
+    Args:
+        requested_batch_size: Effective batch size the job asked for
+        fits: Probe returning True if a micro-batch of that size fits
+
+    Returns:
+        Largest fitting divisor, or None if even a batch of 1 does not fit
+    """
+    candidates = divisors(requested_batch_size)
+    probed: Dict[int, bool] = {}
+
+    def probe(batch_size: int) -> bool:
+        if batch_size not in probed:
+            probed[batch_size] = fits(batch_size)
+            logger.info(f"  - micro-batch {batch_size}: {'fits' if probed[batch_size] else 'out of memory'}")
+        return probed[batch_size]
+
+    # Common case first: the request fits as-is
+    if probe(candidates[-1]):
+        return candidates[-1]
+
+    lo, hi = 0, len(candidates) - 1  # candidates[hi] is known not to fit
+    best = None
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if probe(candidates[mid]):
+            best = candidates[mid]
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return best
+
+
+def plan_batching(requested_batch_size: int, fits: Callable[[int], bool]) -> Dict[str, int]:
+    """
+    Choose micro-batch size and gradient accumulation for a requested batch size.
+
+    Args:
+        requested_batch_size: Effective batch size the job asked for
+        fits: Probe returning True if a micro-batch of that size fits
+
+    Returns:
+        Dict with micro_batch_size, gradient_accumulation_steps, effective_batch_size
+
+    Raises:
+        RuntimeError: If not even a micro-batch of 1 fits
+    """
+    logger.info(f"Probing micro-batch sizes for batch_size={requested_batch_size}:")
+    micro_batch = find_micro_batch(requested_batch_size, fits)
+    if micro_batch is None:
+        raise RuntimeError(
+            "CUDA Out of Memory: a micro-batch of 1 does not fit at this max_seq_length; "
+            "reduce max_seq_length or rank"
+        )
+
+    accumulation = requested_batch_size // micro_batch
+    return {
+        'micro_batch_size': micro_batch,
+        'gradient_accumulation_steps': accumulation,
+        'effective_batch_size': micro_batch * accumulation,
+    }
+
+
+class StepMemoryProbe:
+    """
+    Runs one forward/backward pass at a given micro-batch size and reports whether it fit.
+
+    Args:
+        model: Model to probe (PEFT-wrapped, in its training configuration)
+        seq_length: Tokens per example (the job's max_seq_length or block size)
+        memory_limit: Bytes a step may use; defaults to DEFAULT_MEMORY_FRACTION
+            of GPU memory on CUDA and to no limit on CPU
+    """
+
+    def __init__(self, model, seq_length: int, memory_limit: Optional[int] = None):
+        self.model = model
+        self.seq_length = seq_length
+        self.device = next(model.parameters()).device
+        self.on_cuda = self.device.type == 'cuda'
+
+        if memory_limit is None and self.on_cuda:
+            total = torch.cuda.get_device_properties(self.device).total_memory
+            memory_limit = int(total * DEFAULT_MEMORY_FRACTION)
+        self.memory_limit = memory_limit
+
+        # AdamW keeps two fp32 moments per trainable parameter once training starts
+        self.optimizer_bytes = 2 * 4 * sum(p.numel() for p in model.parameters() if p.requires_grad)
+
+    def __call__(self, batch_size: int) -> bool:
+        input_ids = torch.zeros((batch_size, self.seq_length), dtype=torch.long, device=self.device)
+        saved_bytes = 0
+
+        def pack(tensor):
+            nonlocal saved_bytes
+            saved_bytes += tensor.numel() * tensor.element_size()
+            return tensor
+
+        was_training = self.model.training
+        self.model.train()
+        if self.on_cuda:
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats(self.device)
+
+        try:
+            with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+                loss = self.model(input_ids=input_ids, labels=input_ids).loss
+            loss.backward()
+        except Exception as e:
+            if not is_oom_error(e):
+                raise
+            return False
+        finally:
+            self.model.zero_grad(set_to_none=True)
+            self.model.train(was_training)
+            del input_ids
+            if self.on_cuda:
+                torch.cuda.empty_cache()
+
+        if self.memory_limit is None:
+            return True
+
+        if self.on_cuda:
+            peak = torch.cuda.max_memory_allocated(self.device)
+        else:
+            peak = sum(p.numel() * p.element_size() for p in self.model.parameters()) + saved_bytes
+
+        return peak + self.optimizer_bytes <= self.memory_limit
@@ -0,0 +1,125 @@
+"""
+Chat-Template Rendering Benchmark
+
+Compares the original per-example formatting path (one example per call,
+single process, followed by a separate tokenization pass) with the batched,
+multi-process path on a synthetic conversation dataset. Template rendering
+and the full render+tokenize stage are timed separately, since tokenizer
+speed dominates the end-to-end number for some vocabularies.
+
+Usage:
+    python benchmark_formatting.py --tokenizer /workspace/models/<model> --examples 100000
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import time
+import random
+import argparse
+import tempfile
+
+from datasets import Dataset, disable_caching
+from transformers import AutoTokenizer
+
+from train_lora import (
+    CONVERSATION_FEATURES,
+    FORMAT_BATCH_SIZE,
+    format_chat_template,
+    format_chat_template_batch,
+    resolve_format_num_proc,
+    tokenize_dataset,
+)
+
+WORDS = (
+    "the customer asked about their account balance and whether the recent "
+    "transfer had cleared before the weekend so we reviewed the statement "
+    "together and explained each pending item in plain language"
+).split()
+
+
+def synthetic_conversations(count: int, seed: int = 0):
+    """Yield BrightRun-like conversations with varied turn counts and lengths."""
+    rng = random.Random(seed)
+    system_prompt = "You are a helpful financial planning assistant."
+    
+    for _ in range(count):
+        messages = [{"role": "system", "content": system_prompt}]
+        for _ in range(rng.randint(1, 3)):
+            messages.append({"role": "user", "content": " ".join(rng.choices(WORDS, k=rng.randint(10, 80)))})
+            messages.append({"role": "assistant", "content": " ".join(rng.choices(WORDS, k=rng.randint(20, 200)))})
+        yield {"messages": messages}
+
+
+def time_call(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tokenizer', required=True, help="Tokenizer path or model ID with a chat template")
+    parser.add_argument('--examples', type=int, default=100000)
+    parser.add_argument('--max-seq-length', type=int, default=2048)
+    parser.add_argument('--num-proc', type=int, default=None, help="Processes for the batched path")
+    args = parser.parse_args()
+    
+    disable_caching()
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    
+    with tempfile.TemporaryDirectory() as cache_dir:
+        dataset = Dataset.from_generator(
+            synthetic_conversations,
+            features=CONVERSATION_FEATURES,
+            cache_dir=cache_dir,
+            gen_kwargs={"count": args.examples},
+        )
+        print(f"Synthetic dataset: {len(dataset)} conversations")
+        
+        num_proc = args.num_proc or resolve_format_num_proc(len(dataset))
+        
+        def original_render():
+            return dataset.map(lambda x: format_chat_template(x, tokenizer), num_proc=1)
+        
+        def batched_render():
+            return dataset.map(
+                format_chat_template_batch,
+                batched=True,
+                batch_size=FORMAT_BATCH_SIZE,
+                num_proc=num_proc if num_proc > 1 else None,
+                fn_kwargs={"tokenizer": tokenizer},
+                remove_columns=dataset.column_names,
+            )
+        
+        rendered, render_seconds = time_call(original_render)
+        batched_rendered, batched_render_seconds = time_call(batched_render)
+        assert rendered["text"][:100] == batched_rendered["text"][:100], "rendered text differs between paths"
+        
+        def original_tokenize():
+            return rendered.map(
+                lambda x: tokenizer(x["text"], truncation=True, padding=False, max_length=args.max_seq_length),
+                batched=True,
+            )
+        
+        baseline, tokenize_seconds = time_call(original_tokenize)
+        optimized, optimized_seconds = time_call(
+            lambda: tokenize_dataset(dataset, tokenizer, args.max_seq_length, num_proc=num_proc)
+        )
+    
+    assert baseline["input_ids"][:100] == optimized["input_ids"][:100], "token ids differ between paths"
+    baseline_seconds = render_seconds + tokenize_seconds
+    
+    print(f"Processes for batched path: {num_proc}")
+    print(f"Rendering, per-example: {render_seconds:.1f}s ({len(dataset) / render_seconds:.0f} conv/s)")
+    print(f"Rendering, batched:     {batched_render_seconds:.1f}s ({len(dataset) / batched_render_seconds:.0f} conv/s)")
+    print(f"Rendering speedup:      {render_seconds / batched_render_seconds:.2f}x")
+    print(f"Render+tokenize, original: {baseline_seconds:.1f}s")
+    print(f"Render+tokenize, batched:  {optimized_seconds:.1f}s")
+    print(f"End-to-end speedup:        {baseline_seconds / optimized_seconds:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+Checkpoint Persistence to Object Storage and Resume
+
+Trainer checkpoints (adapter weights, optimizer, scheduler, RNG and trainer
+state) are written to the job's temp dir, which is lost if the worker is
+preempted. CheckpointSyncCallback hands every saved checkpoint to a
+background thread that uploads it to S3-compatible storage under the job
+ID, so training never waits on the network. A retried job with the same
+job_id downloads the latest complete checkpoint and resumes from it.
+
+Object layout (prefix checkpoints/<job_id>/):
+- checkpoint-<step>/<files>   files exactly as the Trainer wrote them
+- checkpoint-<step>/COMPLETE  written after every file of that checkpoint
+- latest.json                 {"step": N, "prefix": ".../checkpoint-N/", "best_step": B}
+
+Only checkpoints with a COMPLETE marker are resumed from, and older
+checkpoints are deleted once a newer one is complete, except the best one
+(the Trainer's best_model_checkpoint under load_best_model_at_end). On
+resume the best checkpoint is downloaded next to the latest, and the
+restored trainer_state.json is pointed at its new local path.
+
+Configuration: CHECKPOINT_BUCKET (falls back to NETWORK_VOLUME_ID) with the
+S3_ENDPOINT_URL / S3_ACCESS_KEY_ID / S3_SECRET_ACCESS_KEY credentials the
+handler uses, or CHECKPOINT_LOCAL_DIR to use LocalObjectClient, a
+directory-backed stand-in for S3.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import io
+import json
+import queue
+import shutil
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from transformers import TrainerCallback
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR
+
+logger = logging.getLogger(__name__)
+
+COMPLETE_MARKER = 'COMPLETE'
+LATEST_NAME = 'latest.json'
+TRAINER_STATE_NAME = 'trainer_state.json'
+
+# Completed checkpoints kept remotely (plus the best one); older ones are deleted
+KEEP_REMOTE = 1
+
+
+def checkpoint_step(path: Optional[str]) -> Optional[int]:
+    """Step of a checkpoint-<step> directory path, or None."""
+    if not path:
+        return None
+    name = os.path.basename(os.path.normpath(path))
+    if not name.startswith(f"{PREFIX_CHECKPOINT_DIR}-"):
+        return None
+    try:
+        return int(name.rsplit('-', 1)[1])
+    except ValueError:
+        return None
+
+
+class LocalObjectClient:
+    """
+    The subset of the boto3 S3 client used here, backed by a local directory.
+
+    Buckets are subdirectories of root and keys are relative paths.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, key)
+
+    def upload_file(self, filename: str, bucket: str, key: str) -> None:
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(filename, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    def download_file(self, bucket: str, key: str, filename: str) -> None:
+        shutil.copyfile(self._path(bucket, key), filename)
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes) -> None:
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(Body)
+        os.replace(f"{path}.tmp", path)
+
+    def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        with open(self._path(Bucket, Key), 'rb') as f:
+            return {'Body': io.BytesIO(f.read())}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str, **kwargs) -> Dict[str, Any]:
+        base = os.path.join(self.root, Bucket)
+        contents = []
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                key = os.path.relpath(os.path.join(dirpath, filename), base)
+                if key.startswith(Prefix):
+                    contents.append({'Key': key})
+        return {'Contents': sorted(contents, key=lambda item: item['Key']), 'IsTruncated': False}
+
+    def delete_objects(self, Bucket: str, Delete: Dict[str, Any]) -> None:
+        for item in Delete['Objects']:
+            try:
+                os.remove(self._path(Bucket, item['Key']))
+            except FileNotFoundError:
+                pass
+
+
+class CheckpointStore:
+    """Reads and writes one job's checkpoints in an S3 bucket."""
+
+    def __init__(self, client, bucket: str, job_id: str):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = f"checkpoints/{job_id}/"
+
+    @classmethod
+    def from_env(cls, job_id: str) -> Optional['CheckpointStore']:
+        """
+        Build the store from CHECKPOINT_LOCAL_DIR or the S3 settings.
+
+        Returns:
+            CheckpointStore instance, or None when checkpoint sync is not configured
+        """
+        local_dir = os.environ.get('CHECKPOINT_LOCAL_DIR')
+        if local_dir:
+            return cls(LocalObjectClient(local_dir), os.environ.get('CHECKPOINT_BUCKET', 'checkpoints'), job_id)
+
+        bucket = os.environ.get('CHECKPOINT_BUCKET') or os.environ.get('NETWORK_VOLUME_ID')
+        if not bucket or not os.environ.get('S3_ENDPOINT_URL'):
+            return None
+
+        import boto3
+
+        client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+            aws_access_key_id=os.environ.get('S3_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('S3_SECRET_ACCESS_KEY')
+        )
+        return cls(client, bucket, job_id)
+
+    def _list_keys(self, prefix: str) -> List[str]:
+        keys = []
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            keys.extend(item['Key'] for item in response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                return keys
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def _checkpoint_prefix(self, step: int) -> str:
+        return f"{self.prefix}{PREFIX_CHECKPOINT_DIR}-{step}/"
+
+    def upload(self, local_dir: str, step: int, best_step: Optional[int] = None) -> None:
+        """Upload a checkpoint directory, then mark it complete and point latest.json at it."""
+        prefix = self._checkpoint_prefix(step)
+        for dirpath, _, filenames in os.walk(local_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = prefix + os.path.relpath(path, local_dir).replace(os.sep, '/')
+                self.client.upload_file(path, self.bucket, key)
+
+        self.client.put_object(Bucket=self.bucket, Key=prefix + COMPLETE_MARKER, Body=b'')
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + LATEST_NAME,
+            Body=json.dumps({'step': step, 'prefix': prefix, 'best_step': best_step}).encode('utf-8'),
+        )
+
+    def completed_steps(self) -> List[int]:
+        """Steps of every checkpoint that finished uploading, ascending."""
+        steps = []
+        for key in self._list_keys(self.prefix):
+            parts = key[len(self.prefix):].split('/')
+            if len(parts) == 2 and parts[1] == COMPLETE_MARKER and parts[0].startswith(f"{PREFIX_CHECKPOINT_DIR}-"):
+                steps.append(int(parts[0].rsplit('-', 1)[1]))
+        return sorted(steps)
+
+    def delete_older_than(self, step: int, keep: Optional[int] = None) -> None:
+        """Delete completed checkpoints before `step`, keeping KEEP_REMOTE in total plus `keep`."""
+        for old_step in self.completed_steps()[:-KEEP_REMOTE]:
+            if old_step >= step or old_step == keep:
+                continue
+            # Marker goes first so a half-deleted checkpoint is never resumed from
+            keys = self._list_keys(self._checkpoint_prefix(old_step))
+            keys.sort(key=lambda key: not key.endswith(COMPLETE_MARKER))
+            for start in range(0, len(keys), 1000):
+                self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]]},
+                )
+
+    def delete_all(self) -> None:
+        """Remove every checkpoint for the job."""
+        keys = self._list_keys(self.prefix)
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]]},
+            )
+
+    def _download_step(self, step: int, output_dir: str) -> str:
+        prefix = self._checkpoint_prefix(step)
+        local_dir = os.path.join(output_dir, f"{PREFIX_CHECKPOINT_DIR}-{step}")
+        for key in self._list_keys(prefix):
+            rel_path = key[len(prefix):]
+            if rel_path == COMPLETE_MARKER:
+                continue
+            path = os.path.join(local_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.client.download_file(self.bucket, key, path)
+        return local_dir
+
+    def download_latest(self, output_dir: str) -> Optional[str]:
+        """
+        Download the newest complete checkpoint (and the best one) into output_dir.
+
+        The restored trainer_state.json still names the previous attempt's
+        best_model_checkpoint; it is rewritten to the downloaded copy, or
+        cleared when that checkpoint is gone, so the Trainer neither fails
+        nor silently restores the wrong weights at the end.
+
+        Returns:
+            Local checkpoint directory to resume from, or None if there is none
+        """
+        steps = self.completed_steps()
+        if not steps:
+            return None
+
+        step = steps[-1]
+        local_dir = self._download_step(step, output_dir)
+        logger.info(f"Downloaded checkpoint at step {step} to {local_dir}")
+
+        state_path = os.path.join(local_dir, TRAINER_STATE_NAME)
+        if not os.path.exists(state_path):
+            return local_dir
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        best_step = checkpoint_step(state.get('best_model_checkpoint'))
+        if best_step is None:
+            return local_dir
+        if best_step == step:
+            state['best_model_checkpoint'] = local_dir
+        elif best_step in steps:
+            state['best_model_checkpoint'] = self._download_step(best_step, output_dir)
+            logger.info(f"Downloaded best checkpoint at step {best_step}")
+        else:
+            logger.warning(f"Best checkpoint at step {best_step} was not synced - best-model tracking restarts")
+            state['best_model_checkpoint'] = None
+            state['best_metric'] = None
+
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        return local_dir
+
+
+class CheckpointSyncCallback(TrainerCallback):
+    """
+    Uploads each saved checkpoint on a background thread.
+
+    Each checkpoint is hard-linked into a private snapshot directory when it
+    is saved, so the Trainer's checkpoint rotation can delete the original
+    while the upload is still running. If several checkpoints queue up
+    behind a slow upload, only the newest is uploaded, together with the
+    best checkpoint if that is among them. on_synced, if given, is called
+    with the step of every checkpoint that finished uploading.
+    """
+
+    def __init__(
+        self,
+        store: CheckpointStore,
+        snapshot_dir: str,
+        on_synced: Optional[Callable[[int], None]] = None
+    ):
+        self.store = store
+        self.snapshot_dir = snapshot_dir
+        self.on_synced = on_synced
+        self.pending: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.uploaded_step: Optional[int] = None
+        self.errors: List[str] = []
+        self.thread = threading.Thread(target=self._run, name='checkpoint-sync', daemon=True)
+        self.thread.start()
+
+    def on_save(self, args, state, control, **kwargs):
+        """Called after the Trainer writes a checkpoint."""
+        if not state.is_world_process_zero:
+            return
+
+        step = state.global_step
+        source = os.path.join(args.output_dir, f"{PREFIX_CHECKPOINT_DIR}-{step}")
+        if not os.path.isdir(source):
+            return
+
+        snapshot = os.path.join(self.snapshot_dir, f"{PREFIX_CHECKPOINT_DIR}-{step}")
+        shutil.copytree(source, snapshot, copy_function=os.link, dirs_exist_ok=True)
+        # The Trainer has already updated best_model_checkpoint for this save
+        self.pending.put((step, snapshot, checkpoint_step(state.best_model_checkpoint)))
+
+    def _run(self) -> None:
+        while True:
+            items = [self.pending.get()]
+            while items[-1] is not None and not self.pending.empty():
+                items.append(self.pending.get())
+            stop = items[-1] is None
+            if stop:
+                items.pop()
+
+            if items:
+                # Skip ahead to the newest queued checkpoint, but keep the best one it refers to
+                newest = items[-1]
+                for step, snapshot, _ in items[:-1]:
+                    if step == newest[2]:
+                        self._sync(step, snapshot, newest[2])
+                    else:
+                        shutil.rmtree(snapshot, ignore_errors=True)
+                self._sync(*newest)
+
+            if stop:
+                return
+
+    def _sync(self, step: int, snapshot: str, best_step: Optional[int]) -> None:
+        try:
+            self.store.upload(snapshot, step, best_step)
+            self.store.delete_older_than(step, keep=best_step)
+            self.uploaded_step = step
+            logger.info(f"Checkpoint at step {step} synced to {self.store.bucket}/{self.store.prefix}")
+            if self.on_synced:
+                self.on_synced(step)
+        except Exception as e:
+            self.errors.append(str(e))
+            logger.warning(f"Checkpoint sync failed at step {step}: {e}")
+        finally:
+            shutil.rmtree(snapshot, ignore_errors=True)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Finish pending uploads and stop the sync thread."""
+        self.pending.put(None)
+        self.thread.join(timeout)
@@ -0,0 +1,371 @@
+"""
+Content-Addressed Dataset Cache for LoRA Training Jobs
+
+Keeps downloaded datasets on the worker volume so retries, re-runs and
+hyperparameter sweeps over the same Supabase object skip the download.
+
+Layout under the cache root:
+- blobs/<sha256>   dataset bytes, named by content hash
+- staging/         in-progress downloads (same filesystem, so puts are renames)
+- index.json       object key -> content hash, and per-blob size / mtime / last access
+
+The index lock is only held for index reads and writes. Blobs are checked
+by size and mtime under it; a full SHA-256 (for entries that do not match)
+runs outside it, so one large verify never stalls other workers.
+
+Blobs handed out by lookup() and put() are pinned with a shared flock until
+release(), and eviction skips pinned blobs, so a job parsing a dataset never
+has it removed by another worker on the same volume.
+
+Object keys combine the storage object path with its ETag, so a re-uploaded
+dataset at the same path is treated as new content.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import tempfile
+import contextlib
+from typing import Dict, Any, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_GB = 20.0
+
+# Supabase Storage URL prefixes stripped to get the bucket/object path
+_STORAGE_PREFIXES = (
+    '/storage/v1/object/sign/',
+    '/storage/v1/object/public/',
+    '/storage/v1/object/authenticated/',
+    '/storage/v1/object/',
+)
+
+
+def file_sha256(path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 hex digest of a file.
+    
+    Args:
+        path: File to hash
+        chunk_size: Read size in bytes
+        
+    Returns:
+        Hex digest string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def storage_object_path(url: str) -> str:
+    """
+    Extract the bucket/object path from a (signed) Supabase Storage URL.
+    
+    The signing token in the query string changes on every request, so it
+    is never part of the cache key.
+    
+    Args:
+        url: Storage URL
+        
+    Returns:
+        Object path such as "training-files/user/dataset.jsonl"
+    """
+    parsed = urlparse(url)
+    path = parsed.path
+    for prefix in _STORAGE_PREFIXES:
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return f"{parsed.netloc}{path}"
+
+
+class DatasetCache:
+    """Persistent, size-capped, LRU-evicted dataset cache keyed by content hash."""
+    
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.staging_dir = os.path.join(root, 'staging')
+        self.index_path = os.path.join(root, 'index.json')
+        self.lock_path = os.path.join(root, '.lock')
+        
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+        # Keyed staging files this process holds, path -> locked file
+        self._staging_locks: Dict[str, Any] = {}
+        # Blobs this process has pinned, path -> file holding a shared lock
+        self._pins: Dict[str, Any] = {}
+    
+    @classmethod
+    def from_env(cls) -> Optional['DatasetCache']:
+        """
+        Build the cache from DATASET_CACHE_DIR / DATASET_CACHE_MAX_GB.
+        
+        Returns:
+            DatasetCache instance, or None when caching is not configured
+        """
+        root = os.environ.get('DATASET_CACHE_DIR')
+        if not root:
+            return None
+        
+        max_gb = float(os.environ.get('DATASET_CACHE_MAX_GB', DEFAULT_MAX_GB))
+        try:
+            return cls(root, int(max_gb * 1024 ** 3))
+        except OSError as e:
+            logger.warning(f"Dataset cache disabled - cannot use {root}: {e}")
+            return None
+    
+    @contextlib.contextmanager
+    def _locked_index(self) -> Iterator[Dict[str, Any]]:
+        """Hold an exclusive lock on the index and write it back on exit."""
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                index = {"objects": {}, "blobs": {}}
+                if os.path.exists(self.index_path):
+                    try:
+                        with open(self.index_path, 'r', encoding='utf-8') as f:
+                            index = json.load(f)
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Dataset cache index unreadable, starting fresh: {e}")
+                
+                yield index
+                
+                fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.index-')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(index, f)
+                os.replace(tmp_path, self.index_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def blob_path(self, content_hash: str) -> str:
+        """Path of the blob for a content hash."""
+        return os.path.join(self.blob_dir, content_hash)
+    
+    def _pin(self, content_hash: str) -> str:
+        """Take a shared lock on a blob so eviction leaves it alone (index lock held)."""
+        path = self.blob_path(content_hash)
+        if path not in self._pins:
+            pin_file = open(path, 'rb')
+            fcntl.flock(pin_file, fcntl.LOCK_SH)
+            self._pins[path] = pin_file
+        return path
+    
+    def release(self, path: str) -> None:
+        """Unpin a blob returned by lookup() or put() once it has been read."""
+        pin_file = self._pins.pop(path, None)
+        if pin_file is not None:
+            fcntl.flock(pin_file, fcntl.LOCK_UN)
+            pin_file.close()
+    
+    def _is_pinned(self, content_hash: str) -> bool:
+        """Whether any worker holds a pin on a blob."""
+        try:
+            probe = open(self.blob_path(content_hash), 'rb')
+        except FileNotFoundError:
+            return False
+        with probe:
+            try:
+                fcntl.flock(probe, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(probe, fcntl.LOCK_UN)
+            return False
+    
+    def staging_path(self, object_key: Optional[str] = None) -> str:
+        """
+        Path inside the staging directory for an in-progress download.
+        
+        Keyed downloads get a stable path so a retried job can resume the
+        partial file left by a previous attempt. The path is claimed with an
+        exclusive lock until put() or release_staging(); while another
+        worker holds it, a unique staging file is returned instead.
+        
+        Args:
+            object_key: Key from object_key(), if known
+            
+        Returns:
+            Staging file path
+        """
+        if object_key:
+            name = hashlib.sha256(object_key.encode('utf-8')).hexdigest()[:32]
+            path = os.path.join(self.staging_dir, f"{name}.part")
+            lock_path = f"{path}.lock"
+            lock_file = open(lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # The owner unlinks the lock file on release; a lock taken on
+                # an unlinked file guards nothing
+                if os.fstat(lock_file.fileno()).st_ino != os.stat(lock_path).st_ino:
+                    raise OSError("staging lock file was replaced")
+            except OSError:
+                lock_file.close()
+                logger.info("Dataset cache: another worker is downloading this object - staging separately")
+            else:
+                self._staging_locks[path] = lock_file
+                return path
+        
+        fd, path = tempfile.mkstemp(dir=self.staging_dir, prefix='dataset-')
+        os.close(fd)
+        return path
+    
+    def release_staging(self, path: str) -> None:
+        """Give up the claim on a keyed staging file (its partial data is kept for a retry)."""
+        lock_file = self._staging_locks.pop(path, None)
+        if lock_file is not None:
+            # Removed while still locked, so no other worker can hold a lock on it
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f"{path}.lock")
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+    
+    def object_key(self, dataset_url: str) -> Optional[str]:
+        """
+        Build the cache key for a dataset URL from its object path and ETag.
+        
+        Args:
+            dataset_url: Signed dataset URL
+            
+        Returns:
+            Key string, or None if the server did not return an ETag
+        """
+        try:
+            response = requests.head(dataset_url, timeout=30, allow_redirects=True)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning(f"Dataset cache: HEAD request failed, cache bypassed: {e}")
+            return None
+        
+        etag = response.headers.get('ETag', '').strip('"')
+        if not etag:
+            logger.info("Dataset cache: no ETag on dataset object, cache bypassed")
+            return None
+        
+        return f"{storage_object_path(dataset_url)}@{etag}"
+    
+    def _stat_matches(self, content_hash: str, entry: Dict[str, Any]) -> Optional[bool]:
+        """
+        Cheap blob check against the index entry.
+        
+        Returns:
+            True if size and mtime match, False if the blob is missing or the
+            wrong size, None if only a full hash can tell
+        """
+        try:
+            stat = os.stat(self.blob_path(content_hash))
+        except FileNotFoundError:
+            return False
+        if stat.st_size != entry.get('size'):
+            return False
+        return True if stat.st_mtime_ns == entry.get('mtime_ns') else None
+    
+    def lookup(self, object_key: str) -> Optional[str]:
+        """
+        Return the verified cached file for an object key.
+        
+        Corrupt or missing entries are dropped from the index. A returned
+        blob is pinned until release().
+        
+        Args:
+            object_key: Key from object_key()
+            
+        Returns:
+            Path to the cached dataset, or None on a miss
+        """
+        with self._locked_index() as index:
+            content_hash = index["objects"].get(object_key)
+            if content_hash is None:
+                return None
+            entry = index["blobs"].get(content_hash)
+            valid = self._stat_matches(content_hash, entry) if entry else False
+            if valid:
+                entry['last_access'] = time.time()
+                return self._pin(content_hash)
+        
+        # Size and mtime are not conclusive: hash the blob without holding the lock
+        if valid is None:
+            valid = file_sha256(self.blob_path(content_hash)) == content_hash
+        
+        with self._locked_index() as index:
+            if index["objects"].get(object_key) != content_hash or content_hash not in index["blobs"]:
+                return None
+            entry = index["blobs"][content_hash]
+            if not valid:
+                logger.warning(f"Dataset cache: entry {content_hash[:12]} failed verification, discarding")
+                index["objects"].pop(object_key, None)
+                index["blobs"].pop(content_hash, None)
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.blob_path(content_hash))
+                return None
+            
+            entry['mtime_ns'] = os.stat(self.blob_path(content_hash)).st_mtime_ns
+            entry['last_access'] = time.time()
+            return self._pin(content_hash)
+    
+    def put(self, source_path: str, object_key: Optional[str]) -> str:
+        """
+        Move a downloaded file into the cache.
+        
+        Args:
+            source_path: Downloaded file (ideally from staging_path())
+            object_key: Key to index the content under, if known
+            
+        Returns:
+            Path to the cached blob, pinned until release()
+        """
+        content_hash = file_sha256(source_path)
+        size = os.path.getsize(source_path)
+        target = self.blob_path(content_hash)
+        
+        with self._locked_index() as index:
+            if os.path.exists(target):
+                os.remove(source_path)
+            else:
+                os.replace(source_path, target)
+            self.release_staging(source_path)
+            
+            index["blobs"][content_hash] = {
+                "size": size,
+                "mtime_ns": os.stat(target).st_mtime_ns,
+                "last_access": time.time(),
+            }
+            if object_key:
+                index["objects"][object_key] = content_hash
+            
+            self._pin(content_hash)
+            self._evict(index)
+        
+        logger.info(f"Dataset cached as {content_hash[:12]} ({size / 1024 / 1024:.1f}MB)")
+        return target
+    
+    def _evict(self, index: Dict[str, Any]) -> None:
+        """Remove least recently used unpinned blobs until the cache fits its cap."""
+        blobs = index["blobs"]
+        total = sum(entry.get('size', 0) for entry in blobs.values())
+        
+        for content_hash, entry in sorted(blobs.items(), key=lambda item: item[1].get('last_access', 0)):
+            if total <= self.max_bytes:
+                break
+            if self._is_pinned(content_hash):
+                continue
+            
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.blob_path(content_hash))
+            total -= entry.get('size', 0)
+            del blobs[content_hash]
+            index["objects"] = {k: v for k, v in index["objects"].items() if v != content_hash}
+            logger.info(f"Dataset cache: evicted {content_hash[:12]} ({entry.get('size', 0) / 1024 / 1024:.1f}MB)")
+        
+        if total > self.max_bytes:
+            logger.info(f"Dataset cache: {total / 1024 ** 3:.2f}GB in use, over the cap while blobs are pinned")
@@ -0,0 +1,417 @@
+"""
+JSONL Dataset Parsing for LoRA Training Jobs
+
+Converts OpenAI Chat and BrightRun JSONL rows into OpenAI-style message lists.
+Kept free of heavy dependencies (torch, transformers, datasets) so worker
+processes in the parallel ingest pool start quickly.
+
+Gzip and zstd inputs are detected from their magic bytes and decompressed
+as a stream while parsing; the uncompressed file never exists on disk.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import io
+import os
+import gzip
+import json
+import logging
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, TextIO, Tuple, Union
+
+# Use a faster JSON decoder when one is installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Files smaller than this are parsed on a single core
+PARALLEL_PARSE_MIN_BYTES = 32 * 1024 * 1024
+
+# Number of chunks handed to each worker process
+CHUNKS_PER_WORKER = 4
+
+# Lines per task when a compressed file is fed to the pool from one reader
+LINES_PER_BATCH = 20000
+
+# Rough expansion ratio used when sizing compressed inputs
+COMPRESSED_SIZE_FACTOR = 5
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def detect_compression(dataset_path: str) -> Optional[str]:
+    """
+    Detect compressed input from its magic bytes.
+    
+    Args:
+        dataset_path: Path to the dataset file
+        
+    Returns:
+        'gzip', 'zstd', or None for plain text
+    """
+    with open(dataset_path, 'rb') as f:
+        head = f.read(4)
+    
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+
+def open_dataset_text(dataset_path: str) -> TextIO:
+    """
+    Open a dataset file as UTF-8 text, decompressing gzip/zstd on the fly.
+    
+    Args:
+        dataset_path: Path to a plain, gzip or zstd JSONL file
+        
+    Returns:
+        Text stream yielding lines
+    """
+    compression = detect_compression(dataset_path)
+    
+    if compression == 'gzip':
+        return gzip.open(dataset_path, 'rt', encoding='utf-8')
+    
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Dataset is zstd-compressed but the zstandard package is not installed")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(dataset_path, 'rb'), read_across_frames=True, closefd=True
+        )
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    
+    return open(dataset_path, 'r', encoding='utf-8')
+
+
+def convert_record(data: Dict[str, Any]) -> Tuple[str, Optional[List[Dict[str, str]]], Optional[str]]:
+    """
+    Convert one parsed JSONL record into an OpenAI-style messages list.
+    
+    Args:
+        data: Parsed JSON object from a single dataset line
+        
+    Returns:
+        Tuple of (outcome, messages, warning) where outcome is one of
+        'meta', 'openai', 'brightrun' or 'skipped'
+    """
+    # Skip metadata line (BrightRun format has _meta header)
+    if '_meta' in data:
+        return 'meta', None, None
+    
+    # OpenAI Chat format (standard)
+    if 'messages' in data:
+        if isinstance(data['messages'], list) and len(data['messages']) > 0:
+            messages = [
+                {"role": msg.get('role', 'user'), "content": msg.get('content', '')}
+                for msg in data['messages']
+                if isinstance(msg, dict)
+            ]
+            return 'openai', messages, None
+        return 'skipped', None, "Empty 'messages' array"
+    
+    # BrightRun format - convert to OpenAI format
+    if 'target_response' in data and 'current_user_input' in data:
+        messages = []
+        
+        # Add system prompt if present
+        system_prompt = data.get('system_prompt')
+        if system_prompt and isinstance(system_prompt, str) and system_prompt.strip():
+            messages.append({
+                "role": "system", 
+                "content": system_prompt.strip()
+            })
+        
+        # Add conversation history (previous turns)
+        conversation_history = data.get('conversation_history', [])
+        if isinstance(conversation_history, list):
+            for msg in conversation_history:
+                if isinstance(msg, dict) and 'content' in msg:
+                    role = msg.get('role', 'user')
+                    content = msg.get('content', '')
+                    if content:
+                        messages.append({
+                            "role": role,
+                            "content": content
+                        })
+        
+        # Add current user input
+        user_input = data.get('current_user_input', '')
+        if user_input:
+            messages.append({
+                "role": "user",
+                "content": user_input
+            })
+        
+        # Add target response (training target)
+        target = data.get('target_response', '')
+        if target:
+            messages.append({
+                "role": "assistant", 
+                "content": target
+            })
+        
+        # Only add if we have at least user+assistant pair
+        if len([m for m in messages if m['role'] in ['user', 'assistant']]) >= 2:
+            return 'brightrun', messages, None
+        return 'skipped', None, "Insufficient messages after conversion"
+    
+    # Unknown format
+    return 'skipped', None, "Unknown format"
+
+
+def _parse_line(line: str) -> Tuple[str, Optional[List[Dict[str, str]]], Optional[str]]:
+    """Decode and convert a single stripped, non-empty line."""
+    try:
+        data = _json_loads(line)
+    except ValueError as e:
+        return 'invalid', None, f"Invalid JSON - {e}"
+    
+    if not isinstance(data, dict):
+        return 'skipped', None, "Unknown format"
+    
+    return convert_record(data)
+
+
+def _record_outcome(
+    outcome: str,
+    line_num: int,
+    warning: Optional[str],
+    stats: Dict[str, int]
+) -> None:
+    """Log the outcome of one line and update the counters."""
+    if outcome == 'meta':
+        logger.info(f"Line {line_num}: Skipping metadata header")
+    elif outcome in ('skipped', 'invalid'):
+        logger.warning(f"Line {line_num}: {warning}")
+        stats['skipped'] += 1
+    elif outcome == 'openai':
+        stats['openai_loaded'] += 1
+    else:
+        stats['brightrun_converted'] += 1
+
+
+def iter_conversations(dataset_path: str, stats: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream conversations from a JSONL file one line at a time.
+    
+    Counters in ``stats`` are updated in place so the caller can log the
+    summary once the generator has been exhausted.
+    
+    Args:
+        dataset_path: Path to JSONL file
+        stats: Counter dict with openai_loaded, brightrun_converted and skipped keys
+        
+    Yields:
+        Dictionaries of the form {"messages": [...]}
+    """
+    with open_dataset_text(dataset_path) as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            
+            outcome, messages, warning = _parse_line(line)
+            _record_outcome(outcome, line_num, warning, stats)
+            
+            if messages is not None:
+                yield {"messages": messages}
+
+
+def chunk_offsets(dataset_path: str, num_chunks: int) -> List[Tuple[int, int]]:
+    """
+    Split a file into byte ranges that start and end on line boundaries.
+    
+    Args:
+        dataset_path: Path to JSONL file
+        num_chunks: Desired number of chunks
+        
+    Returns:
+        List of (start, end) byte offsets covering the whole file in order
+    """
+    file_size = os.path.getsize(dataset_path)
+    if file_size == 0:
+        return []
+    
+    chunk_size = max(1, file_size // max(1, num_chunks))
+    offsets = []
+    
+    with open(dataset_path, 'rb') as f:
+        start = 0
+        while start < file_size:
+            target = start + chunk_size
+            if target >= file_size:
+                end = file_size
+            else:
+                f.seek(target)
+                f.readline()
+                end = min(f.tell(), file_size)
+            offsets.append((start, end))
+            start = end
+    
+    return offsets
+
+
+def parse_lines(lines: List[Union[bytes, str]]) -> Dict[str, Any]:
+    """
+    Parse and convert a list of raw JSONL lines.
+    
+    Runs inside a worker process. Line numbers in the returned events are
+    relative to the list; the parent adds the line offset of earlier tasks.
+    
+    Args:
+        lines: Raw lines (bytes or str)
+        
+    Returns:
+        Dictionary with conversations, events (local_line_num, outcome, warning)
+        and line_count
+    """
+    conversations = []
+    events = []
+    
+    for local_num, raw in enumerate(lines, 1):
+        line = (raw.decode('utf-8') if isinstance(raw, bytes) else raw).strip()
+        if not line:
+            continue
+        
+        outcome, messages, warning = _parse_line(line)
+        events.append((local_num, outcome, warning))
+        
+        if messages is not None:
+            conversations.append({"messages": messages})
+    
+    return {
+        "conversations": conversations,
+        "events": events,
+        "line_count": len(lines),
+    }
+
+
+def parse_chunk(dataset_path: str, start: int, end: int) -> Dict[str, Any]:
+    """
+    Parse and convert the lines in one byte range of a plain JSONL file.
+    
+    Args:
+        dataset_path: Path to JSONL file
+        start: First byte of the chunk
+        end: Byte after the last byte of the chunk
+        
+    Returns:
+        Result of parse_lines for the chunk
+    """
+    with open(dataset_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    
+    return parse_lines(data.splitlines())
+
+
+def _line_batches(dataset_path: str) -> Iterator[List[str]]:
+    """Read a (possibly compressed) file sequentially in batches of lines."""
+    with open_dataset_text(dataset_path) as f:
+        while True:
+            batch = list(itertools.islice(f, LINES_PER_BATCH))
+            if not batch:
+                return
+            yield batch
+
+
+def iter_conversations_parallel(
+    dataset_path: str,
+    stats: Dict[str, int],
+    num_workers: int
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parse a JSONL file in a process pool and yield conversations in file order.
+    
+    Plain files are split into line-aligned byte chunks that workers read
+    themselves. Compressed files cannot be split, so one reader decompresses
+    the stream and hands batches of lines to the pool. At most two tasks per
+    worker are in flight at once so memory stays bounded. Per-line warnings
+    and counters match iter_conversations.
+    
+    Args:
+        dataset_path: Path to JSONL file
+        stats: Counter dict updated in place
+        num_workers: Number of worker processes
+        
+    Yields:
+        Dictionaries of the form {"messages": [...]}
+    """
+    compression = detect_compression(dataset_path)
+    if compression:
+        tasks = ((parse_lines, batch) for batch in _line_batches(dataset_path))
+        logger.info(f"Parsing {compression}-compressed dataset with {num_workers} worker processes")
+    else:
+        offsets = chunk_offsets(dataset_path, num_workers * CHUNKS_PER_WORKER)
+        tasks = ((parse_chunk, dataset_path, start, end) for start, end in offsets)
+        logger.info(f"Parsing {len(offsets)} chunks with {num_workers} worker processes")
+    
+    # forkserver avoids forking a parent that may already hold CUDA or loader threads
+    context = multiprocessing.get_context('forkserver')
+    line_offset = 0
+    
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as executor:
+        pending = deque()
+        
+        def submit_next() -> None:
+            task = next(tasks, None)
+            if task is not None:
+                pending.append(executor.submit(*task))
+        
+        for _ in range(num_workers * 2):
+            submit_next()
+        
+        while pending:
+            result = pending.popleft().result()
+            submit_next()
+            
+            for local_num, outcome, warning in result["events"]:
+                _record_outcome(outcome, line_offset + local_num, warning, stats)
+            line_offset += result["line_count"]
+            
+            yield from result["conversations"]
+
+
+def _estimated_text_size(dataset_path: str) -> int:
+    """File size, scaled up for compressed inputs."""
+    size = os.path.getsize(dataset_path)
+    return size * COMPRESSED_SIZE_FACTOR if detect_compression(dataset_path) else size
+
+
+def resolve_parse_workers(dataset_path: str, num_workers: Optional[int] = None) -> int:
+    """
+    Decide how many processes to use for parsing a dataset file.
+    
+    Args:
+        dataset_path: Path to JSONL file
+        num_workers: Explicit worker count, or None to pick automatically
+        
+    Returns:
+        Worker count; 1 means parse sequentially
+    """
+    if num_workers is None:
+        env_workers = int(os.environ.get('DATASET_PARSE_WORKERS', 0))
+        if env_workers > 0:
+            num_workers = env_workers
+        elif _estimated_text_size(dataset_path) >= PARALLEL_PARSE_MIN_BYTES:
+            num_workers = os.cpu_count() or 1
+        else:
+            num_workers = 1
+    
+    return max(1, num_workers)
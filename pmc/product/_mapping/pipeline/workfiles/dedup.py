@@ -0,0 +1,322 @@
+"""
+Exact and Near-Duplicate Removal for Training Conversations
+
+BrightRun exports often contain repeated or regenerated conversations that
+share the same system prompt and user input. This stage removes them
+before formatting so no GPU time is spent on repeats.
+
+- Exact duplicates: 64-bit hash of the normalized messages (roles kept,
+  content lower-cased with whitespace collapsed).
+- Near duplicates: MinHash signatures over hashed word 5-gram shingles, bucketed
+  with LSH. Candidate pairs are confirmed by estimated Jaccard similarity
+  against the threshold before a row is removed. The first occurrence
+  always wins.
+
+Exports that share long system prompts put many rows in the same LSH
+buckets. To keep verification linear, a bucket stores at most
+MAX_BUCKET_ROWS rows (the earliest kept ones), and each row is compared
+with at most MAX_CANDIDATES of them. Candidates that share the most bands
+are compared first, and the comparison stops at the first match.
+
+All hashes are content-derived (crc32 / blake2b, never the salted built-in
+hash()), so a retried job removes exactly the same rows.
+
+Memory stays bounded on millions of rows: exact-match digests and LSH
+buckets live in on-disk SQLite tables, signatures in a memory-mapped file,
+and rows are processed in batches.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import zlib
+import sqlite3
+import hashlib
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import numpy as np
+from datasets import Dataset
+
+logger = logging.getLogger(__name__)
+
+DEDUP_MODES = ('none', 'exact', 'near')
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+NUM_BANDS = 16
+DEFAULT_THRESHOLD = 0.85
+
+# Verification bounds for rows that share buckets with many others
+MAX_BUCKET_ROWS = 64
+MAX_CANDIDATES = 128
+
+# Bound on host parameters per SQLite statement
+_SQL_CHUNK = 500
+
+_SHIFT = np.uint64(32)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHINGLE_MULTIPLIER = np.uint64(1000003)
+
+
+def normalize_messages(messages: List[Dict[str, str]]) -> str:
+    """Canonical text for a conversation: role-tagged, lower-cased, whitespace-collapsed."""
+    return '\n'.join(
+        f"{m.get('role', '')}: {' '.join((m.get('content') or '').lower().split())}"
+        for m in messages
+    )
+
+
+def exact_hash(text: str) -> int:
+    """Signed 64-bit content hash of normalized text (fits SQLite INTEGER)."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+class MinHasher:
+    """
+    MinHash signatures using multiply-shift hashing over word shingle hashes.
+    
+    Words are hashed with crc32, so signatures are the same in every
+    process and on every run.
+    """
+    
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+        self.b = rng.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+    
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Compute the MinHash signature of a text's word shingles.
+        
+        Words are hashed once and combined into shingle hashes with a
+        vectorized rolling hash, so no shingle strings are built.
+        
+        Args:
+            text: Normalized conversation text
+            
+        Returns:
+            uint32 array of length num_perm
+        """
+        words = text.split() or ['']
+        word_hashes = np.fromiter(
+            (zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.uint64, count=len(words)
+        )
+        
+        width = min(SHINGLE_SIZE, len(words))
+        shingles = word_hashes[:len(words) - width + 1].copy()
+        for j in range(1, width):
+            shingles = (shingles * _SHINGLE_MULTIPLIER + word_hashes[j:len(words) - width + 1 + j]) & _MAX_HASH
+        
+        # (a * x + b) mod 2^64, keeping the high 32 bits
+        permuted = (np.outer(self.a, shingles) + self.b[:, None]) >> _SHIFT
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+def _band_keys(signature: np.ndarray, bands: int) -> List[int]:
+    """Signed 64-bit key per LSH band (fits SQLite INTEGER)."""
+    data = signature.tobytes()
+    width = len(data) // bands
+    return [
+        int.from_bytes(hashlib.blake2b(data[i * width:(i + 1) * width], digest_size=8).digest(), 'little', signed=True)
+        for i in range(bands)
+    ]
+
+
+def _connect(work_dir: str) -> sqlite3.Connection:
+    """Scratch SQLite database for one deduplication run."""
+    db = sqlite3.connect(os.path.join(work_dir, 'dedup_lsh.sqlite'))
+    db.execute('PRAGMA journal_mode=OFF')
+    db.execute('PRAGMA synchronous=OFF')
+    db.execute('PRAGMA cache_size=-131072')
+    return db
+
+
+class _ExactIndex:
+    """On-disk set of exact-match digests of kept rows."""
+    
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+        self.db.execute('CREATE TABLE digests (digest INTEGER PRIMARY KEY) WITHOUT ROWID')
+    
+    def seen(self, digests: List[int]) -> Set[int]:
+        """Digests from the list that are already recorded."""
+        found = set()
+        for start in range(0, len(digests), _SQL_CHUNK):
+            chunk = digests[start:start + _SQL_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(
+                digest for (digest,) in
+                self.db.execute(f'SELECT digest FROM digests WHERE digest IN ({placeholders})', chunk)
+            )
+        return found
+    
+    def add(self, digests: List[int]) -> None:
+        self.db.executemany('INSERT INTO digests VALUES (?)', ((digest,) for digest in digests))
+        self.db.commit()
+
+
+class _LSHIndex:
+    """
+    On-disk LSH bucket table plus memory-mapped signatures of kept rows.
+    
+    A bucket holds at most MAX_BUCKET_ROWS rows; the caller decides which
+    rows are added to which buckets.
+    """
+    
+    def __init__(self, db: sqlite3.Connection, work_dir: str, capacity: int, num_perm: int, bands: int):
+        self.bands = bands
+        self.db = db
+        self.db.execute('CREATE TABLE buckets (band INTEGER, key INTEGER, row INTEGER, PRIMARY KEY (band, key, row)) WITHOUT ROWID')
+        self.db.execute('CREATE TEMP TABLE probe (band INTEGER, key INTEGER, PRIMARY KEY (band, key))')
+        self.signatures = np.memmap(
+            os.path.join(work_dir, 'dedup_signatures.u32'),
+            dtype=np.uint32, mode='w+', shape=(max(1, capacity), num_perm)
+        )
+    
+    def members(self, batch_keys: List[List[int]]) -> Dict[Tuple[int, int], List[int]]:
+        """Stored rows of every bucket a batch touches, oldest first."""
+        self.db.execute('DELETE FROM probe')
+        self.db.executemany(
+            'INSERT OR IGNORE INTO probe VALUES (?, ?)',
+            ((band, key) for keys in batch_keys for band, key in enumerate(keys))
+        )
+        members: Dict[Tuple[int, int], List[int]] = {}
+        for band, key, row in self.db.execute(
+            'SELECT b.band, b.key, b.row FROM probe p JOIN buckets b ON b.band = p.band AND b.key = p.key '
+            'ORDER BY b.band, b.key, b.row'
+        ):
+            members.setdefault((band, key), []).append(row)
+        return members
+    
+    def add(self, rows: List[Tuple[int, np.ndarray, List[Tuple[int, int]]]]) -> None:
+        """Record a batch of kept rows as (row, signature, buckets to join)."""
+        for row, signature, _ in rows:
+            self.signatures[row] = signature
+        self.db.executemany(
+            'INSERT INTO buckets VALUES (?, ?, ?)',
+            ((band, key, row) for row, _, buckets in rows for band, key in buckets)
+        )
+        self.db.commit()
+    
+    def similarity(self, row: int, signature: np.ndarray, pending: Optional[np.ndarray] = None) -> float:
+        """Estimated Jaccard similarity with a kept row (pending = not yet written)."""
+        stored = pending if pending is not None else self.signatures[row]
+        return float(np.mean(stored == signature))
+    
+    def close(self) -> None:
+        del self.signatures
+
+
+def deduplicate(
+    dataset: Dataset,
+    work_dir: str,
+    mode: str = 'near',
+    lengths: Optional[List[int]] = None,
+    threshold: float = DEFAULT_THRESHOLD,
+    num_perm: int = NUM_PERM,
+    bands: int = NUM_BANDS,
+    batch_size: int = 1000,
+    max_bucket_rows: int = MAX_BUCKET_ROWS,
+    max_candidates: int = MAX_CANDIDATES
+) -> Tuple[Dataset, Dict[str, Any], List[int]]:
+    """
+    Remove exact (and optionally near) duplicate conversations.
+    
+    Args:
+        dataset: Dataset with a "messages" column
+        work_dir: Scratch directory for the on-disk LSH index
+        mode: 'none', 'exact' or 'near' (exact + near)
+        lengths: Optional token length per row, used to report tokens saved
+        threshold: Estimated Jaccard similarity at or above which rows are near duplicates
+        num_perm: MinHash permutations
+        bands: LSH bands (num_perm must be divisible by bands)
+        batch_size: Rows processed per batch
+        max_bucket_rows: Most kept rows stored per LSH bucket
+        max_candidates: Most kept rows a row is compared with
+        
+    Returns:
+        Tuple of (deduplicated dataset, stats dict, kept row indices)
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"dedup must be one of {', '.join(DEDUP_MODES)}")
+    
+    stats = {'mode': mode, 'exact_removed': 0, 'near_removed': 0, 'kept': len(dataset), 'tokens_saved': 0}
+    if mode == 'none' or len(dataset) == 0:
+        return dataset, stats, list(range(len(dataset)))
+    
+    db = _connect(work_dir)
+    exact_index = _ExactIndex(db)
+    hasher = MinHasher(num_perm) if mode == 'near' else None
+    index = _LSHIndex(db, work_dir, len(dataset), num_perm, bands) if mode == 'near' else None
+    kept: List[int] = []
+    
+    try:
+        row = 0
+        for batch in dataset.iter(batch_size=batch_size):
+            texts = [normalize_messages(messages) for messages in batch["messages"]]
+            digests = [exact_hash(text) for text in texts]
+            
+            seen = exact_index.seen(digests)
+            unique = []
+            for offset, (text, digest) in enumerate(zip(texts, digests)):
+                if digest in seen:
+                    stats['exact_removed'] += 1
+                else:
+                    seen.add(digest)
+                    unique.append((row + offset, text, digest))
+            exact_index.add([digest for _, _, digest in unique])
+            
+            if index is None:
+                kept.extend(r for r, _, _ in unique)
+            else:
+                signatures = [hasher.signature(text) for _, text, _ in unique]
+                keys = [_band_keys(sig, bands) for sig in signatures]
+                # Grows with rows kept earlier in this batch, which are not in the table yet
+                members = index.members(keys)
+                batch_signatures: Dict[int, np.ndarray] = {}
+                added = []
+                
+                for slot, (r, _, _) in enumerate(unique):
+                    shared = Counter()
+                    for band, key in enumerate(keys[slot]):
+                        shared.update(members.get((band, key), ()))
+                    
+                    # Most shared bands first; ties go to the earliest row
+                    ranked = sorted(shared.items(), key=lambda item: (-item[1], item[0]))[:max_candidates]
+                    if any(
+                        index.similarity(c, signatures[slot], batch_signatures.get(c)) >= threshold
+                        for c, _ in ranked
+                    ):
+                        stats['near_removed'] += 1
+                        continue
+                    
+                    joined = []
+                    for band, key in enumerate(keys[slot]):
+                        bucket = members.setdefault((band, key), [])
+                        if len(bucket) < max_bucket_rows:
+                            bucket.append(r)
+                            joined.append((band, key))
+                    added.append((r, signatures[slot], joined))
+                    batch_signatures[r] = signatures[slot]
+                    kept.append(r)
+                
+                index.add(added)
+            
+            row += len(texts)
+    finally:
+        if index is not None:
+            index.close()
+        db.close()
+    
+    stats['kept'] = len(kept)
+    if lengths is not None:
+        kept_set = set(kept)
+        stats['tokens_saved'] = sum(n for i, n in enumerate(lengths) if i not in kept_set)
+    
+    if len(kept) == len(dataset):
+        return dataset, stats, kept
+    return dataset.select(kept), stats, kept
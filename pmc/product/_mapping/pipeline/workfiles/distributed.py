@@ -0,0 +1,260 @@
+"""
+Multi-Process Data-Parallel Training for LoRA Jobs
+
+When gpu_config.count > 1 the handler launches one training process per
+device instead of calling train_lora_model directly. Each rank joins a
+torch.distributed process group (NCCL on GPUs, gloo on CPU) and runs
+train_lora_model with a DistributedContext; the Trainer then wraps the
+model in DistributedDataParallel and shards every epoch with a
+DistributedSampler.
+
+Division of work:
+- Rank 0 downloads, parses, deduplicates and tokenizes the dataset and
+  shares it with the other ranks through the job's shared work dir.
+- Every rank loads the base model onto its own device and trains.
+- Only rank 0 reports status (relayed through a queue to the parent
+  process, which owns the real StatusManager), saves and uploads artifacts.
+
+If any rank fails, the remaining ranks are terminated so none of them
+blocks forever in a collective.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import queue
+import socket
+import shutil
+import logging
+import tempfile
+import traceback
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+logger = logging.getLogger(__name__)
+
+# Rank 0 prepares the dataset while the other ranks wait in a collective
+DEFAULT_TIMEOUT_MINUTES = 120
+
+
+class DistributedContext:
+    """Rank information and collectives for one training process."""
+
+    def __init__(self, rank: int, world_size: int, local_rank: int, backend: str, work_dir: str):
+        self.rank = rank
+        self.world_size = world_size
+        self.local_rank = local_rank
+        self.backend = backend
+        self.work_dir = work_dir
+
+    @property
+    def is_main(self) -> bool:
+        return self.rank == 0
+
+    @property
+    def device_map(self) -> Optional[Dict[str, int]]:
+        """from_pretrained device_map that pins the whole model to this rank's GPU."""
+        return {"": self.local_rank} if torch.cuda.is_available() else None
+
+    def barrier(self) -> None:
+        dist.barrier()
+
+    def broadcast(self, obj: Any = None) -> Any:
+        """Send a picklable object from rank 0 to every rank and return it."""
+        objects = [obj]
+        dist.broadcast_object_list(objects, src=0)
+        return objects[0]
+
+
+class QueueStatusManager:
+    """StatusManager stand-in for rank 0 that relays updates to the parent process."""
+
+    def __init__(self, events):
+        self.events = events
+        self.state: Dict[str, Dict[str, Any]] = {}
+
+    def update_status(self, job_id: str, **kwargs) -> None:
+        state = self.state.setdefault(job_id, {'metrics': {}})
+        state.update({k: v for k, v in kwargs.items() if k != 'metrics'})
+        state['metrics'].update(kwargs.get('metrics') or {})
+        self.events.put(('status', dict(kwargs, job_id=job_id)))
+
+    def get_status(self, job_id: str) -> Dict[str, Any]:
+        return self.state.get(job_id, {})
+
+
+class NullStatusManager:
+    """StatusManager stand-in for ranks other than 0."""
+
+    def update_status(self, job_id: str, **kwargs) -> None:
+        pass
+
+    def get_status(self, job_id: str) -> Dict[str, Any]:
+        return {}
+
+
+def resolve_world_size(requested: int) -> int:
+    """
+    Number of ranks to launch for a requested GPU count.
+
+    Clamped to the visible CUDA devices; without CUDA the requested count is
+    used as-is so the launcher can run on CPU with gloo.
+    """
+    if torch.cuda.is_available():
+        available = torch.cuda.device_count()
+        if requested > available:
+            logger.warning(f"gpu_config.count={requested} but only {available} GPU(s) visible - using {available}")
+            return available
+    return requested
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _rank_main(
+    rank: int,
+    world_size: int,
+    port: int,
+    backend: str,
+    timeout_minutes: float,
+    work_dir: str,
+    target: Callable[..., Dict[str, Any]],
+    kwargs: Dict[str, Any],
+    events
+) -> None:
+    """Entry point of each spawned rank."""
+    os.environ.update({
+        'MASTER_ADDR': '127.0.0.1',
+        'MASTER_PORT': str(port),
+        'RANK': str(rank),
+        'LOCAL_RANK': str(rank),
+        'WORLD_SIZE': str(world_size),
+    })
+
+    try:
+        if torch.cuda.is_available():
+            torch.cuda.set_device(rank)
+        dist.init_process_group(
+            backend=backend,
+            rank=rank,
+            world_size=world_size,
+            timeout=timedelta(minutes=timeout_minutes),
+        )
+
+        context = DistributedContext(rank, world_size, rank, backend, work_dir)
+        status_manager = QueueStatusManager(events) if context.is_main else NullStatusManager()
+        result = target(**kwargs, status_manager=status_manager, dist_context=context)
+    except Exception as e:
+        logger.error(f"Rank {rank} failed: {e}\n{traceback.format_exc()}")
+        result = {"status": "failed", "job_id": kwargs.get('job_id'), "error_message": f"Rank {rank}: {e}"}
+    finally:
+        if dist.is_initialized():
+            dist.destroy_process_group()
+
+    events.put(('result', rank, result))
+
+
+def launch_distributed(
+    target: Callable[..., Dict[str, Any]],
+    world_size: int,
+    kwargs: Dict[str, Any],
+    status_manager,
+    backend: Optional[str] = None,
+    timeout_minutes: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Run `target` on `world_size` spawned ranks and return rank 0's result.
+
+    Args:
+        target: Importable function called as target(**kwargs, status_manager=..., dist_context=...)
+        world_size: Number of ranks
+        kwargs: Keyword arguments for target (must be picklable; job_id is used for reporting)
+        status_manager: Receives rank 0's status updates in this process
+        backend: Process-group backend (default: DIST_BACKEND, else nccl with CUDA, gloo without)
+        timeout_minutes: Collective timeout (default: DIST_TIMEOUT_MINUTES or 120)
+
+    Returns:
+        Rank 0's result, or the first failure if any rank failed
+    """
+    backend = backend or os.environ.get('DIST_BACKEND') or ('nccl' if torch.cuda.is_available() else 'gloo')
+    timeout_minutes = timeout_minutes or float(os.environ.get('DIST_TIMEOUT_MINUTES', DEFAULT_TIMEOUT_MINUTES))
+    job_id = kwargs.get('job_id', 'unknown')
+    work_dir = tempfile.mkdtemp(prefix=f"job_{job_id}_")
+    port = _free_port()
+
+    logger.info(f"Launching {world_size} ranks ({backend}) for job {job_id}")
+
+    context = mp.get_context('spawn')
+    events = context.Queue()
+    processes = [
+        context.Process(
+            target=_rank_main,
+            args=(rank, world_size, port, backend, timeout_minutes, work_dir, target, kwargs, events),
+            name=f"rank-{rank}",
+        )
+        for rank in range(world_size)
+    ]
+
+    results: Dict[int, Dict[str, Any]] = {}
+    failure: Optional[Dict[str, Any]] = None
+
+    try:
+        for process in processes:
+            process.start()
+
+        while len(results) < world_size and failure is None:
+            try:
+                event = events.get(timeout=1.0)
+            except queue.Empty:
+                # A rank that died without reporting (e.g. killed by the OOM killer)
+                for rank, process in enumerate(processes):
+                    if rank not in results and process.exitcode not in (None, 0):
+                        failure = {
+                            "status": "failed",
+                            "job_id": job_id,
+                            "error_message": f"Rank {rank} exited with code {process.exitcode}",
+                        }
+                continue
+
+            if event[0] == 'status':
+                status_manager.update_status(**event[1])
+            else:
+                _, rank, result = event
+                results[rank] = result
+                if result.get('status') == 'failed':
+                    failure = result
+
+        # Rank 0's final status updates may still be queued behind its result
+        while True:
+            try:
+                event = events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'status':
+                status_manager.update_status(**event[1])
+    finally:
+        for process in processes:
+            if failure is not None and process.is_alive():
+                process.terminate()
+            process.join()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if failure is not None:
+        # Rank 0 reports its own failure; anything else is reported here
+        if results.get(0, {}).get('status') != 'failed':
+            status_manager.update_status(
+                job_id=job_id,
+                status='failed',
+                error_message=failure.get('error_message', 'Distributed training failed')
+            )
+        return failure
+
+    return results[0]
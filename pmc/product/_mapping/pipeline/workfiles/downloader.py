@@ -0,0 +1,363 @@
+"""
+Parallel Ranged Downloader for Training Datasets
+
+Fetches large objects with concurrent HTTP Range requests over a pooled
+session, writing each part straight into a preallocated file. Completed
+parts are recorded in a sidecar state file, so a retry (or a retried job
+using the same output path) resumes instead of starting over. Small
+objects and servers that do not support ranges use a single stream, which
+is continued with a Range: bytes=<written>- request after a failure
+whenever the server accepts ranges.
+
+Size is always checked at the end; content is checked against an expected
+SHA-256 when one is supplied, or against the ETag when it is a plain MD5.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+\d+-\d+/(\d+)')
+_MD5_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed."""
+
+
+class ChecksumError(DownloadError):
+    """Raised when downloaded content does not match its expected checksum."""
+
+
+def create_session(pool_size: int = 16) -> requests.Session:
+    """
+    Create a pooled HTTP session with connection-level retries.
+    
+    Args:
+        pool_size: Maximum pooled connections per host
+        
+    Returns:
+        Configured requests.Session
+    """
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Ranges must address the stored bytes, never a transfer encoding
+    session.headers['Accept-Encoding'] = 'identity'
+    return session
+
+
+class _ProgressLogger:
+    """Thread-safe byte counter that logs each time a 10MB boundary is crossed."""
+    
+    def __init__(self, total_size: int, initial: int = 0, interval: int = 10 * MB):
+        self.total_size = total_size
+        self.downloaded = initial
+        self.interval = interval
+        self.next_report = (initial // interval + 1) * interval
+        self.lock = threading.Lock()
+    
+    def add(self, count: int) -> None:
+        with self.lock:
+            self.downloaded += count
+            if self.downloaded < self.next_report:
+                return
+            self.next_report = (self.downloaded // self.interval + 1) * self.interval
+            downloaded = self.downloaded
+        
+        progress = (downloaded / self.total_size * 100) if self.total_size > 0 else 0
+        logger.info(f"Downloaded: {downloaded / MB:.1f}MB ({progress:.1f}%)")
+
+
+class RangedDownloader:
+    """Concurrent, resumable HTTP downloader with end-of-transfer verification."""
+    
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        part_size: int = 16 * MB,
+        max_workers: int = 8,
+        max_attempts: int = 3,
+        min_parallel_size: int = 32 * MB,
+        timeout: int = 300,
+    ):
+        self.session = session or create_session(pool_size=max_workers * 2)
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.min_parallel_size = min_parallel_size
+        self.timeout = timeout
+    
+    def download(self, url: str, output_path: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Download a URL to a local file, retrying and resuming on failure.
+        
+        Args:
+            url: Source URL
+            output_path: Destination file
+            expected_sha256: Optional hex digest the content must match
+            
+        Returns:
+            Dictionary with bytes, ranged, parts, verified and elapsed_seconds
+            
+        Raises:
+            DownloadError: If all attempts fail
+            ChecksumError: If the content fails checksum verification
+        """
+        start = time.time()
+        last_error: Optional[Exception] = None
+        
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                size, ranged, etag = self._probe(url)
+                
+                if ranged and size >= self.min_parallel_size:
+                    parts = self._download_ranged(url, output_path, size, etag)
+                else:
+                    parts = 1
+                    self._download_stream(url, output_path, size, ranged, etag)
+                
+                verified = self._verify(output_path, size, etag, expected_sha256)
+                self._clear_state(output_path)
+                
+                return {
+                    'bytes': os.path.getsize(output_path),
+                    'ranged': ranged and parts > 1,
+                    'parts': parts,
+                    'verified': verified,
+                    'elapsed_seconds': time.time() - start,
+                }
+            
+            except ChecksumError:
+                # Corrupt content is discarded rather than resumed
+                self._discard(output_path)
+                raise
+            except (DownloadError, requests.RequestException, OSError) as e:
+                last_error = e
+            
+            if attempt < self.max_attempts:
+                delay = 2 ** attempt
+                logger.warning(f"Download attempt {attempt} failed ({last_error}), resuming in {delay}s")
+                time.sleep(delay)
+        
+        raise DownloadError(f"Download failed after {self.max_attempts} attempts: {last_error}")
+    
+    def _probe(self, url: str) -> Tuple[int, bool, Optional[str]]:
+        """Return (size, supports_ranges, etag) using a one-byte range request."""
+        with self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            etag = response.headers.get('ETag')
+            
+            if response.status_code == 206:
+                match = _CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+                if match:
+                    return int(match.group(1)), True, etag
+            
+            return int(response.headers.get('Content-Length', 0)), False, etag
+    
+    def _state_path(self, output_path: str) -> str:
+        return f"{output_path}.parts.json"
+    
+    def _load_state(self, output_path: str, size: int, etag: Optional[str]) -> List[int]:
+        """Return completed part indices from a matching previous attempt."""
+        state_path = self._state_path(output_path)
+        if not os.path.exists(state_path) or not os.path.exists(output_path):
+            return []
+        
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return []
+        
+        if (state.get('size') != size or state.get('etag') != etag
+                or state.get('part_size') != self.part_size
+                or os.path.getsize(output_path) != size):
+            return []
+        
+        return list(state.get('done', []))
+    
+    def _save_state(self, output_path: str, size: int, etag: Optional[str], done: List[int]) -> None:
+        state_path = self._state_path(output_path)
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'etag': etag, 'part_size': self.part_size, 'done': sorted(done)}, f)
+        os.replace(tmp_path, state_path)
+    
+    def _clear_state(self, output_path: str) -> None:
+        try:
+            os.remove(self._state_path(output_path))
+        except FileNotFoundError:
+            pass
+    
+    def _discard(self, output_path: str) -> None:
+        self._clear_state(output_path)
+        try:
+            os.remove(output_path)
+        except FileNotFoundError:
+            pass
+    
+    def _download_ranged(self, url: str, output_path: str, size: int, etag: Optional[str]) -> int:
+        """Fetch all missing parts concurrently into a preallocated file."""
+        ranges = [
+            (index, offset, min(offset + self.part_size, size) - 1)
+            for index, offset in enumerate(range(0, size, self.part_size))
+        ]
+        
+        done = set(self._load_state(output_path, size, etag))
+        if done:
+            logger.info(f"Resuming download: {len(done)}/{len(ranges)} parts already complete")
+        else:
+            with open(output_path, 'wb') as f:
+                f.truncate(size)
+            self._save_state(output_path, size, etag, [])
+        
+        missing = [r for r in ranges if r[0] not in done]
+        resumed_bytes = sum(end - offset + 1 for index, offset, end in ranges if index in done)
+        progress = _ProgressLogger(size, initial=resumed_bytes)
+        state_lock = threading.Lock()
+        
+        logger.info(f"Ranged download: {size / MB:.1f}MB in {len(ranges)} parts, {self.max_workers} connections")
+        
+        fd = os.open(output_path, os.O_RDWR)
+        try:
+            def fetch(part: Tuple[int, int, int]) -> None:
+                index, offset, end = part
+                headers = {'Range': f"bytes={offset}-{end}"}
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise DownloadError(f"Server ignored range request for part {index}")
+                    
+                    position = offset
+                    for chunk in response.iter_content(chunk_size=MB):
+                        if chunk:
+                            os.pwrite(fd, chunk, position)
+                            position += len(chunk)
+                            progress.add(len(chunk))
+                
+                if position != end + 1:
+                    raise DownloadError(f"Part {index} truncated: got {position - offset} of {end - offset + 1} bytes")
+                
+                with state_lock:
+                    done.add(index)
+                    self._save_state(output_path, size, etag, list(done))
+            
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for future in [executor.submit(fetch, part) for part in missing]:
+                    future.result()
+            
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        return len(ranges)
+    
+    def _stream_resume_offset(self, output_path: str, size: int, ranged: bool, etag: Optional[str]) -> int:
+        """Bytes of a matching partial stream from an earlier attempt that can be continued."""
+        state_path = self._state_path(output_path)
+        if not etag or not size or not os.path.exists(state_path) or not os.path.exists(output_path):
+            return 0
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        
+        if not state.get('stream') or state.get('size') != size or state.get('etag') != etag:
+            return 0
+        if not (ranged or state.get('accept_ranges')):
+            return 0
+        written = os.path.getsize(output_path)
+        return written if written <= size else 0
+    
+    def _download_stream(self, url: str, output_path: str, size: int, ranged: bool, etag: Optional[str]) -> None:
+        """Fetch the object over a single connection, continuing a partial file when possible."""
+        written = self._stream_resume_offset(output_path, size, ranged, etag)
+        if written and written == size:
+            return
+        
+        headers = {'Range': f"bytes={written}-"} if written else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if written and response.status_code != 206:
+                logger.info("Server ignored the resume range - restarting download")
+                written = 0
+            elif written:
+                logger.info(f"Resuming download at {written / MB:.1f}MB")
+            
+            state_path = self._state_path(output_path)
+            with open(f"{state_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump({
+                    'stream': True,
+                    'size': size,
+                    'etag': etag,
+                    'accept_ranges': ranged or response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+                }, f)
+            os.replace(f"{state_path}.tmp", state_path)
+            
+            total_size = written + int(response.headers.get('Content-Length', 0))
+            progress = _ProgressLogger(total_size, initial=written)
+            
+            with open(output_path, 'ab' if written else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=MB):
+                    if chunk:
+                        f.write(chunk)
+                        progress.add(len(chunk))
+    
+    def _verify(self, output_path: str, size: int, etag: Optional[str], expected_sha256: Optional[str]) -> bool:
+        """
+        Check the downloaded file's size and, where possible, its checksum.
+        
+        Returns:
+            True if a checksum was verified, False if only the size was checked
+        """
+        actual_size = os.path.getsize(output_path)
+        if size and actual_size != size:
+            raise DownloadError(f"Size mismatch: expected {size} bytes, got {actual_size}")
+        
+        etag_md5 = (etag or '').strip('"').lower()
+        check_md5 = bool(_MD5_RE.match(etag_md5))
+        if not expected_sha256 and not check_md5:
+            return False
+        
+        sha256 = hashlib.sha256()
+        md5 = hashlib.md5()
+        with open(output_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(8 * MB), b''):
+                if expected_sha256:
+                    sha256.update(chunk)
+                if check_md5:
+                    md5.update(chunk)
+        
+        if expected_sha256 and sha256.hexdigest() != expected_sha256.lower():
+            raise ChecksumError("Checksum mismatch: SHA-256 does not match expected value")
+        if check_md5 and md5.hexdigest() != etag_md5:
+            raise ChecksumError("Checksum mismatch: MD5 does not match ETag")
+        
+        return True
@@ -4,20 +4,30 @@ RunPod Serverless Handler for LoRA Training Jobs
 This handler receives training job requests from the Supabase Edge Function,
 validates parameters, executes training via train_lora.py, and manages job status.
 
+Only lightweight modules are imported at boot. The training stack (torch,
+transformers, peft, datasets, supabase) is imported by a preload
+thread while the worker waits for jobs, so validation and rejected jobs
+never pay for it; see startup_profile.py.
+
 Author: Bright Run AI
 Date: December 28, 2025
 """
 
+import time
+
+_BOOT_START = time.perf_counter()
+
 import runpod
 import logging
 import json
 import traceback
-import boto3
 import os
 from pathlib import Path
 from typing import Dict, Any, Optional
-from status_manager import StatusManager
-from train_lora import train_lora_model
+
+from model_store import start_boot_prefetch
+from stage_profiler import StageProfiler, combine_stage_profiles
+from startup_profile import Preloader, StartupProfile
 
 # Configure logging
 logging.basicConfig(
@@ -26,29 +36,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize status manager
-status_manager = StatusManager()
+startup_profile = StartupProfile(start=_BOOT_START)
+startup_profile.mark('handler_imported')
+preloader = Preloader(startup_profile)
 
+# Upper bound on adapters trained in one sweep job
+MAX_SWEEP_ADAPTERS = 16
 
-def validate_job_input(job_input: Dict[str, Any]) -> tuple[bool, Optional[str]]:
+# Status manager is created on first use
+_status_manager = None
+
+
+def get_status_manager():
+    """Return the shared StatusManager, creating it on first use."""
+    global _status_manager
+    if _status_manager is None:
+        from status_manager import StatusManager
+        _status_manager = StatusManager()
+    return _status_manager
+
+
+def get_train_lora_model():
+    """Return train_lora_model, waiting for the boot preload if it is still running."""
+    preloader.wait()
+    from train_lora import train_lora_model
+    return train_lora_model
+
+
+def validate_hyperparameters(hyperparams: Dict[str, Any]) -> tuple[bool, Optional[str]]:
     """
-    Validate job input parameters.
+    Validate one set of training hyperparameters.
     
     Args:
-        job_input: Dictionary containing job configuration
+        hyperparams: Hyperparameters dictionary
         
     Returns:
         Tuple of (is_valid, error_message)
     """
-    required_fields = ['job_id', 'dataset_url', 'hyperparameters', 'gpu_config']
-    
-    # Check required top-level fields
-    for field in required_fields:
-        if field not in job_input:
-            return False, f"Missing required field: {field}"
-    
-    # Validate hyperparameters
-    hyperparams = job_input.get('hyperparameters', {})
     required_hyperparams = [
         'base_model', 'learning_rate', 'batch_size', 
         'epochs', 'rank'
@@ -74,6 +98,91 @@ def validate_job_input(job_input: Dict[str, Any]) -> tuple[bool, Optional[str]]:
     if not 4 <= hyperparams['rank'] <= 128:
         return False, "rank must be between 4 and 128"
     
+    max_seq_length = hyperparams.get('max_seq_length', 2048)
+    if max_seq_length != 'auto' and not (isinstance(max_seq_length, int) and 128 <= max_seq_length <= 32768):
+        return False, "max_seq_length must be 'auto' or an integer between 128 and 32768"
+    
+    if hyperparams.get('length_policy', 'truncate') not in ('truncate', 'drop'):
+        return False, "length_policy must be one of truncate, drop"
+    
+    if hyperparams.get('dedup', 'none') not in ('none', 'exact', 'near'):
+        return False, "dedup must be one of none, exact, near"
+    
+    if hyperparams.get('batching', 'padded') not in ('padded', 'group_by_length', 'packing'):
+        return False, "batching must be one of padded, group_by_length, packing"
+    
+    if not isinstance(hyperparams.get('auto_batch_size', False), bool):
+        return False, "auto_batch_size must be true or false"
+    
+    checkpoint_steps = hyperparams.get('checkpoint_steps', 0)
+    if not isinstance(checkpoint_steps, int) or checkpoint_steps < 0:
+        return False, "checkpoint_steps must be a non-negative integer"
+    
+    validation_split = hyperparams.get('validation_split', 0.0)
+    if isinstance(validation_split, bool) or not isinstance(validation_split, (int, float)) or not 0 <= validation_split < 0.5:
+        return False, "validation_split must be a number in [0, 0.5)"
+    
+    for name in ('eval_steps', 'early_stopping_patience'):
+        value = hyperparams.get(name, 0)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            return False, f"{name} must be a non-negative integer"
+    
+    early_stopping_threshold = hyperparams.get('early_stopping_threshold', 0.0)
+    if isinstance(early_stopping_threshold, bool) or not isinstance(early_stopping_threshold, (int, float)) or early_stopping_threshold < 0:
+        return False, "early_stopping_threshold must be a non-negative number"
+    
+    if hyperparams.get('early_stopping_patience', 0) > 0 and not validation_split:
+        return False, "early_stopping_patience requires validation_split"
+    
+    return True, None
+
+
+def validate_job_input(job_input: Dict[str, Any]) -> tuple[bool, Optional[str]]:
+    """
+    Validate job input parameters.
+    
+    Args:
+        job_input: Dictionary containing job configuration
+        
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    required_fields = ['job_id', 'dataset_url', 'hyperparameters', 'gpu_config']
+    
+    # Check required top-level fields
+    for field in required_fields:
+        if field not in job_input:
+            return False, f"Missing required field: {field}"
+    
+    # Validate hyperparameters
+    hyperparams = job_input.get('hyperparameters', {})
+    is_valid, error_message = validate_hyperparameters(hyperparams)
+    if not is_valid:
+        return False, error_message
+    
+    # Job events are POSTed to callback_url (see webhooks.py)
+    callback_url = job_input.get('callback_url')
+    if callback_url is not None and (
+        not isinstance(callback_url, str) or not callback_url.startswith(('http://', 'https://'))
+    ):
+        return False, "callback_url must be an http:// or https:// URL"
+    
+    # Validate sweep jobs: each set is merged over the shared hyperparameters
+    hyperparameter_sets = job_input.get('hyperparameter_sets')
+    if hyperparameter_sets is not None:
+        if not isinstance(hyperparameter_sets, list) or not 1 <= len(hyperparameter_sets) <= MAX_SWEEP_ADAPTERS:
+            return False, f"hyperparameter_sets must be a list of 1 to {MAX_SWEEP_ADAPTERS} objects"
+        
+        for index, overrides in enumerate(hyperparameter_sets):
+            if not isinstance(overrides, dict):
+                return False, f"hyperparameter_sets[{index}] must be an object"
+            is_valid, error_message = validate_hyperparameters({**hyperparams, **overrides})
+            if not is_valid:
+                return False, f"hyperparameter_sets[{index}]: {error_message}"
+        
+        if job_input.get('gpu_config', {}).get('count', 1) != 1:
+            return False, "hyperparameter_sets requires gpu_config.count of 1"
+    
     # Validate GPU config
     gpu_config = job_input.get('gpu_config', {})
     if 'type' not in gpu_config:
@@ -107,6 +216,8 @@ def upload_model_to_s3(job_id: str, model_dir: str) -> Dict[str, str]:
     logger.info(f"Uploading model files for job {job_id} to S3...")
     
     try:
+        import boto3
+        
         # Initialize S3 client with RunPod endpoint
         s3_client = boto3.client(
             's3',
@@ -179,6 +290,55 @@ def upload_model_to_s3(job_id: str, model_dir: str) -> Dict[str, str]:
         return {}
 
 
+def build_sweep_response(result: Dict[str, Any], hyperparams: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the handler response for a sweep job, uploading each completed adapter.
+    
+    Args:
+        result: Result of train_lora_sweep
+        hyperparams: Shared hyperparameters of the sweep
+        
+    Returns:
+        Response with one entry per adapter
+    """
+    if result['status'] != 'completed':
+        logger.error(f"Sweep failed: {result.get('error_message', 'Unknown error')}")
+        return result
+    
+    adapters = []
+    for adapter_result in result['adapters']:
+        adapter_id = adapter_result['job_id']
+        entry = {"job_id": adapter_id, "status": adapter_result['status']}
+        
+        if adapter_result['status'] == 'completed':
+            adapter_path = adapter_result.get('adapter_path')
+            model_files = {}
+            if adapter_path and os.path.exists(adapter_path):
+                model_files = upload_model_to_s3(adapter_id, adapter_path)
+            entry.update({
+                "model_files": model_files,
+                "adapter_path": adapter_path,
+                "metrics": adapter_result.get('metrics', {}),
+            })
+        else:
+            entry["error_message"] = adapter_result.get('error_message')
+        
+        adapters.append(entry)
+    
+    logger.info(f"Sweep completed: {result['metrics']['adapters_completed']}/{len(adapters)} adapters trained")
+    
+    return {
+        "status": "success",
+        "adapters": adapters,
+        "model_metadata": {
+            "base_model": hyperparams.get('base_model', 'unknown'),
+        },
+        "metrics": result['metrics'],
+        "progress": 100,
+        "job_id": result['job_id']
+    }
+
+
 def handler(event: Dict[str, Any]) -> Dict[str, Any]:
     """
     Main RunPod serverless handler.
@@ -205,7 +365,7 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
         is_valid, error_message = validate_job_input(job_input)
         if not is_valid:
             logger.error(f"Validation failed: {error_message}")
-            status_manager.update_status(
+            get_status_manager().update_status(
                 job_id=job_id,
                 status='failed',
                 error_message=f"Validation error: {error_message}"
@@ -219,6 +379,7 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
         logger.info("Validation passed")
         
         # Initialize job status
+        status_manager = get_status_manager()
         status_manager.update_status(
             job_id=job_id,
             status='initializing',
@@ -236,15 +397,37 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
         logger.info(f"GPU Type: {job_input['gpu_config']['type']}")
         
         # Execute training
-        logger.info("Starting training execution...")
-        result = train_lora_model(
-            job_id=job_id,
-            dataset_url=job_input['dataset_url'],
-            hyperparameters=hyperparams,
-            gpu_config=job_input['gpu_config'],
-            callback_url=job_input.get('callback_url'),
-            status_manager=status_manager
-        )
+        train_lora_model = get_train_lora_model()
+        train_kwargs = {
+            'job_id': job_id,
+            'dataset_url': job_input['dataset_url'],
+            'hyperparameters': hyperparams,
+            'gpu_config': job_input['gpu_config'],
+            'callback_url': job_input.get('callback_url'),
+        }
+        
+        gpu_count = job_input['gpu_config']['count']
+        if gpu_count > 1:
+            from distributed import launch_distributed, resolve_world_size
+            world_size = resolve_world_size(gpu_count)
+        else:
+            world_size = 1
+        
+        if job_input.get('hyperparameter_sets') is not None:
+            from train_lora import train_lora_sweep
+            logger.info(f"Starting sweep of {len(job_input['hyperparameter_sets'])} adapters...")
+            result = train_lora_sweep(
+                **train_kwargs,
+                hyperparameter_sets=job_input['hyperparameter_sets'],
+                status_manager=status_manager
+            )
+            return build_sweep_response(result, hyperparams)
+        elif world_size > 1:
+            logger.info(f"Starting data-parallel training on {world_size} ranks...")
+            result = launch_distributed(train_lora_model, world_size, train_kwargs, status_manager)
+        else:
+            logger.info("Starting training execution...")
+            result = train_lora_model(**train_kwargs, status_manager=status_manager)
         
         if result['status'] == 'completed':
             logger.info("=" * 80)
@@ -255,9 +438,11 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
             # Upload model files to S3 and get URLs
             adapter_path = result.get('adapter_path')
             model_files = {}
+            upload_profiler = StageProfiler(job_id)
             
             if adapter_path and os.path.exists(adapter_path):
                 logger.info("Uploading model files to S3...")
+                upload_profiler.start('s3_upload')
                 model_files = upload_model_to_s3(job_id, adapter_path)
                 
                 if model_files:
@@ -280,6 +465,7 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
                 "progress": 100,
                 "current_epoch": result.get('epochs_completed', hyperparams.get('epochs', 0)),
                 "current_step": result.get('steps_completed', 0),
+                "stage_profile": combine_stage_profiles(result.get('stage_profile'), upload_profiler.report()),
                 "job_id": job_id
             }
         else:
@@ -297,7 +483,7 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
         logger.error(error_trace)
         
         job_id = event.get('input', {}).get('job_id', 'unknown')
-        status_manager.update_status(
+        get_status_manager().update_status(
             job_id=job_id,
             status='failed',
             error_message=error_msg
@@ -314,5 +500,9 @@ def handler(event: Dict[str, Any]) -> Dict[str, Any]:
 # Start RunPod serverless worker
 if __name__ == "__main__":
     logger.info("Starting RunPod serverless worker...")
+    preloader.start()
+    start_boot_prefetch()
+    startup_profile.mark('ready')
+    startup_profile.log("Startup profile (ready for jobs)")
     logger.info("Waiting for jobs...")
     runpod.serverless.start({"handler": handler})
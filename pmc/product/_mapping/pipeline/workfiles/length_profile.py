@@ -0,0 +1,221 @@
+"""
+Token-Length Profiling for LoRA Training Jobs
+
+A fast pre-pass over the prepared conversations that measures (or
+estimates) each conversation's token length, summarizes the distribution,
+and picks max_seq_length from a percentile instead of a fixed 2048.
+
+Two modes:
+- exact: render the chat template and tokenize every conversation.
+- estimate: tokenize a random sample exactly, fit
+  tokens ~= a * content_chars + b * num_messages on it, and apply the fit
+  to every row. This needs no template rendering and is much faster on
+  large datasets.
+
+Outliers above the chosen length are either truncated (the default, as
+before) or dropped.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import math
+import random
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from datasets import Dataset
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERCENTILE = 99.0
+DEFAULT_SAMPLE_SIZE = 2000
+MIN_SEQ_LENGTH = 128
+SEQ_LENGTH_MULTIPLE = 64
+
+# Histogram bucket upper bounds (tokens); the last bucket is open-ended
+HISTOGRAM_EDGES = [128, 256, 512, 1024, 2048, 4096, 8192]
+
+LENGTH_POLICIES = ('truncate', 'drop')
+
+
+def _exact_lengths(conversations: List[List[Dict[str, str]]], tokenizer) -> List[int]:
+    """Render and tokenize conversations without truncation."""
+    texts = [
+        tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
+        for messages in conversations
+    ]
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=True)["input_ids"]]
+
+
+def _content_features(messages: List[Dict[str, str]]) -> Tuple[int, int]:
+    """Return (content characters, message count) for one conversation."""
+    return sum(len(m.get("content") or "") for m in messages), len(messages)
+
+
+def _fit_estimator(features: List[Tuple[int, int]], lengths: List[int]) -> Tuple[float, float]:
+    """
+    Least-squares fit of tokens = a * chars + b * messages (no intercept).
+    
+    Falls back to a pure chars ratio if the system is degenerate.
+    """
+    sxx = sum(c * c for c, _ in features)
+    syy = sum(m * m for _, m in features)
+    sxy = sum(c * m for c, m in features)
+    sxt = sum(c * t for (c, _), t in zip(features, lengths))
+    syt = sum(m * t for (_, m), t in zip(features, lengths))
+    
+    det = sxx * syy - sxy * sxy
+    if det > 0:
+        a = (sxt * syy - syt * sxy) / det
+        b = (syt * sxx - sxt * sxy) / det
+        if a > 0 and b >= 0:
+            return a, b
+    
+    total_chars = sum(c for c, _ in features)
+    return (sum(lengths) / total_chars if total_chars else 0.25), 0.0
+
+
+def profile_token_lengths(
+    dataset: Dataset,
+    tokenizer,
+    mode: str = 'auto',
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    batch_size: int = 1000,
+    seed: int = 42
+) -> Tuple[List[int], str]:
+    """
+    Measure or estimate the token length of every conversation.
+    
+    Args:
+        dataset: Dataset with a "messages" column
+        tokenizer: Tokenizer with a chat template
+        mode: 'exact', 'estimate' or 'auto' (exact when the dataset fits in one sample)
+        sample_size: Conversations tokenized to calibrate the estimate
+        batch_size: Rows read per batch
+        seed: Sampling seed
+        
+    Returns:
+        Tuple of (lengths in dataset order, mode actually used)
+    """
+    if mode == 'auto':
+        mode = 'exact' if len(dataset) <= sample_size else 'estimate'
+    
+    if mode == 'exact':
+        lengths: List[int] = []
+        for batch in dataset.iter(batch_size=batch_size):
+            lengths.extend(_exact_lengths(batch["messages"], tokenizer))
+        return lengths, mode
+    
+    sample_indices = random.Random(seed).sample(range(len(dataset)), sample_size)
+    sample = dataset.select(sample_indices)["messages"]
+    sample_lengths = _exact_lengths(sample, tokenizer)
+    a, b = _fit_estimator([_content_features(m) for m in sample], sample_lengths)
+    logger.info(f"Token length estimate: {a:.4f} tokens/char + {b:.1f} tokens/message (fit on {sample_size} samples)")
+    
+    lengths = []
+    for batch in dataset.iter(batch_size=batch_size):
+        for messages in batch["messages"]:
+            chars, count = _content_features(messages)
+            lengths.append(max(1, int(math.ceil(a * chars + b * count))))
+    return lengths, mode
+
+
+def _percentile(sorted_values: List[int], percentile: float) -> int:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0
+    rank = max(1, int(math.ceil(percentile / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def length_stats(lengths: List[int], max_seq_length: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Summarize a token-length distribution.
+    
+    Args:
+        lengths: Token length per conversation
+        max_seq_length: If given, also count conversations longer than it
+        
+    Returns:
+        Dictionary with count, mean, percentiles, max, histogram and
+        (optionally) over_max_seq_length
+    """
+    ordered = sorted(lengths)
+    histogram = {}
+    lower = 0
+    for edge in HISTOGRAM_EDGES + [None]:
+        label = f"{lower}-{edge}" if edge else f"{lower}+"
+        histogram[label] = sum(1 for n in ordered if n > lower and (edge is None or n <= edge))
+        lower = edge
+    
+    stats = {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered) if ordered else 0.0,
+        'p50': _percentile(ordered, 50),
+        'p90': _percentile(ordered, 90),
+        'p95': _percentile(ordered, 95),
+        'p99': _percentile(ordered, 99),
+        'max': ordered[-1] if ordered else 0,
+        'histogram': histogram,
+    }
+    if max_seq_length is not None:
+        stats['over_max_seq_length'] = sum(1 for n in ordered if n > max_seq_length)
+    return stats
+
+
+def select_max_seq_length(
+    lengths: List[int],
+    percentile: float = DEFAULT_PERCENTILE,
+    cap: int = 2048
+) -> int:
+    """
+    Choose max_seq_length covering the given percentile of conversations.
+    
+    The result is rounded up to a multiple of 64 and kept within [128, cap].
+    
+    Args:
+        lengths: Token length per conversation
+        percentile: Share of conversations that should fit untruncated
+        cap: Upper bound (memory budget / model context)
+        
+    Returns:
+        Selected max_seq_length
+    """
+    target = _percentile(sorted(lengths), percentile)
+    rounded = int(math.ceil(target / SEQ_LENGTH_MULTIPLE) * SEQ_LENGTH_MULTIPLE)
+    return max(MIN_SEQ_LENGTH, min(cap, rounded))
+
+
+def apply_length_policy(
+    dataset: Dataset,
+    lengths: List[int],
+    max_seq_length: int,
+    policy: str
+) -> Tuple[Dataset, List[int], int]:
+    """
+    Drop conversations longer than max_seq_length when the policy is 'drop'.
+    
+    With 'truncate', rows are kept and tokenization truncates them.
+    
+    Args:
+        dataset: Dataset with a "messages" column
+        lengths: Token length per conversation
+        max_seq_length: Selected length
+        policy: One of LENGTH_POLICIES
+        
+    Returns:
+        Tuple of (dataset, lengths for kept rows, number of dropped rows)
+    """
+    if policy not in LENGTH_POLICIES:
+        raise ValueError(f"length_policy must be one of {', '.join(LENGTH_POLICIES)}")
+    
+    if policy == 'truncate':
+        return dataset, lengths, 0
+    
+    keep = [i for i, n in enumerate(lengths) if n <= max_seq_length]
+    dropped = len(lengths) - len(keep)
+    if dropped == 0:
+        return dataset, lengths, 0
+    
+    return dataset.select(keep), [lengths[i] for i in keep], dropped
@@ -0,0 +1,293 @@
+"""
+Warm Base-Model Registry for LoRA Training Jobs
+
+RunPod keeps a worker process alive between jobs, so the quantized base
+model loaded for one job can serve the next one. The registry holds loaded
+models keyed by model path + quantization config + load kwargs, hands one
+out per job as a lease, and on release strips the job's LoRA adapter so
+the next job starts from the clean base weights.
+
+Entries are evicted least-recently-used beyond MODEL_REGISTRY_MAX_MODELS,
+when free accelerator memory drops below MODEL_REGISTRY_MIN_FREE_FRACTION,
+and whenever a job fails in a way that may have left the model in a bad
+state (e.g. CUDA OOM mid-step).
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import gc
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MODELS = 1
+DEFAULT_MIN_FREE_FRACTION = 0.1
+
+# loader(model_path, quantization_config, **model_kwargs) -> (tokenizer, model)
+ModelLoader = Callable[..., Tuple[Any, Any]]
+
+# memory_probe() -> (free_bytes, total_bytes), or None when unknown
+MemoryProbe = Callable[[], Optional[Tuple[int, int]]]
+
+
+def load_base_model(model_path: str, quantization_config=None, **model_kwargs) -> Tuple[Any, Any]:
+    """
+    Load a tokenizer and causal LM, prepared for k-bit training when quantized.
+
+    Args:
+        model_path: Local path or Hugging Face model ID
+        quantization_config: BitsAndBytesConfig, or None for a full-precision load
+        **model_kwargs: Extra from_pretrained kwargs (device_map, torch_dtype, ...)
+
+    Returns:
+        (tokenizer, model)
+    """
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    from peft import prepare_model_for_kbit_training
+
+    logger.info("Loading tokenizer...")
+    tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+
+    # Set pad token if not present
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    logger.info("Loading model" + (" with 4-bit quantization..." if quantization_config else "..."))
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        quantization_config=quantization_config,
+        trust_remote_code=True,
+        **model_kwargs
+    )
+
+    if quantization_config is not None:
+        # Done once per load; the prepared model is what the registry keeps
+        model = prepare_model_for_kbit_training(model)
+
+    return tokenizer, model
+
+
+def cuda_memory_probe() -> Optional[Tuple[int, int]]:
+    """Free and total memory on the current CUDA device, if there is one."""
+    if not torch.cuda.is_available():
+        return None
+    return torch.cuda.mem_get_info()
+
+
+def model_key(model_path: str, quantization_config=None, **model_kwargs) -> str:
+    """
+    Build the registry key for a model load.
+
+    Args:
+        model_path: Local path or Hugging Face model ID
+        quantization_config: Quantization config (anything with to_dict(), or None)
+        **model_kwargs: Load kwargs that change the resulting model
+
+    Returns:
+        Stable JSON string
+    """
+    if quantization_config is not None and hasattr(quantization_config, 'to_dict'):
+        quantization = quantization_config.to_dict()
+    else:
+        quantization = quantization_config
+
+    return json.dumps(
+        {'model_path': model_path, 'quantization': quantization, 'kwargs': model_kwargs},
+        sort_keys=True,
+        default=str,
+    )
+
+
+class ModelLease:
+    """A base model checked out of the registry for one job."""
+
+    def __init__(self, key: str, tokenizer, model, reused: bool, cached: bool, load_seconds: float):
+        self.key = key
+        self.tokenizer = tokenizer
+        self.model = model
+        self.reused = reused
+        self.cached = cached
+        self.load_seconds = load_seconds
+        self.peft_model = None
+
+    def attach_adapter(self, lora_config):
+        """
+        Wrap the base model with a fresh LoRA adapter for this job.
+
+        Args:
+            lora_config: peft LoraConfig
+
+        Returns:
+            PeftModel to train
+        """
+        from peft import get_peft_model
+
+        if self.peft_model is not None:
+            raise RuntimeError("Lease already has an adapter attached")
+
+        self.peft_model = get_peft_model(self.model, lora_config)
+        return self.peft_model
+
+
+def _has_adapter_layers(model) -> bool:
+    """True if any LoRA module is still injected in the model."""
+    return any('lora_' in name for name, _ in model.named_modules())
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded base models.
+
+    Not meant for concurrent jobs on the same model: if a model is already
+    leased, a second acquire loads a private copy that is dropped on release.
+    """
+
+    def __init__(
+        self,
+        loader: Optional[ModelLoader] = None,
+        max_models: int = DEFAULT_MAX_MODELS,
+        min_free_fraction: float = DEFAULT_MIN_FREE_FRACTION,
+        memory_probe: Optional[MemoryProbe] = None
+    ):
+        self.loader = loader or load_base_model
+        self.max_models = max_models
+        self.min_free_fraction = min_free_fraction
+        self.memory_probe = memory_probe or cuda_memory_probe
+        self.lock = threading.Lock()
+        # key -> {'tokenizer', 'model', 'in_use'}; most recently used last
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> 'ModelRegistry':
+        """Build a registry from MODEL_REGISTRY_MAX_MODELS / MODEL_REGISTRY_MIN_FREE_FRACTION."""
+        return cls(
+            max_models=int(os.environ.get('MODEL_REGISTRY_MAX_MODELS', DEFAULT_MAX_MODELS)),
+            min_free_fraction=float(
+                os.environ.get('MODEL_REGISTRY_MIN_FREE_FRACTION', DEFAULT_MIN_FREE_FRACTION)
+            ),
+        )
+
+    def acquire(self, model_path: str, quantization_config=None, **model_kwargs) -> ModelLease:
+        """
+        Check out a base model, loading it if it is not resident.
+
+        Args:
+            model_path: Local path or Hugging Face model ID
+            quantization_config: Quantization config passed to the loader
+            **model_kwargs: Extra load kwargs; part of the cache key
+
+        Returns:
+            ModelLease; hand it back with release() when the job ends
+        """
+        key = model_key(model_path, quantization_config, **model_kwargs)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not entry['in_use']:
+                entry['in_use'] = True
+                self.entries.move_to_end(key)
+                logger.info(f"Reusing warm base model: {model_path}")
+                return ModelLease(key, entry['tokenizer'], entry['model'], reused=True, cached=True, load_seconds=0.0)
+
+            cached = entry is None and self.max_models > 0
+            if cached:
+                self._evict_idle(keep=self.max_models - 1)
+
+            start = time.time()
+            tokenizer, model = self.loader(model_path, quantization_config, **model_kwargs)
+            load_seconds = time.time() - start
+
+            if cached:
+                self.entries[key] = {'tokenizer': tokenizer, 'model': model, 'in_use': True}
+
+            logger.info(f"Loaded base model in {load_seconds:.1f}s ({'cached' if cached else 'not cached'})")
+            return ModelLease(key, tokenizer, model, reused=False, cached=cached, load_seconds=load_seconds)
+
+    def release(self, lease: ModelLease, discard: bool = False) -> None:
+        """
+        Return a leased model, removing the job's adapter.
+
+        Args:
+            lease: Lease from acquire()
+            discard: Drop the model instead of keeping it warm
+        """
+        if lease.peft_model is not None:
+            try:
+                base_model = lease.peft_model.unload()
+                if hasattr(base_model, 'peft_config'):
+                    del base_model.peft_config
+                if _has_adapter_layers(base_model):
+                    logger.warning("LoRA layers still present after unload - discarding base model")
+                    discard = True
+                base_model.eval()
+            except Exception as e:
+                logger.warning(f"Failed to unload LoRA adapter - discarding base model: {e}")
+                discard = True
+            lease.peft_model = None
+
+        with self.lock:
+            entry = self.entries.get(lease.key)
+            if lease.cached and entry is not None and entry['model'] is lease.model:
+                if discard:
+                    del self.entries[lease.key]
+                    logger.info("Evicted base model from registry")
+                else:
+                    entry['in_use'] = False
+
+            lease.model = None
+            lease.tokenizer = None
+            self._release_memory()
+
+            if self._under_memory_pressure():
+                logger.warning("Low free accelerator memory - evicting idle base models")
+                self._evict_idle(keep=0)
+
+    def clear(self) -> None:
+        """Drop every idle model."""
+        with self.lock:
+            self._evict_idle(keep=0)
+
+    def _evict_idle(self, keep: int) -> None:
+        """Evict least-recently-used idle entries until at most `keep` remain."""
+        for key in list(self.entries):
+            if len(self.entries) <= max(keep, 0):
+                break
+            if not self.entries[key]['in_use']:
+                del self.entries[key]
+                logger.info("Evicted base model from registry")
+        self._release_memory()
+
+    def _under_memory_pressure(self) -> bool:
+        probe = self.memory_probe()
+        if not probe:
+            return False
+        free, total = probe
+        return total > 0 and free / total < self.min_free_fraction
+
+    @staticmethod
+    def _release_memory() -> None:
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-wide registry, creating it on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry.from_env()
+        return _registry
@@ -0,0 +1,384 @@
+"""
+Local Model Snapshot Store for LoRA Training Jobs
+
+Keeps verified copies of base-model repositories on the network volume so
+jobs load weights from local disk instead of downloading them on the
+critical path. Snapshots are fetched by the prefetch command or by the
+boot preloader (PREFETCH_MODELS) before jobs arrive.
+
+Layout under the store root (MODEL_STORE_DIR):
+- snapshots/<models--org--name>/<revision>/   model files
+- snapshots/<...>/<revision>/.manifest.json   per-file size and SHA-256, written last
+- staging/                                     in-progress fetches (same filesystem, so commits are renames)
+- locks/                                       one lock file per model, shared across workers
+
+A snapshot exists only once its manifest is written, so a crash mid-fetch
+never leaves a half-populated directory that looks complete.
+
+Jobs that find no snapshot are prefetch misses. By default they fetch inline
+(and report the miss in their metrics); with MODEL_STORE_REQUIRE_PREFETCH=1
+they fail fast instead of spending the job's time on a download.
+
+Usage:
+    python model_store.py prefetch mistralai/Mistral-7B-v0.1 [org/other@revision ...]
+    python model_store.py verify mistralai/Mistral-7B-v0.1 --deep
+    python model_store.py prefetch org/model --source-dir /models   # local stand-in for the hub
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import contextlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dataset_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.manifest.json'
+DEFAULT_REVISION = 'main'
+
+
+class ModelStoreError(Exception):
+    """Raised when a snapshot cannot be fetched or fails verification."""
+
+
+class PrefetchMissError(ModelStoreError):
+    """Raised when a snapshot is required to be prefetched but is not in the store."""
+
+
+class HuggingFaceSource:
+    """Fetches model repositories from the Hugging Face Hub."""
+
+    def __init__(self, token: Optional[str] = None):
+        self.token = token or os.environ.get('HF_TOKEN')
+
+    def download(self, model_id: str, revision: str, dest_dir: str) -> Optional[str]:
+        """
+        Download a repository snapshot into dest_dir.
+
+        Returns:
+            Resolved commit hash, if known
+        """
+        from huggingface_hub import HfApi, snapshot_download
+
+        # Real files, not symlinks into ~/.cache/huggingface that leave with the HF cache
+        snapshot_download(
+            repo_id=model_id,
+            revision=revision,
+            local_dir=dest_dir,
+            local_dir_use_symlinks=False,
+            token=self.token,
+        )
+        # snapshot_download's local_dir bookkeeping is not part of the model
+        shutil.rmtree(os.path.join(dest_dir, '.cache'), ignore_errors=True)
+        _dereference_symlinks(dest_dir)
+
+        try:
+            return HfApi(token=self.token).model_info(model_id, revision=revision).sha
+        except Exception:
+            return None
+
+
+class LocalDirSource:
+    """Serves model repositories from <root>/<model_id>/; stands in for the hub."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def download(self, model_id: str, revision: str, dest_dir: str) -> Optional[str]:
+        src = os.path.join(self.root, model_id)
+        if not os.path.isdir(src):
+            raise ModelStoreError(f"Model not found in {self.root}: {model_id}")
+        shutil.copytree(src, dest_dir, dirs_exist_ok=True)
+        return None
+
+
+def _dereference_symlinks(directory: str) -> None:
+    """Replace every symlink under directory with a copy of its target."""
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if os.path.islink(path):
+                target = os.path.realpath(path)
+                os.unlink(path)
+                shutil.copy2(target, path)
+
+
+def _safe_name(model_id: str) -> str:
+    return 'models--' + model_id.replace('/', '--')
+
+
+def build_manifest(snapshot_dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Hash every file under a snapshot directory.
+
+    Returns:
+        Mapping of relative path -> {'size', 'sha256'}
+    """
+    files = {}
+    for dirpath, _, filenames in os.walk(snapshot_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(path, snapshot_dir)
+            if rel_path == MANIFEST_NAME:
+                continue
+            files[rel_path] = {'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+    return files
+
+
+class ModelStore:
+    """Verified model snapshots on a shared volume."""
+
+    def __init__(self, root: str, source=None):
+        self.root = root
+        self.source = source or HuggingFaceSource()
+        self.snapshot_root = os.path.join(root, 'snapshots')
+        self.staging_dir = os.path.join(root, 'staging')
+        self.lock_dir = os.path.join(root, 'locks')
+        for path in (self.snapshot_root, self.staging_dir, self.lock_dir):
+            os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional['ModelStore']:
+        """
+        Build the store from MODEL_STORE_DIR (and MODEL_STORE_SOURCE_DIR for a local hub).
+
+        Returns:
+            ModelStore instance, or None when the store is not configured
+        """
+        root = os.environ.get('MODEL_STORE_DIR')
+        if not root:
+            return None
+
+        source_dir = os.environ.get('MODEL_STORE_SOURCE_DIR')
+        source = LocalDirSource(source_dir) if source_dir else None
+        try:
+            return cls(root, source)
+        except OSError as e:
+            logger.warning(f"Model store disabled - cannot use {root}: {e}")
+            return None
+
+    def snapshot_path(self, model_id: str, revision: str = DEFAULT_REVISION) -> str:
+        """Directory a snapshot lives in (whether or not it exists yet)."""
+        return os.path.join(self.snapshot_root, _safe_name(model_id), revision)
+
+    @contextlib.contextmanager
+    def _locked(self, model_id: str) -> Iterator[None]:
+        """Hold an exclusive per-model lock shared by every worker on the volume."""
+        lock_path = os.path.join(self.lock_dir, f"{_safe_name(model_id)}.lock")
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_manifest(self, model_id: str, revision: str = DEFAULT_REVISION) -> Optional[Dict[str, Any]]:
+        """Load a snapshot's manifest, or None if the snapshot is absent or unreadable."""
+        manifest_path = os.path.join(self.snapshot_path(model_id, revision), MANIFEST_NAME)
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def verify(self, model_id: str, revision: str = DEFAULT_REVISION, deep: bool = False) -> bool:
+        """
+        Check a snapshot against its manifest.
+
+        Args:
+            model_id: Hub model ID
+            revision: Branch, tag or commit the snapshot was fetched at
+            deep: Re-hash every file instead of only checking sizes
+
+        Returns:
+            True if every file is present and matches
+        """
+        manifest = self.read_manifest(model_id, revision)
+        if manifest is None:
+            return False
+
+        snapshot_dir = self.snapshot_path(model_id, revision)
+        for rel_path, entry in manifest['files'].items():
+            path = os.path.join(snapshot_dir, rel_path)
+            try:
+                if os.path.getsize(path) != entry['size']:
+                    logger.warning(f"Snapshot file has wrong size: {path}")
+                    return False
+            except OSError:
+                logger.warning(f"Snapshot file missing: {path}")
+                return False
+
+            if deep and file_sha256(path) != entry['sha256']:
+                logger.warning(f"Snapshot file checksum mismatch: {path}")
+                return False
+
+        return True
+
+    def resolve(self, model_id: str, revision: str = DEFAULT_REVISION) -> Optional[str]:
+        """
+        Return the local snapshot directory if a complete snapshot exists.
+
+        Only sizes are checked here; the full hash check runs at fetch time
+        and in `verify --deep`.
+        """
+        if self.verify(model_id, revision):
+            return self.snapshot_path(model_id, revision)
+        return None
+
+    def ensure(self, model_id: str, revision: str = DEFAULT_REVISION, fetch: bool = True) -> str:
+        """
+        Return a verified local snapshot, fetching it if needed.
+
+        Concurrent callers (other threads or workers on the same volume) wait
+        on the per-model lock and then reuse the snapshot the first one wrote.
+
+        Args:
+            model_id: Hub model ID
+            revision: Branch, tag or commit
+            fetch: Download a missing snapshot; when False, raise instead
+
+        Raises:
+            PrefetchMissError: If fetch is False and no snapshot exists once
+                any in-progress fetch has finished
+        """
+        path = self.resolve(model_id, revision)
+        if path:
+            return path
+
+        with self._locked(model_id):
+            path = self.resolve(model_id, revision)
+            if path:
+                return path
+            if not fetch:
+                raise PrefetchMissError(f"Model {model_id}@{revision} has not been prefetched to {self.root}")
+            return self._fetch(model_id, revision)
+
+    def _fetch(self, model_id: str, revision: str) -> str:
+        """Download into staging, hash, verify and move into place. Caller holds the lock."""
+        logger.info(f"Fetching model snapshot: {model_id}@{revision}")
+        start = time.time()
+        staging = tempfile.mkdtemp(dir=self.staging_dir, prefix=f"{_safe_name(model_id)}-")
+
+        try:
+            commit = self.source.download(model_id, revision, staging)
+            files = build_manifest(staging)
+            if not files:
+                raise ModelStoreError(f"Snapshot of {model_id}@{revision} is empty")
+
+            manifest = {
+                'model_id': model_id,
+                'revision': revision,
+                'commit': commit,
+                'fetched_at': time.time(),
+                'files': files,
+            }
+
+            target = self.snapshot_path(model_id, revision)
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(staging, target)
+
+            # The manifest marks the snapshot complete, so it goes in last
+            manifest_tmp = os.path.join(target, f"{MANIFEST_NAME}.tmp")
+            with open(manifest_tmp, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(manifest_tmp, os.path.join(target, MANIFEST_NAME))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        total_bytes = sum(entry['size'] for entry in files.values())
+        logger.info(
+            f"Model snapshot ready: {model_id}@{revision} ({len(files)} files, "
+            f"{total_bytes / 1024 ** 3:.2f}GB in {time.time() - start:.1f}s)"
+        )
+        return target
+
+
+def parse_model_list(value: str) -> List[str]:
+    """Split a comma-separated model list, accepting optional '@revision' suffixes."""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _split_revision(spec: str) -> Tuple[str, str]:
+    model_id, _, revision = spec.partition('@')
+    return model_id, revision or DEFAULT_REVISION
+
+
+def prefetch_models(store: ModelStore, specs: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Ensure a snapshot exists for each model spec ('org/name' or 'org/name@rev').
+
+    Returns:
+        Mapping of spec -> local path, or None if the fetch failed
+    """
+    results = {}
+    for spec in specs:
+        model_id, revision = _split_revision(spec)
+        try:
+            results[spec] = store.ensure(model_id, revision)
+        except Exception as e:
+            logger.error(f"Prefetch of {spec} failed: {e}")
+            results[spec] = None
+    return results
+
+
+def start_boot_prefetch() -> Optional[threading.Thread]:
+    """
+    Prefetch PREFETCH_MODELS on a daemon thread at worker boot.
+
+    Jobs that need one of these models meanwhile block on the per-model lock
+    instead of starting a second download.
+    """
+    specs = parse_model_list(os.environ.get('PREFETCH_MODELS', ''))
+    store = ModelStore.from_env() if specs else None
+    if store is None:
+        return None
+
+    logger.info(f"Prefetching models at boot: {', '.join(specs)}")
+    thread = threading.Thread(target=prefetch_models, args=(store, specs), name='model-prefetch', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local model snapshot store")
+    parser.add_argument('command', choices=['prefetch', 'verify'])
+    parser.add_argument('models', nargs='+', help="Model IDs, optionally suffixed with @revision")
+    parser.add_argument('--root', default=os.environ.get('MODEL_STORE_DIR'), help="Store root (default: MODEL_STORE_DIR)")
+    parser.add_argument('--source-dir', default=None, help="Serve models from a local directory instead of the hub")
+    parser.add_argument('--deep', action='store_true', help="verify: re-hash every file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if not args.root:
+        parser.error("--root or MODEL_STORE_DIR is required")
+
+    source = LocalDirSource(args.source_dir) if args.source_dir else None
+    store = ModelStore(args.root, source)
+
+    if args.command == 'prefetch':
+        results = prefetch_models(store, args.models)
+        failed = [spec for spec, path in results.items() if path is None]
+    else:
+        failed = [spec for spec in args.models if not store.verify(*_split_revision(spec), deep=args.deep)]
+        for spec in args.models:
+            print(f"{spec}: {'FAILED' if spec in failed else 'ok'}")
+
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Per-Stage Wall-Clock, Memory and I/O Profile
+
+train_lora_model runs as a fixed sequence of stages (download, parse,
+model wait, data preparation, training, save, archive upload). A
+StageProfiler is advanced with start(name) at each stage boundary and
+records, for every stage:
+
+- seconds           wall-clock duration
+- peak_rss_gb       the process's peak RSS during the stage (VmHWM is reset
+                    through /proc/self/clear_refs at each boundary; where
+                    that is not permitted, the larger of the RSS at start
+                    and end is used)
+- rss_end_gb        RSS when the stage ended
+- bytes_read /      bytes passed through read()/write() system calls
+  bytes_written     (files and sockets), from /proc/self/io
+- disk_read_bytes / bytes that actually reached storage
+  disk_write_bytes
+- payload_bytes     what the stage itself reports moving (add_bytes),
+                    e.g. the dataset or archive size
+
+Counters are process-wide, so background threads (such as the overlapping
+model load) are attributed to whichever stage is running. Worker
+processes (parallel parsing) are not included.
+
+Opt-in profiling of CPU-bound stages (STAGE_PROFILE_DIR):
+- STAGE_PROFILER=cprofile (default): a pstats file per stage (main thread
+  only), readable with pstats or snakeviz
+- STAGE_PROFILER=py-spy: `py-spy record --format speedscope` attached to
+  the process for the stage, covering native frames and every thread
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import time
+import signal
+import shutil
+import logging
+import cProfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('cprofile', 'py-spy')
+
+
+def _read_status_kb(field: str) -> float:
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return float(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _read_io() -> Dict[str, int]:
+    try:
+        with open('/proc/self/io', 'r') as f:
+            return {key: int(value) for key, value in (line.split(':', 1) for line in f if ':' in line)}
+    except (OSError, ValueError):
+        return {}
+
+
+def _reset_peak_rss() -> bool:
+    """Reset VmHWM to the current RSS; False where the kernel does not allow it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StageProfiler:
+    """
+    Sequential stage timer; start() ends the previous stage.
+
+    Args:
+        job_id: Job identifier, used in profile file names
+        profile_dir: Where to write profiles of CPU-bound stages (default: STAGE_PROFILE_DIR; unset disables)
+        profiler: 'cprofile' or 'py-spy' (default: STAGE_PROFILER or cprofile)
+    """
+
+    def __init__(self, job_id: str, profile_dir: Optional[str] = None, profiler: Optional[str] = None):
+        self.job_id = job_id
+        self.profile_dir = profile_dir or os.environ.get('STAGE_PROFILE_DIR')
+        self.profiler = profiler or os.environ.get('STAGE_PROFILER', 'cprofile')
+        if self.profiler not in PROFILERS:
+            raise ValueError(f"STAGE_PROFILER must be one of {', '.join(PROFILERS)}")
+        if self.profiler == 'py-spy' and self.profile_dir and not shutil.which('py-spy'):
+            logger.warning("py-spy not found - falling back to cProfile for stage profiles")
+            self.profiler = 'cprofile'
+
+        self.stages: List[Dict[str, Any]] = []
+        self.current: Optional[Dict[str, Any]] = None
+        self._active_profile = None
+
+    def start(self, name: str, cpu_bound: bool = False) -> None:
+        """
+        End the current stage (if any) and start the next.
+
+        Args:
+            name: Stage name
+            cpu_bound: Profile this stage when STAGE_PROFILE_DIR is set
+        """
+        self.finish()
+        hwm_reset = _reset_peak_rss()
+        self.current = {
+            'name': name,
+            'start': time.perf_counter(),
+            'rss_start': _read_status_kb('VmRSS'),
+            'io_start': _read_io(),
+            'hwm_reset': hwm_reset,
+            'payload_bytes': 0,
+        }
+        if cpu_bound and self.profile_dir:
+            self._start_profile(name)
+
+    def add_bytes(self, count: int) -> None:
+        """Credit the current stage with bytes it moved (downloaded, written, uploaded)."""
+        if self.current is not None:
+            self.current['payload_bytes'] += int(count)
+
+    def finish(self) -> None:
+        """End the current stage."""
+        stage = self.current
+        if stage is None:
+            return
+        self.current = None
+
+        profile_path = self._stop_profile() if self._active_profile else None
+        seconds = time.perf_counter() - stage['start']
+        rss_end = _read_status_kb('VmRSS')
+        peak = _read_status_kb('VmHWM') if stage['hwm_reset'] else max(stage['rss_start'], rss_end)
+        io_end = _read_io()
+
+        def delta(key: str) -> int:
+            return io_end.get(key, 0) - stage['io_start'].get(key, 0)
+
+        record = {
+            'name': stage['name'],
+            'seconds': round(seconds, 3),
+            'peak_rss_gb': round(peak / 1024 ** 3, 3),
+            'rss_end_gb': round(rss_end / 1024 ** 3, 3),
+            'bytes_read': delta('rchar'),
+            'bytes_written': delta('wchar'),
+            'disk_read_bytes': delta('read_bytes'),
+            'disk_write_bytes': delta('write_bytes'),
+            'payload_bytes': stage['payload_bytes'],
+        }
+        if profile_path:
+            record['profile'] = profile_path
+        self.stages.append(record)
+
+    def report(self) -> Dict[str, Any]:
+        """Stages recorded so far (the current one is ended first)."""
+        self.finish()
+        return {
+            'stages': list(self.stages),
+            'total_seconds': round(sum(stage['seconds'] for stage in self.stages), 3),
+        }
+
+    def log(self) -> None:
+        """Log a one-line summary per stage."""
+        for stage in self.stages:
+            logger.info(
+                f"  - {stage['name']:<16} {stage['seconds']:>9.1f}s  peak RSS {stage['peak_rss_gb']:.2f}GB  "
+                f"read {stage['bytes_read'] / 1024 ** 2:.1f}MB  written {stage['bytes_written'] / 1024 ** 2:.1f}MB"
+            )
+
+    def _profile_path(self, name: str, extension: str) -> str:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        return os.path.join(self.profile_dir, f"{self.job_id}-{len(self.stages):02d}-{name}.{extension}")
+
+    def _start_profile(self, name: str) -> None:
+        try:
+            if self.profiler == 'py-spy':
+                path = self._profile_path(name, 'speedscope.json')
+                process = subprocess.Popen(
+                    ['py-spy', 'record', '--pid', str(os.getpid()), '--format', 'speedscope',
+                     '--output', path, '--threads', '--nonblocking'],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                self._active_profile = ('py-spy', process, path)
+            else:
+                profile = cProfile.Profile()
+                profile.enable()
+                self._active_profile = ('cprofile', profile, self._profile_path(name, 'prof'))
+        except Exception as e:
+            logger.warning(f"Stage profiling of {name} not started: {e}")
+            self._active_profile = None
+
+    def _stop_profile(self) -> Optional[str]:
+        kind, handle, path = self._active_profile
+        self._active_profile = None
+        try:
+            if kind == 'py-spy':
+                # py-spy writes its output when interrupted
+                handle.send_signal(signal.SIGINT)
+                handle.wait(timeout=30)
+            else:
+                handle.disable()
+                handle.dump_stats(path)
+        except Exception as e:
+            logger.warning(f"Stage profile not written to {path}: {e}")
+            return None
+        logger.info(f"Stage profile written: {path}")
+        return path
+
+
+def combine_stage_profiles(*profiles: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Concatenate stage reports (e.g. the training job's and the handler's upload)."""
+    stages = [stage for profile in profiles if profile for stage in profile['stages']]
+    return {
+        'stages': stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in stages), 3),
+    }
@@ -0,0 +1,116 @@
+"""
+Worker Startup Profiling and Background Preloading
+
+Serverless cold start is billed, so handler.py imports only what it needs
+to accept jobs and leaves torch / transformers / peft / datasets /
+supabase to a preload thread started at boot. StartupProfile records how
+long each of those imports took and when the worker became ready, and
+logs the report once preloading finishes.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import time
+import logging
+import importlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Heavy modules warmed at boot, in dependency order so each timing is incremental
+PRELOAD_MODULES = (
+    'torch',
+    'transformers',
+    'datasets',
+    'peft',
+    'bitsandbytes',
+    'supabase',
+    'train_lora',
+)
+
+
+class StartupProfile:
+    """Import timings and readiness milestones for one worker process."""
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = start if start is not None else time.perf_counter()
+        self.imports: "OrderedDict[str, float]" = OrderedDict()
+        self.failed: Dict[str, str] = {}
+        self.marks: "OrderedDict[str, float]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def timed_import(self, name: str) -> Any:
+        """Import a module and record how long it took."""
+        start = time.perf_counter()
+        try:
+            return importlib.import_module(name)
+        finally:
+            with self.lock:
+                self.imports[name] = time.perf_counter() - start
+
+    def mark(self, label: str) -> float:
+        """Record a milestone as seconds since process start."""
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            self.marks[label] = elapsed
+        return elapsed
+
+    def report(self) -> Dict[str, Any]:
+        """Snapshot of the profile as plain data."""
+        with self.lock:
+            return {
+                'imports_seconds': {name: round(t, 3) for name, t in self.imports.items()},
+                'failed_imports': dict(self.failed),
+                'milestones_seconds': {label: round(t, 3) for label, t in self.marks.items()},
+            }
+
+    def log(self, title: str = "Startup profile") -> None:
+        """Emit the profile as an aligned log block, slowest imports first."""
+        report = self.report()
+        logger.info("=" * 60)
+        logger.info(f"{title}:")
+        for name, seconds in sorted(report['imports_seconds'].items(), key=lambda item: -item[1]):
+            suffix = " (failed)" if name in report['failed_imports'] else ""
+            logger.info(f"  - import {name:<14} {seconds:7.3f}s{suffix}")
+        for label, seconds in report['milestones_seconds'].items():
+            logger.info(f"  - {label:<21} {seconds:7.3f}s")
+        logger.info("=" * 60)
+
+
+class Preloader:
+    """Imports heavy modules on a daemon thread so the first job finds them warm."""
+
+    def __init__(self, profile: StartupProfile, modules: Iterable[str] = PRELOAD_MODULES):
+        self.profile = profile
+        self.modules = tuple(modules)
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start preloading unless PRELOAD_ON_BOOT=0."""
+        if os.environ.get('PRELOAD_ON_BOOT', '1') == '0':
+            logger.info("Boot preload disabled (PRELOAD_ON_BOOT=0)")
+            return
+
+        self.thread = threading.Thread(target=self._run, name='preload', daemon=True)
+        self.thread.start()
+
+    def wait(self) -> None:
+        """Block until preloading has finished (no-op if it never started)."""
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self) -> None:
+        for name in self.modules:
+            try:
+                self.profile.timed_import(name)
+            except Exception as e:
+                # The job path re-imports and reports the real error
+                self.profile.failed[name] = str(e)
+                logger.warning(f"Preload of {name} failed: {e}")
+
+        self.profile.mark('preload_complete')
+        self.profile.log("Startup profile (preload complete)")
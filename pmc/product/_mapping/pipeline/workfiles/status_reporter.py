@@ -0,0 +1,253 @@
+"""
+Asynchronous, Coalescing Status Reporting
+
+ProgressCallback reports on every optimizer step. Calling the
+StatusManager synchronously puts a database round trip on the training
+loop's critical path. AsyncStatusReporter wraps any status manager and
+has the same update_status / get_status interface. update_status only
+merges the update into local state and returns. A background thread
+delivers the newest merged state:
+
+- every STATUS_FLUSH_SECONDS (default 5) or STATUS_FLUSH_STEPS optimizer
+  steps (default 50), whichever comes first
+- immediately when the status or stage changes, so transitions are never
+  coalesced away (the update before the change is delivered first)
+- on flush() / close(), so callers can order later direct updates after it
+
+Pending updates sit in a bounded queue (STATUS_QUEUE_SIZE). Consecutive
+updates within one stage are merged into the queue's tail, so the queue
+only grows with stage changes. If the queue is ever full, the oldest
+pending update that has a later update for the same job is folded into
+it, so every job keeps its newest state. When every pending update belongs
+to a different job, the oldest non-terminal one is dropped instead, and
+that job's full merged state is resent with its next update (or on flush).
+Terminal updates (completed / failed) are never dropped. The caller never
+blocks.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 5.0
+DEFAULT_FLUSH_STEPS = 50
+DEFAULT_QUEUE_SIZE = 64
+
+# Statuses after which a job sends no further updates
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+def _merge(target: Dict[str, Any], update: Dict[str, Any]) -> None:
+    """Merge an update_status call into accumulated kwargs (metrics are merged key by key)."""
+    for key, value in update.items():
+        if key == 'metrics':
+            target.setdefault('metrics', {}).update(value or {})
+        else:
+            target[key] = value
+
+
+class AsyncStatusReporter:
+    """
+    Status manager wrapper that delivers updates from a background thread.
+
+    Args:
+        status_manager: Underlying status manager (update_status / get_status)
+        flush_seconds: Longest time an update waits before delivery
+        flush_steps: Deliver once current_step advanced this far (0 disables)
+        max_pending: Bound on queued, not yet delivered updates
+    """
+
+    def __init__(
+        self,
+        status_manager,
+        flush_seconds: Optional[float] = None,
+        flush_steps: Optional[int] = None,
+        max_pending: Optional[int] = None
+    ):
+        self.status_manager = status_manager
+        self.flush_seconds = flush_seconds if flush_seconds is not None else float(
+            os.environ.get('STATUS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+        )
+        self.flush_steps = flush_steps if flush_steps is not None else int(
+            os.environ.get('STATUS_FLUSH_STEPS', DEFAULT_FLUSH_STEPS)
+        )
+        self.max_pending = max_pending or int(os.environ.get('STATUS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.pending: Deque[Dict[str, Any]] = deque()
+        self.condition = threading.Condition()
+        self.urgent = False
+        self.in_flight = False
+        self.closed = False
+        self.last_flush = time.monotonic()
+        self.last_flushed_step: Dict[str, int] = {}
+        # Jobs whose pending update was dropped; their next entry carries the full state
+        self.resync: Set[str] = set()
+        self.stats = {'updates': 0, 'delivered': 0, 'coalesced': 0, 'dropped': 0, 'errors': 0}
+
+        self.thread = threading.Thread(target=self._run, name='status-reporter', daemon=True)
+        self.thread.start()
+
+    def update_status(self, job_id: str, **kwargs) -> None:
+        """Record an update and return immediately; delivery happens in the background."""
+        with self.condition:
+            if self.closed:
+                self.status_manager.update_status(job_id=job_id, **kwargs)
+                return
+
+            self.stats['updates'] += 1
+            state = self.state.setdefault(job_id, {'metrics': {}})
+            transition = any(
+                key in kwargs and kwargs[key] != state.get(key)
+                for key in ('status', 'stage')
+            )
+            _merge(state, kwargs)
+
+            tail = self.pending[-1] if self.pending else None
+            if tail is not None and tail['job_id'] == job_id and not transition:
+                _merge(tail, kwargs)
+                self.stats['coalesced'] += 1
+            else:
+                entry = {'job_id': job_id}
+                if job_id in self.resync:
+                    self.resync.discard(job_id)
+                    _merge(entry, state)
+                else:
+                    _merge(entry, kwargs)
+                self.pending.append(entry)
+                if len(self.pending) == 1:
+                    # The thread sleeps without a deadline while nothing is pending
+                    self.condition.notify()
+                if len(self.pending) > self.max_pending:
+                    # Fold rather than block; drop only when no job has two pending updates
+                    if not self._fold_oldest():
+                        self._drop_oldest()
+
+            step = kwargs.get('current_step')
+            due_by_steps = (
+                self.flush_steps > 0 and step is not None
+                and step - self.last_flushed_step.get(job_id, 0) >= self.flush_steps
+            )
+            if transition or due_by_steps or 'error_message' in kwargs:
+                self.urgent = True
+                self.condition.notify()
+
+    def _fold_oldest(self) -> bool:
+        """Fold the oldest update into that job's next pending one. Caller holds the lock."""
+        for index, older in enumerate(self.pending):
+            for later_index in range(index + 1, len(self.pending)):
+                later = self.pending[later_index]
+                if later['job_id'] == older['job_id']:
+                    _merge(older, later)
+                    self.pending[later_index] = older
+                    del self.pending[index]
+                    self.stats['coalesced'] += 1
+                    return True
+        return False
+
+    def _drop_oldest(self) -> bool:
+        """Drop the oldest non-terminal update and mark its job for a resync. Caller holds the lock."""
+        for index, entry in enumerate(self.pending):
+            if entry.get('status') not in TERMINAL_STATUSES:
+                del self.pending[index]
+                self.resync.add(entry['job_id'])
+                self.stats['dropped'] += 1
+                return True
+        return False
+
+    def _queue_resyncs(self) -> None:
+        """Queue the full state of every job that lost an update. Caller holds the lock."""
+        for job_id in sorted(self.resync):
+            entry = {'job_id': job_id}
+            _merge(entry, self.state[job_id])
+            self.pending.append(entry)
+        self.resync.clear()
+
+    def get_status(self, job_id: str) -> Dict[str, Any]:
+        """Latest merged state for a job, including updates not yet delivered."""
+        with self.condition:
+            if job_id in self.state:
+                return {**self.state[job_id], 'metrics': dict(self.state[job_id]['metrics'])}
+        return self.status_manager.get_status(job_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Deliver everything pending and wait for it.
+
+        Returns:
+            True if all updates were delivered within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self._queue_resyncs()
+            self.urgent = True
+            self.condition.notify()
+            while (self.pending or self.in_flight) and self.thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush pending updates and stop the thread; later updates are sent synchronously."""
+        with self.condition:
+            if self.closed:
+                return
+        self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(timeout)
+        logger.info(
+            f"Status reporter: {self.stats['updates']} updates, {self.stats['delivered']} delivered, "
+            f"{self.stats['coalesced']} coalesced, {self.stats['dropped']} dropped, {self.stats['errors']} failed"
+        )
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.closed:
+                    if self.pending and (
+                        self.urgent or time.monotonic() - self.last_flush >= self.flush_seconds
+                    ):
+                        break
+                    timeout = self.flush_seconds - (time.monotonic() - self.last_flush) if self.pending else None
+                    self.condition.wait(timeout if timeout is None else max(timeout, 0.0))
+
+                if self.closed and not self.pending:
+                    return
+
+                batch = list(self.pending)
+                self.pending.clear()
+                self.urgent = False
+                self.in_flight = True
+                self.last_flush = time.monotonic()
+
+            delivered = errors = 0
+            flushed_steps: Dict[str, int] = {}
+            for update in batch:
+                job_id = update.pop('job_id')
+                try:
+                    self.status_manager.update_status(job_id=job_id, **update)
+                    delivered += 1
+                except Exception as e:
+                    errors += 1
+                    logger.warning(f"Status update for {job_id} failed: {e}")
+                if update.get('current_step') is not None:
+                    flushed_steps[job_id] = update['current_step']
+
+            with self.condition:
+                self.stats['delivered'] += delivered
+                self.stats['errors'] += errors
+                self.last_flushed_step.update(flushed_steps)
+                self.in_flight = False
+                self.condition.notify_all()
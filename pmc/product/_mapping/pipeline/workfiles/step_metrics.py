@@ -0,0 +1,341 @@
+"""
+Token Throughput and Step-Time Instrumentation
+
+StepMetricsCallback measures the training loop in units that compare
+across jobs:
+
+- tokens/sec counts real tokens only: attention_mask.sum() for padded
+  batches, every token for packed rows (which carry no padding). Samples
+  are batch rows, or conversations (position_ids == 0) when packed.
+  Counts are accumulated on the batch's device without .item(), so they
+  never force a GPU sync on the step path; the totals are only
+  materialized when snapshot() is read.
+- step time is split into phases, each kept as a histogram:
+  data (waiting for the next batch), forward_backward (training_step),
+  optimizer (optimizer.step, via optimizer hooks) and step (wall time
+  per optimizer step). CUDA work is asynchronous, so without
+  STEP_TIMING_SYNC=1 the phases are host-side times; setting it syncs
+  after forward/backward and the optimizer for exact GPU phase times.
+- memory high-water marks from the CUDA caching allocator.
+
+Rates are measured from on_train_begin, so model loading and data
+preparation are not counted. In distributed runs the numbers are rank 0's.
+
+start_metrics_server exposes any metrics source on METRICS_PORT while the
+job runs: /metrics in Prometheus text format and /metrics.json as JSON.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from transformers import TrainerCallback
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('data', 'forward_backward', 'optimizer', 'step')
+
+# Histogram bucket upper bounds in seconds (Prometheus convention)
+BUCKET_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = 'lora_'
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = next((i for i, bound in enumerate(self.bounds) if seconds <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        cumulative, buckets = 0, {}
+        for bound, count in zip(list(self.bounds) + ['+Inf'], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'sum_seconds': self.sum,
+            'mean_ms': self.sum * 1000 / self.count if self.count else 0.0,
+            'max_ms': self.max * 1000,
+            'buckets': buckets,
+        }
+
+
+def count_batch(inputs: Dict[str, Any]):
+    """
+    Real tokens and samples in a batch, without synchronizing the device.
+
+    Returns:
+        (tokens, samples), each an int or a 0-dim tensor on the batch's device
+    """
+    attention_mask = inputs.get('attention_mask')
+    input_ids = inputs['input_ids']
+    tokens = attention_mask.sum() if attention_mask is not None else input_ids.numel()
+
+    position_ids = inputs.get('position_ids')
+    if attention_mask is None and position_ids is not None:
+        samples = (position_ids == 0).sum()
+    else:
+        samples = input_ids.shape[0]
+    return tokens, samples
+
+
+def _as_number(value) -> float:
+    return float(value.item()) if isinstance(value, torch.Tensor) else float(value)
+
+
+class StepMetricsCallback(TrainerCallback):
+    """
+    Tracks tokens, samples and per-phase step times.
+
+    Call attach(trainer) after building the Trainer so training_step can be
+    timed; put the callback last so the time spent in other callbacks,
+    logging and checkpointing is not counted as data loading.
+    """
+
+    def __init__(self, sync_cuda: Optional[bool] = None):
+        if sync_cuda is None:
+            sync_cuda = os.environ.get('STEP_TIMING_SYNC', '').lower() in ('1', 'true', 'yes')
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.histograms = {phase: Histogram() for phase in PHASES}
+        self.lock = threading.Lock()
+        self.trainer = None
+        self.hooks: List[Any] = []
+        self.tokens: Any = 0
+        self.samples: Any = 0
+        self.steps = 0
+        self.train_start: Optional[float] = None
+        self.marker: Optional[float] = None
+        self.step_start: Optional[float] = None
+        self.optimizer_start: Optional[float] = None
+        self.pending = {'data': 0.0, 'forward_backward': 0.0, 'optimizer': 0.0}
+
+    def attach(self, trainer) -> None:
+        """Time the trainer's training_step (one forward/backward per micro-batch)."""
+        self.trainer = trainer
+        original = trainer.training_step
+
+        def timed_training_step(model, inputs):
+            start = time.perf_counter()
+            if self.marker is not None:
+                self.pending['data'] += start - self.marker
+
+            loss = original(model, inputs)
+
+            if self.sync_cuda:
+                torch.cuda.synchronize()
+            end = time.perf_counter()
+            tokens, samples = count_batch(inputs)
+            with self.lock:
+                # Rebinding rather than += keeps snapshot() reads consistent
+                self.tokens = self.tokens + tokens
+                self.samples = self.samples + samples
+            self.pending['forward_backward'] += end - start
+            self.marker = end
+            return loss
+
+        trainer.training_step = timed_training_step
+
+    def detach(self) -> None:
+        """Remove the optimizer hooks and restore training_step."""
+        for hook in self.hooks:
+            hook.remove()
+        self.hooks = []
+        if self.trainer is not None:
+            self.trainer.__dict__.pop('training_step', None)
+            self.trainer = None
+
+    def _optimizer_pre_hook(self, optimizer, args, kwargs) -> None:
+        self.optimizer_start = time.perf_counter()
+
+    def _optimizer_post_hook(self, optimizer, args, kwargs) -> None:
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+        end = time.perf_counter()
+        if self.optimizer_start is not None:
+            self.pending['optimizer'] += end - self.optimizer_start
+        self.marker = end
+
+    def on_train_begin(self, args, state, control, optimizer=None, **kwargs):
+        """Start the clock and hook the optimizer the Trainer just created."""
+        if optimizer is not None and not self.hooks:
+            # Accelerate wraps the optimizer; the inner one runs the hooks
+            inner = getattr(optimizer, 'optimizer', optimizer)
+            self.hooks = [
+                inner.register_step_pre_hook(self._optimizer_pre_hook),
+                inner.register_step_post_hook(self._optimizer_post_hook),
+            ]
+        self.train_start = self.step_start = self.marker = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        """Record one optimizer step's phase times."""
+        now = time.perf_counter()
+        with self.lock:
+            for phase, seconds in self.pending.items():
+                self.histograms[phase].observe(seconds)
+            if self.step_start is not None:
+                self.histograms['step'].observe(now - self.step_start)
+            self.steps += 1
+        self.pending = {phase: 0.0 for phase in self.pending}
+        self.step_start = self.marker = now
+
+    def _mark(self) -> None:
+        # Logging, evaluation and saving happen between steps; restart the data clock after them
+        self.marker = time.perf_counter()
+        self.step_start = self.marker
+
+    def on_log(self, args, state, control, **kwargs):
+        self._mark()
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        self._mark()
+
+    def on_save(self, args, state, control, **kwargs):
+        self._mark()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current throughput, phase histograms and memory high-water marks."""
+        with self.lock:
+            tokens, samples, steps = self.tokens, self.samples, self.steps
+            histograms = {phase: histogram.to_dict() for phase, histogram in self.histograms.items()}
+
+        elapsed = time.perf_counter() - self.train_start if self.train_start else 0.0
+        tokens, samples = _as_number(tokens), _as_number(samples)
+        metrics: Dict[str, Any] = {
+            'train_tokens': int(tokens),
+            'train_samples': int(samples),
+            'optimizer_steps': steps,
+            'train_seconds': elapsed,
+            'tokens_per_second': tokens / elapsed if elapsed > 0 else 0.0,
+            'samples_per_second': samples / elapsed if elapsed > 0 else 0.0,
+            'step_time_ms': {phase: h['mean_ms'] for phase, h in histograms.items()},
+            'step_phase_histograms': histograms,
+        }
+        if torch.cuda.is_available():
+            metrics.update({
+                'cuda_max_memory_allocated_gb': torch.cuda.max_memory_allocated() / 1024 ** 3,
+                'cuda_max_memory_reserved_gb': torch.cuda.max_memory_reserved() / 1024 ** 3,
+            })
+        return metrics
+
+
+def _prometheus_name(name: str) -> str:
+    return METRIC_PREFIX + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def render_prometheus(metrics: Dict[str, Any]) -> str:
+    """
+    Render a metrics dict in the Prometheus text exposition format.
+
+    Numbers become gauges, 'step_phase_histograms' becomes one histogram
+    with a phase label, and 'gpus' entries are labelled by device index.
+    Other nested values are skipped.
+    """
+    lines = []
+    for key, value in metrics.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = _prometheus_name(key)
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+
+    for device in metrics.get('gpus', []):
+        for key, value in device.items():
+            # Readings the device does not support are None
+            if key != 'index' and isinstance(value, (int, float)):
+                lines.append(f'{_prometheus_name("gpu_" + key)}{{gpu="{device["index"]}"}} {value}')
+
+    histograms = metrics.get('step_phase_histograms', {})
+    if histograms:
+        name = _prometheus_name('step_phase_seconds')
+        lines.append(f"# TYPE {name} histogram")
+        for phase, histogram in histograms.items():
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'{name}_bucket{{phase="{phase}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{phase="{phase}"}} {histogram["sum_seconds"]}')
+            lines.append(f'{name}_count{{phase="{phase}"}} {histogram["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves a metrics source over HTTP on a daemon thread."""
+
+    def __init__(self, source: Callable[[], Dict[str, Any]], port: int, host: str = '127.0.0.1'):
+        self.source = source
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path not in ('/metrics', '/metrics.json'):
+                    self.send_error(404)
+                    return
+                try:
+                    metrics = server.source()
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                if path == '/metrics.json':
+                    body = json.dumps(metrics, default=str).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    body = render_prometheus(metrics).encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_metrics_server(source: Callable[[], Dict[str, Any]]) -> Optional[MetricsServer]:
+    """
+    Serve `source` on METRICS_PORT (bound to METRICS_HOST, default 127.0.0.1).
+
+    Returns:
+        MetricsServer, or None when METRICS_PORT is not set or the port is unavailable
+    """
+    port = os.environ.get('METRICS_PORT')
+    if not port:
+        return None
+    host = os.environ.get('METRICS_HOST', '127.0.0.1')
+    try:
+        server = MetricsServer(source, int(port), host)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint disabled - cannot bind {host}:{port}: {e}")
+        return None
+    logger.info(f"Serving training metrics on http://{host}:{server.port}/metrics (and /metrics.json)")
+    return server
@@ -0,0 +1,405 @@
+"""
+In-Process GPU and Host Telemetry
+
+A background thread samples every GPU and the host at a fixed rate
+(TELEMETRY_INTERVAL_SECONDS, default 1s) into a ring buffer of
+TELEMETRY_BUFFER_SIZE samples. Readers never touch the devices. They
+aggregate buffered samples instead: report() returns mean/max values since
+the previous report(), and summary() covers the whole buffer.
+
+GPU backends (TELEMETRY_BACKEND):
+- nvml        NVML via pynvml (nvidia-ml-py), polled in-process
+- nvidia-smi  one nvidia-smi query per interval for all devices; the
+              fallback when pynvml is not installed
+- fake        FakeBackend with scripted values, for machines without GPUs
+- none        host metrics only
+Without TELEMETRY_BACKEND the first available of nvml and nvidia-smi is
+used.
+
+Per GPU: utilization, memory used (and the peak seen), temperature, power.
+A reading the device does not support is None and left out of aggregates.
+Host: CPU utilization, process RSS, and process disk read/write rates
+(from /proc).
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_SECONDS = 1.0
+DEFAULT_BUFFER_SIZE = 600
+
+
+class NvmlBackend:
+    """Reads every visible GPU through NVML."""
+
+    name = 'nvml'
+
+    def __init__(self):
+        import pynvml
+
+        pynvml.nvmlInit()
+        self.nvml = pynvml
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+        self.unsupported = set()
+
+    def _read(self, field: str, read) -> Optional[float]:
+        """One optional reading; None if the device does not support it."""
+        try:
+            return float(read())
+        except self.nvml.NVMLError as e:
+            if field not in self.unsupported:
+                self.unsupported.add(field)
+                logger.info(f"NVML {field} reading unavailable, reporting without it: {e}")
+            return None
+
+    def sample(self) -> List[Dict[str, Optional[float]]]:
+        samples = []
+        for handle in self.handles:
+            memory = self.nvml.nvmlDeviceGetMemoryInfo(handle)
+            samples.append({
+                'utilization': self._read('utilization', lambda: self.nvml.nvmlDeviceGetUtilizationRates(handle).gpu),
+                'memory_used': float(memory.used),
+                'memory_total': float(memory.total),
+                'temperature': self._read(
+                    'temperature', lambda: self.nvml.nvmlDeviceGetTemperature(handle, self.nvml.NVML_TEMPERATURE_GPU)
+                ),
+                'power_watts': self._read('power', lambda: self.nvml.nvmlDeviceGetPowerUsage(handle) / 1000.0),
+            })
+        return samples
+
+    def close(self) -> None:
+        self.nvml.nvmlShutdown()
+
+
+class NvidiaSmiBackend:
+    """Reads every visible GPU with one nvidia-smi query per sample."""
+
+    name = 'nvidia-smi'
+    QUERY = 'utilization.gpu,memory.used,memory.total,temperature.gpu,power.draw'
+
+    def __init__(self):
+        if not shutil.which('nvidia-smi'):
+            raise RuntimeError("nvidia-smi not found")
+
+    def sample(self) -> List[Dict[str, Optional[float]]]:
+        result = subprocess.run(
+            ['nvidia-smi', f'--query-gpu={self.QUERY}', '--format=csv,noheader,nounits'],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"nvidia-smi exited with {result.returncode}")
+
+        samples = []
+        for line in result.stdout.strip().splitlines():
+            values = [_parse_float(value) for value in line.split(',')]
+            samples.append({
+                'utilization': values[0],
+                'memory_used': (values[1] or 0.0) * 1024 ** 2,
+                'memory_total': (values[2] or 0.0) * 1024 ** 2,
+                'temperature': values[3],
+                'power_watts': values[4],
+            })
+        return samples
+
+    def close(self) -> None:
+        pass
+
+
+class FakeBackend:
+    """
+    Scripted GPU readings for tests and machines without GPUs.
+
+    Each sample() returns the next entry of `script` (a list of per-device
+    readings), repeating the last one; set `devices` directly to change the
+    readings between samples.
+    """
+
+    name = 'fake'
+
+    def __init__(self, device_count: int = 1, script: Optional[List[List[Dict[str, float]]]] = None):
+        self.script = list(script or [])
+        self.devices = [
+            {'utilization': 0.0, 'memory_used': 0.0, 'memory_total': 24 * 1024 ** 3, 'temperature': 40.0, 'power_watts': 50.0}
+            for _ in range(device_count)
+        ]
+
+    def sample(self) -> List[Dict[str, float]]:
+        if self.script:
+            self.devices = self.script.pop(0)
+        return [dict(device) for device in self.devices]
+
+    def close(self) -> None:
+        pass
+
+
+BACKENDS = {
+    'nvml': NvmlBackend,
+    'nvidia-smi': NvidiaSmiBackend,
+    'fake': FakeBackend,
+}
+
+
+def _parse_float(value: str) -> Optional[float]:
+    try:
+        return float(value.strip())
+    except ValueError:
+        return None  # "[N/A]" on devices without a sensor
+
+
+def create_backend(name: Optional[str] = None):
+    """
+    Build the GPU backend named by `name` or TELEMETRY_BACKEND.
+
+    Returns:
+        Backend instance, or None for host-only telemetry
+    """
+    name = name or os.environ.get('TELEMETRY_BACKEND')
+    if name == 'none':
+        return None
+    if name:
+        return BACKENDS[name]()
+
+    for candidate in ('nvml', 'nvidia-smi'):
+        try:
+            return BACKENDS[candidate]()
+        except Exception as e:
+            logger.debug(f"Telemetry backend {candidate} unavailable: {e}")
+    logger.info("No GPU telemetry backend available - sampling host metrics only")
+    return None
+
+
+class HostSampler:
+    """Host CPU utilization and this process's RSS and disk I/O, read from /proc."""
+
+    def __init__(self):
+        self.previous_cpu = self._cpu_times()
+        self.previous_io = self._io_bytes()
+        self.previous_time = time.monotonic()
+
+    @staticmethod
+    def _cpu_times() -> Optional[tuple]:
+        try:
+            with open('/proc/stat', 'r') as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle = values[3] + (values[4] if len(values) > 4 else 0)
+        return sum(values), idle
+
+    @staticmethod
+    def _io_bytes() -> Optional[tuple]:
+        try:
+            with open('/proc/self/io', 'r') as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+            return int(fields['read_bytes']), int(fields['write_bytes'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _rss_bytes() -> float:
+        try:
+            with open('/proc/self/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return float(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def sample(self) -> Dict[str, float]:
+        now = time.monotonic()
+        elapsed = max(now - self.previous_time, 1e-6)
+        cpu, io = self._cpu_times(), self._io_bytes()
+
+        cpu_percent = 0.0
+        if cpu and self.previous_cpu and cpu[0] > self.previous_cpu[0]:
+            total = cpu[0] - self.previous_cpu[0]
+            cpu_percent = 100.0 * (1 - (cpu[1] - self.previous_cpu[1]) / total)
+
+        read_rate = write_rate = 0.0
+        if io and self.previous_io:
+            read_rate = (io[0] - self.previous_io[0]) / elapsed
+            write_rate = (io[1] - self.previous_io[1]) / elapsed
+
+        self.previous_cpu, self.previous_io, self.previous_time = cpu, io, now
+        return {
+            'cpu_percent': cpu_percent,
+            'rss_bytes': self._rss_bytes(),
+            'disk_read_bytes_per_s': read_rate,
+            'disk_write_bytes_per_s': write_rate,
+        }
+
+
+def _mean(values: List[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def _present(values) -> List[float]:
+    """Drop readings a device did not support."""
+    return [v for v in values if v is not None]
+
+
+def _mean_or_none(values: List[float]) -> Optional[float]:
+    return _mean(values) if values else None
+
+
+def _max_or_none(values: List[float]) -> Optional[float]:
+    return max(values) if values else None
+
+
+class TelemetrySampler:
+    """
+    Samples GPUs and the host on a background thread into a ring buffer.
+
+    Args:
+        backend: GPU backend, or None for host metrics only
+        interval: Seconds between samples (default: TELEMETRY_INTERVAL_SECONDS)
+        capacity: Samples kept (default: TELEMETRY_BUFFER_SIZE)
+    """
+
+    def __init__(self, backend=None, interval: Optional[float] = None, capacity: Optional[int] = None):
+        self.backend = backend
+        self.interval = interval or float(os.environ.get('TELEMETRY_INTERVAL_SECONDS', DEFAULT_INTERVAL_SECONDS))
+        capacity = capacity or int(os.environ.get('TELEMETRY_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
+
+        self.host = HostSampler()
+        self.buffer: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.sequence = 0
+        self.reported_sequence = 0
+        self.peak_memory: List[float] = []
+        self.peak_rss = 0.0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls) -> 'TelemetrySampler':
+        """Build a sampler with the GPU backend chosen by create_backend()."""
+        return cls(create_backend())
+
+    @property
+    def backend_name(self) -> str:
+        return self.backend.name if self.backend else 'none'
+
+    def start(self) -> 'TelemetrySampler':
+        """Take a first sample and start the sampling thread."""
+        self.sample_once()
+        self.thread = threading.Thread(target=self._run, name='telemetry', daemon=True)
+        self.thread.start()
+        logger.info(f"Telemetry sampling every {self.interval:g}s (GPU backend: {self.backend_name})")
+        return self
+
+    def stop(self) -> None:
+        """Stop sampling and release the backend."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.backend is not None:
+            try:
+                self.backend.close()
+            except Exception:
+                pass
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.sample_once()
+
+    def sample_once(self) -> None:
+        """Take one sample of every device and the host."""
+        gpus = []
+        if self.backend is not None:
+            try:
+                gpus = self.backend.sample()
+            except Exception as e:
+                self.errors += 1
+                if self.errors == 1:
+                    logger.warning(f"GPU telemetry sample failed ({self.backend_name}): {e}")
+        host = self.host.sample()
+
+        with self.lock:
+            self.sequence += 1
+            if len(self.peak_memory) < len(gpus):
+                self.peak_memory.extend([0.0] * (len(gpus) - len(self.peak_memory)))
+            for index, gpu in enumerate(gpus):
+                self.peak_memory[index] = max(self.peak_memory[index], gpu['memory_used'])
+            self.peak_rss = max(self.peak_rss, host['rss_bytes'])
+            self.buffer.append({'sequence': self.sequence, 'time': time.time(), 'gpus': gpus, 'host': host})
+
+    def report(self) -> Dict[str, Any]:
+        """Aggregate the samples taken since the previous report()."""
+        with self.lock:
+            samples = [s for s in self.buffer if s['sequence'] > self.reported_sequence]
+            if samples:
+                self.reported_sequence = samples[-1]['sequence']
+            return self._aggregate(samples)
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate every sample still in the ring buffer."""
+        with self.lock:
+            return self._aggregate(list(self.buffer))
+
+    def _aggregate(self, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Mean/max over samples. Caller holds the lock.
+
+        Returns:
+            Flat metrics (GPU values averaged across devices) plus a 'gpus'
+            list with per-device values; empty if there are no samples
+        """
+        if not samples:
+            return {}
+
+        device_count = max(len(s['gpus']) for s in samples)
+        devices = []
+        for index in range(device_count):
+            readings = [s['gpus'][index] for s in samples if index < len(s['gpus'])]
+            utilization = _present(r['utilization'] for r in readings)
+            devices.append({
+                'index': index,
+                'utilization_mean': _mean_or_none(utilization),
+                'utilization_max': _max_or_none(utilization),
+                'memory_used_gb_max': max(r['memory_used'] for r in readings) / 1024 ** 3,
+                'memory_peak_gb': self.peak_memory[index] / 1024 ** 3,
+                'memory_total_gb': readings[-1]['memory_total'] / 1024 ** 3,
+                'temperature_max': _max_or_none(_present(r['temperature'] for r in readings)),
+                'power_watts_mean': _mean_or_none(_present(r['power_watts'] for r in readings)),
+            })
+
+        hosts = [s['host'] for s in samples]
+        metrics: Dict[str, Any] = {
+            'telemetry_samples': len(samples),
+            'host_cpu_percent_mean': _mean([h['cpu_percent'] for h in hosts]),
+            'host_cpu_percent_max': max(h['cpu_percent'] for h in hosts),
+            'host_rss_gb_max': max(h['rss_bytes'] for h in hosts) / 1024 ** 3,
+            'host_rss_gb_peak': self.peak_rss / 1024 ** 3,
+            'disk_read_mb_s_mean': _mean([h['disk_read_bytes_per_s'] for h in hosts]) / 1024 ** 2,
+            'disk_write_mb_s_mean': _mean([h['disk_write_bytes_per_s'] for h in hosts]) / 1024 ** 2,
+        }
+        if devices:
+            power = _present(d['power_watts_mean'] for d in devices)
+            metrics.update({
+                'gpu_utilization': _mean_or_none(_present(d['utilization_mean'] for d in devices)),
+                'gpu_utilization_max': _max_or_none(_present(d['utilization_max'] for d in devices)),
+                'gpu_memory_used_gb_max': max(d['memory_used_gb_max'] for d in devices),
+                'gpu_memory_peak_gb': max(d['memory_peak_gb'] for d in devices),
+                'gpu_temperature_max': _max_or_none(_present(d['temperature_max'] for d in devices)),
+                # Mean draw over the window, summed across devices that report it
+                'gpu_power_watts': sum(power) if power else None,
+                'gpus': devices,
+            })
+        return metrics
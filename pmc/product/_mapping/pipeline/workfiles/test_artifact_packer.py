@@ -0,0 +1,254 @@
+"""
+Tests for artifact_packer.py: gzip / zstd archives read back with tarfile and
+the stock zstd CLI, and TUS uploads resumed from the server's offset.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import io
+import os
+import base64
+import shutil
+import tarfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import artifact_packer
+from artifact_packer import (
+    LocalFileSink,
+    ParallelCompressor,
+    TusUploader,
+    UploadError,
+    compress_chunk,
+    pack_directory,
+)
+
+requires_zstd_cli = pytest.mark.skipif(shutil.which('zstd') is None, reason="zstd CLI not installed")
+
+
+@pytest.fixture
+def adapter_dir(tmp_path):
+    directory = tmp_path / 'adapter'
+    directory.mkdir()
+    # Compressible weights, so a stored (not compressed) copy is easy to tell apart
+    (directory / 'adapter_model.safetensors').write_bytes(b'\0' * (2 * 1024 * 1024 + 12345))
+    (directory / 'adapter_config.json').write_text('{"r": 16, "lora_alpha": 32}' * 1000)
+    (directory / 'README.md').write_text('adapter\n')
+    return directory
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setenv('ARTIFACT_CHUNK_MB', '1')
+
+
+def _read_tar(data: bytes) -> dict:
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as tar:
+        return {member.name: tar.extractfile(member).read() for member in tar.getmembers() if member.isfile()}
+
+
+def _expected(directory) -> dict:
+    return {f"adapter/{name}": (directory / name).read_bytes() for name in os.listdir(directory)}
+
+
+def _zstd_decompress(path) -> bytes:
+    return subprocess.run(['zstd', '-d', '-c', str(path)], check=True, capture_output=True).stdout
+
+
+def test_gzip_round_trip_through_local_sink(adapter_dir, tmp_path, small_chunks):
+    archive = tmp_path / 'adapter.tar.gz'
+    result = pack_directory(str(adapter_dir), LocalFileSink(str(archive)), 'gzip', threads=4)
+
+    assert result['path'] == f"local://{archive}"
+    assert result['archive_bytes'] == archive.stat().st_size
+    # The weights are stored, everything else compressed
+    weights = (adapter_dir / 'adapter_model.safetensors').stat().st_size
+    assert result['stored_bytes'] >= weights
+    assert result['archive_bytes'] > weights
+
+    with tarfile.open(str(archive), 'r:gz') as tar:
+        names = tar.getnames()
+    assert names[0] == 'adapter'
+    assert _read_tar(archive.read_bytes()) == _expected(adapter_dir)
+
+
+def test_gzip_round_trip_compresses_without_store_patterns(adapter_dir, tmp_path, small_chunks):
+    archive = tmp_path / 'adapter.tar.gz'
+    result = pack_directory(str(adapter_dir), LocalFileSink(str(archive)), 'gzip', store_patterns=[])
+
+    assert result['stored_bytes'] == 0
+    assert result['archive_bytes'] < 100 * 1024
+    assert _read_tar(archive.read_bytes()) == _expected(adapter_dir)
+
+
+@requires_zstd_cli
+def test_zstd_round_trip_through_local_sink(adapter_dir, tmp_path, small_chunks):
+    pytest.importorskip("zstandard")
+
+    archive = tmp_path / 'adapter.tar.zst'
+    result = pack_directory(str(adapter_dir), LocalFileSink(str(archive)), 'zstd', threads=4)
+
+    assert result['stored_bytes'] >= (adapter_dir / 'adapter_model.safetensors').stat().st_size
+    assert _read_tar(_zstd_decompress(archive)) == _expected(adapter_dir)
+
+
+@requires_zstd_cli
+def test_stored_zstd_frames_are_read_by_the_cli(adapter_dir, tmp_path):
+    # Stored frames are written by hand, so they need no zstandard package
+    archive = tmp_path / 'adapter.tar.zst'
+    stream = ParallelCompressor(LocalFileSink(str(archive)), 'zstd', threads=2, chunk_bytes=300 * 1024)
+    stream.set_store(True)
+    with tarfile.open(fileobj=stream, mode='w', format=tarfile.PAX_FORMAT) as tar:
+        tar.add(str(adapter_dir), arcname='adapter')
+    stream.close()
+    stream.sink.close()
+
+    assert stream.stored_bytes == stream.position
+    assert _read_tar(_zstd_decompress(archive)) == _expected(adapter_dir)
+
+
+@requires_zstd_cli
+@pytest.mark.parametrize('size', [0, 1, 128 * 1024, 128 * 1024 + 1, 300 * 1024])
+def test_stored_zstd_frame_block_boundaries(tmp_path, size):
+    data = os.urandom(size)
+    frame = tmp_path / 'chunk.zst'
+    frame.write_bytes(compress_chunk('zstd', 3, data, store=True) * 2)
+
+    assert _zstd_decompress(frame) == data * 2
+
+
+class _TusServer(ThreadingHTTPServer):
+    """Minimal TUS endpoint; PATCH numbers in fail_patches store half the body and answer 500."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _TusHandler)
+        self.data = bytearray()
+        self.length = None
+        self.metadata = {}
+        self.headers_seen = []
+        self.patches = 0
+        self.fail_patches = set()
+        self.reject_patches = set()
+        self.deleted = False
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _TusHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        server = self.server
+        for item in self.headers['Upload-Metadata'].split(','):
+            name, value = item.split(' ')
+            server.metadata[name] = base64.b64decode(value).decode('utf-8')
+        self._reply(201, {'Location': '/storage/v1/upload/resumable/upload-1'})
+
+    def do_HEAD(self):
+        with self.server.lock:
+            offset = len(self.server.data)
+        self._reply(200, {'Upload-Offset': str(offset)})
+
+    def do_DELETE(self):
+        self.server.deleted = True
+        self._reply(204)
+
+    def do_PATCH(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with server.lock:
+            server.patches += 1
+            server.headers_seen.append(dict(self.headers))
+            if int(self.headers['Upload-Offset']) != len(server.data):
+                self._reply(409)
+                return
+            if server.patches in server.reject_patches:
+                self._reply(403)
+                return
+            if server.patches in server.fail_patches:
+                server.data += body[:len(body) // 2]
+                self._reply(500)
+                return
+            server.data += body
+            if 'Upload-Length' in self.headers:
+                server.length = int(self.headers['Upload-Length'])
+        self._reply(204, {'Upload-Offset': str(len(server.data))})
+
+
+@pytest.fixture
+def tus_server(monkeypatch):
+    # Retry backoff is not under test
+    monkeypatch.setattr(artifact_packer.time, 'sleep', lambda seconds: None)
+    server = _TusServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _uploader(server, chunk_bytes=256 * 1024):
+    return TusUploader(
+        server.url, 'service-key', 'lora-models', 'adapters/job-1.tar.gz', 'application/gzip',
+        chunk_bytes=chunk_bytes
+    )
+
+
+def test_tus_upload_resumes_from_the_server_offset(adapter_dir, tus_server, small_chunks):
+    tus_server.fail_patches = {2, 5}
+    result = pack_directory(str(adapter_dir), _uploader(tus_server), 'gzip')
+
+    assert result['path'] == 'lora-models/adapters/job-1.tar.gz'
+    assert tus_server.metadata == {
+        'bucketName': 'lora-models',
+        'objectName': 'adapters/job-1.tar.gz',
+        'contentType': 'application/gzip',
+    }
+    assert bytes(tus_server.data).startswith(b'\x1f\x8b')
+    assert len(tus_server.data) == result['archive_bytes'] == tus_server.length
+    assert _read_tar(bytes(tus_server.data)) == _expected(adapter_dir)
+
+    # The retry after each failure only sends what the server did not store
+    retried = tus_server.headers_seen[2]
+    assert int(retried['Upload-Offset']) == 256 * 1024 + 128 * 1024
+    assert int(retried['Content-Length']) == 128 * 1024
+    # Only the last PATCH declares the length
+    assert ['Upload-Length' in headers for headers in tus_server.headers_seen].count(True) == 1
+    assert not tus_server.deleted
+
+
+def test_tus_rejected_chunk_aborts_the_upload(adapter_dir, tus_server, small_chunks):
+    tus_server.reject_patches = {3}
+
+    with pytest.raises(UploadError, match='rejected'):
+        pack_directory(str(adapter_dir), _uploader(tus_server), 'gzip')
+
+    assert tus_server.patches == 3
+    assert tus_server.deleted
+
+
+def test_tus_gives_up_after_repeated_failures(tus_server):
+    tus_server.fail_patches = set(range(1, 100))
+    uploader = _uploader(tus_server, chunk_bytes=1024)
+
+    with pytest.raises(UploadError, match='after'):
+        uploader.write(os.urandom(4096))
+
+    assert tus_server.patches == artifact_packer.TUS_MAX_RETRIES + 1
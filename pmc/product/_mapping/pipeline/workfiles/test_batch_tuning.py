@@ -0,0 +1,96 @@
+"""
+Tests for batch_tuning.py: micro-batch search and accumulation planning.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from batch_tuning import StepMemoryProbe, divisors, find_micro_batch, is_oom_error, plan_batching
+
+
+class _CountingFits:
+    """fits(batch_size) that succeeds up to a limit and records every probe."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.calls = []
+
+    def __call__(self, batch_size: int) -> bool:
+        self.calls.append(batch_size)
+        return batch_size <= self.limit
+
+
+class _TinyLM(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.embed = torch.nn.Embedding(8, 16)
+        self.head = torch.nn.Linear(16, 8)
+
+    def forward(self, input_ids, labels):
+        logits = self.head(self.embed(input_ids))
+        loss = torch.nn.functional.cross_entropy(logits.view(-1, 8), labels.view(-1))
+        return SimpleNamespace(loss=loss)
+
+
+def test_divisors():
+    assert divisors(1) == [1]
+    assert divisors(12) == [1, 2, 3, 4, 6, 12]
+    assert divisors(16) == [1, 2, 4, 8, 16]
+    assert divisors(13) == [1, 13]
+
+
+def test_requested_size_that_fits_is_probed_once():
+    fits = _CountingFits(limit=64)
+    assert find_micro_batch(32, fits) == 32
+    assert fits.calls == [32]
+
+
+@pytest.mark.parametrize("requested, limit, expected", [
+    (32, 5, 4),
+    (32, 1, 1),
+    (12, 7, 6),
+    (12, 3, 3),
+    (24, 11, 8),
+    (7, 6, 1),
+])
+def test_finds_largest_fitting_divisor(requested, limit, expected):
+    fits = _CountingFits(limit)
+    assert find_micro_batch(requested, fits) == expected
+    # Binary search over the divisors, never probing a size twice
+    assert len(fits.calls) == len(set(fits.calls))
+    assert len(fits.calls) <= len(divisors(requested)).bit_length() + 1
+
+
+def test_nothing_fits():
+    assert find_micro_batch(16, _CountingFits(limit=0)) is None
+    with pytest.raises(RuntimeError, match="micro-batch of 1 does not fit"):
+        plan_batching(16, _CountingFits(limit=0))
+
+
+def test_plan_keeps_effective_batch_size():
+    plan = plan_batching(24, _CountingFits(limit=5))
+    assert plan == {'micro_batch_size': 4, 'gradient_accumulation_steps': 6, 'effective_batch_size': 24}
+
+
+def test_is_oom_error():
+    assert is_oom_error(RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB"))
+    assert not is_oom_error(RuntimeError("expected scalar type Half"))
+    assert not is_oom_error(ValueError("out of memory"))
+
+
+def test_step_memory_probe_on_cpu():
+    model = _TinyLM()
+    assert StepMemoryProbe(model, seq_length=4)(8)
+
+    limited = StepMemoryProbe(model, seq_length=4, memory_limit=1)
+    assert not limited(1)
+    assert all(p.grad is None for p in model.parameters())
+
+    generous = StepMemoryProbe(model, seq_length=64, memory_limit=10 ** 9)
+    assert plan_batching(8, generous)['micro_batch_size'] == 8
@@ -0,0 +1,161 @@
+"""
+Tests for checkpoint_sync.py: upload, prune and resume against LocalObjectClient.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import json
+from types import SimpleNamespace
+
+from checkpoint_sync import (
+    COMPLETE_MARKER,
+    LATEST_NAME,
+    TRAINER_STATE_NAME,
+    CheckpointStore,
+    CheckpointSyncCallback,
+    LocalObjectClient,
+    checkpoint_step,
+)
+
+BUCKET = 'checkpoints'
+
+
+def _store(root) -> CheckpointStore:
+    return CheckpointStore(LocalObjectClient(str(root)), BUCKET, 'job-1')
+
+
+def _write_checkpoint(output_dir, step: int, best_step=None) -> str:
+    path = os.path.join(str(output_dir), f"checkpoint-{step}")
+    os.makedirs(os.path.join(path, 'nested'), exist_ok=True)
+    with open(os.path.join(path, 'adapter_model.bin'), 'wb') as f:
+        f.write(f"weights-{step}".encode())
+    with open(os.path.join(path, 'nested', 'rng_state.pth'), 'wb') as f:
+        f.write(b'rng')
+    state = {
+        'global_step': step,
+        'best_model_checkpoint': None if best_step is None else f"/old/run/checkpoint-{best_step}",
+        'best_metric': None if best_step is None else 0.5,
+    }
+    with open(os.path.join(path, TRAINER_STATE_NAME), 'w') as f:
+        json.dump(state, f)
+    return path
+
+
+def _remote_path(root, key: str) -> str:
+    return os.path.join(str(root), BUCKET, 'checkpoints', 'job-1', key)
+
+
+def test_checkpoint_step():
+    assert checkpoint_step('/tmp/out/checkpoint-40') == 40
+    assert checkpoint_step('/tmp/out/checkpoint-40/') == 40
+    assert checkpoint_step('/tmp/out/final') is None
+    assert checkpoint_step(None) is None
+
+
+def test_upload_marks_complete_and_points_latest(tmp_path):
+    store = _store(tmp_path / 'remote')
+    store.upload(_write_checkpoint(tmp_path / 'out', 10), 10, best_step=10)
+
+    assert store.completed_steps() == [10]
+    assert os.path.exists(_remote_path(tmp_path / 'remote', f"checkpoint-10/{COMPLETE_MARKER}"))
+    assert os.path.exists(_remote_path(tmp_path / 'remote', 'checkpoint-10/nested/rng_state.pth'))
+    with open(_remote_path(tmp_path / 'remote', LATEST_NAME)) as f:
+        assert json.load(f) == {'step': 10, 'prefix': 'checkpoints/job-1/checkpoint-10/', 'best_step': 10}
+
+
+def test_incomplete_upload_is_not_resumed(tmp_path):
+    store = _store(tmp_path / 'remote')
+    store.upload(_write_checkpoint(tmp_path / 'out', 10), 10)
+    store.upload(_write_checkpoint(tmp_path / 'out', 20), 20)
+    os.remove(_remote_path(tmp_path / 'remote', f"checkpoint-20/{COMPLETE_MARKER}"))
+
+    assert store.completed_steps() == [10]
+    resumed = store.download_latest(str(tmp_path / 'resume'))
+    assert checkpoint_step(resumed) == 10
+
+
+def test_prune_keeps_latest_and_best(tmp_path):
+    store = _store(tmp_path / 'remote')
+    for step in (10, 20, 30, 40):
+        store.upload(_write_checkpoint(tmp_path / 'out', step), step)
+
+    store.delete_older_than(40, keep=20)
+    assert store.completed_steps() == [20, 40]
+    assert not os.path.exists(_remote_path(tmp_path / 'remote', 'checkpoint-10/adapter_model.bin'))
+
+    store.delete_older_than(40)
+    assert store.completed_steps() == [40]
+
+    store.delete_all()
+    assert store.completed_steps() == []
+
+
+def test_resume_downloads_best_and_rewrites_state(tmp_path):
+    store = _store(tmp_path / 'remote')
+    store.upload(_write_checkpoint(tmp_path / 'out', 20), 20)
+    store.upload(_write_checkpoint(tmp_path / 'out', 30, best_step=20), 30, best_step=20)
+
+    resume_dir = tmp_path / 'resume'
+    resumed = store.download_latest(str(resume_dir))
+
+    assert resumed == os.path.join(str(resume_dir), 'checkpoint-30')
+    with open(os.path.join(resumed, 'adapter_model.bin'), 'rb') as f:
+        assert f.read() == b'weights-30'
+    with open(os.path.join(resumed, TRAINER_STATE_NAME)) as f:
+        state = json.load(f)
+    assert state['best_model_checkpoint'] == os.path.join(str(resume_dir), 'checkpoint-20')
+    assert os.path.exists(os.path.join(state['best_model_checkpoint'], 'adapter_model.bin'))
+
+
+def test_resume_clears_best_that_was_not_synced(tmp_path):
+    store = _store(tmp_path / 'remote')
+    store.upload(_write_checkpoint(tmp_path / 'out', 30, best_step=20), 30)
+
+    resumed = store.download_latest(str(tmp_path / 'resume'))
+    with open(os.path.join(resumed, TRAINER_STATE_NAME)) as f:
+        state = json.load(f)
+    assert state['best_model_checkpoint'] is None
+    assert state['best_metric'] is None
+
+
+def test_resume_without_checkpoints(tmp_path):
+    assert _store(tmp_path / 'remote').download_latest(str(tmp_path / 'resume')) is None
+
+
+def test_callback_uploads_saves_and_keeps_best(tmp_path):
+    store = _store(tmp_path / 'remote')
+    output_dir = tmp_path / 'out'
+    snapshot_dir = tmp_path / 'snapshots'
+    snapshot_dir.mkdir()
+    synced = []
+    callback = CheckpointSyncCallback(store, str(snapshot_dir), on_synced=synced.append)
+
+    args = SimpleNamespace(output_dir=str(output_dir))
+    for step, best in ((10, 10), (20, 10), (30, 30), (40, 30)):
+        _write_checkpoint(output_dir, step, best_step=best)
+        state = SimpleNamespace(
+            is_world_process_zero=True,
+            global_step=step,
+            best_model_checkpoint=os.path.join(str(output_dir), f"checkpoint-{best}"),
+        )
+        callback.on_save(args, state, None)
+    callback.close(timeout=30)
+
+    assert callback.errors == []
+    assert callback.uploaded_step == 40
+    assert synced[-1] == 40
+    assert store.completed_steps() == [30, 40]
+    assert os.listdir(str(snapshot_dir)) == []
+
+
+def test_callback_ignores_other_ranks(tmp_path):
+    store = _store(tmp_path / 'remote')
+    callback = CheckpointSyncCallback(store, str(tmp_path))
+    _write_checkpoint(tmp_path / 'out', 10)
+    state = SimpleNamespace(is_world_process_zero=False, global_step=10, best_model_checkpoint=None)
+    callback.on_save(SimpleNamespace(output_dir=str(tmp_path / 'out')), state, None)
+    callback.close(timeout=30)
+
+    assert store.completed_steps() == []
@@ -0,0 +1,76 @@
+"""
+Tests for dataset_cache.py: pinned blobs survive eviction, staging locks are cleaned up.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+
+from dataset_cache import DatasetCache
+
+
+def _put(cache, name, size, object_key=None):
+    path = cache.staging_path(object_key)
+    with open(path, 'wb') as f:
+        f.write(name.encode('utf-8') * size)
+    return cache.put(path, object_key)
+
+
+def test_pinned_blob_is_not_evicted_by_another_worker(tmp_path):
+    # Two instances on one root stand in for two workers sharing a volume
+    parsing = DatasetCache(str(tmp_path), max_bytes=150)
+    other = DatasetCache(str(tmp_path), max_bytes=150)
+
+    pinned = _put(parsing, 'a', 100, 'bucket/a.jsonl@1')
+    other.release(_put(other, 'b', 100, 'bucket/b.jsonl@1'))
+
+    # The older blob is the LRU victim but is still being parsed
+    assert os.path.exists(pinned)
+    assert parsing.lookup('bucket/a.jsonl@1') == pinned
+
+    parsing.release(pinned)
+    other.release(_put(other, 'c', 100, 'bucket/c.jsonl@1'))
+
+    assert not os.path.exists(pinned)
+    assert other.lookup('bucket/a.jsonl@1') is None
+
+
+def test_released_lookup_can_be_evicted(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=150)
+    cache.release(_put(cache, 'a', 100, 'bucket/a.jsonl@1'))
+
+    path = cache.lookup('bucket/a.jsonl@1')
+    assert path is not None
+    cache.release(path)
+
+    cache.release(_put(cache, 'b', 100, 'bucket/b.jsonl@1'))
+    assert cache.lookup('bucket/a.jsonl@1') is None
+
+
+def test_staging_lock_files_are_removed(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=1024)
+
+    failed = cache.staging_path('bucket/a.jsonl@1')
+    with open(failed, 'wb') as f:
+        f.write(b'partial')
+    cache.release_staging(failed)
+
+    # A retry reclaims the same partial file
+    retried = cache.staging_path('bucket/a.jsonl@1')
+    assert retried == failed
+    cache.release(cache.put(retried, 'bucket/a.jsonl@1'))
+
+    assert os.listdir(cache.staging_dir) == []
+
+
+def test_busy_staging_path_falls_back_to_a_unique_file(tmp_path):
+    first = DatasetCache(str(tmp_path), max_bytes=1024)
+    second = DatasetCache(str(tmp_path), max_bytes=1024)
+
+    claimed = first.staging_path('bucket/a.jsonl@1')
+    fallback = second.staging_path('bucket/a.jsonl@1')
+    assert fallback != claimed
+
+    first.release_staging(claimed)
+    assert second.staging_path('bucket/a.jsonl@1') == claimed
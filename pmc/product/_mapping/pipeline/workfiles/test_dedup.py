@@ -0,0 +1,156 @@
+"""
+Tests for dedup.py: exact and near-duplicate removal is deterministic.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import sys
+import json
+import random
+import subprocess
+
+from datasets import Dataset
+
+import dedup
+from dedup import deduplicate, exact_hash, normalize_messages
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BASE = (
+    "You are a careful financial planning assistant. Explain how a Roth IRA conversion "
+    "affects taxable income this year, what the five year rule means for withdrawals, "
+    "and when a partial conversion spread over several years makes more sense than "
+    "converting the whole balance at once for a client in a high tax bracket."
+)
+
+
+def _conversation(user: str, assistant: str = "Here is how it works.") -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": user},
+        {"role": "assistant", "content": assistant},
+    ]
+
+
+def _rows() -> list:
+    return [
+        _conversation(BASE),
+        _conversation("  " + BASE.upper() + "  "),          # exact duplicate after normalization
+        _conversation(BASE.replace("high tax", "higher tax")),  # near duplicate
+        _conversation("What is dollar cost averaging and when does it help?"),
+        _conversation("How do required minimum distributions work for inherited accounts?"),
+        _conversation("What is dollar cost averaging and when does it help?"),
+    ]
+
+
+def test_exact_hash_ignores_case_and_whitespace():
+    a = normalize_messages(_conversation("Hello   World"))
+    b = normalize_messages(_conversation(" hello world "))
+    assert exact_hash(a) == exact_hash(b)
+    assert exact_hash(a) != exact_hash(normalize_messages(_conversation("hello there")))
+
+
+def test_exact_mode_keeps_first_occurrence(tmp_path):
+    dataset = Dataset.from_dict({"messages": _rows()})
+    result, stats, kept = deduplicate(dataset, str(tmp_path), mode='exact', lengths=[10] * 6)
+
+    assert kept == [0, 2, 3, 4]
+    assert len(result) == 4
+    assert stats['exact_removed'] == 2
+    assert stats['near_removed'] == 0
+    assert stats['tokens_saved'] == 20
+
+
+def test_near_mode_removes_near_duplicates(tmp_path):
+    dataset = Dataset.from_dict({"messages": _rows()})
+    _, stats, kept = deduplicate(dataset, str(tmp_path), mode='near', threshold=0.8)
+
+    assert kept == [0, 3, 4]
+    assert stats['exact_removed'] == 2
+    assert stats['near_removed'] == 1
+
+
+def test_near_mode_matches_across_batches(tmp_path):
+    dataset = Dataset.from_dict({"messages": _rows()})
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    _, _, kept_one_batch = deduplicate(dataset, str(tmp_path / "a"), mode='near', threshold=0.8)
+    _, _, kept_small_batches = deduplicate(
+        dataset, str(tmp_path / "b"), mode='near', threshold=0.8, batch_size=2
+    )
+    assert kept_small_batches == kept_one_batch
+
+
+def test_mode_none_keeps_everything(tmp_path):
+    dataset = Dataset.from_dict({"messages": _rows()})
+    result, stats, kept = deduplicate(dataset, str(tmp_path), mode='none')
+    assert result is dataset
+    assert kept == list(range(6))
+    assert stats['kept'] == 6
+
+
+def test_rejects_unknown_mode(tmp_path):
+    dataset = Dataset.from_dict({"messages": _rows()})
+    try:
+        deduplicate(dataset, str(tmp_path), mode='fuzzy')
+    except ValueError as e:
+        assert 'dedup must be one of' in str(e)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_kept_rows_do_not_depend_on_hash_seed(tmp_path):
+    # A retried job runs in a new interpreter with a different str hash salt
+    script = (
+        "import json, sys\n"
+        "from datasets import Dataset\n"
+        "import test_dedup\n"
+        "from dedup import deduplicate\n"
+        "rows = test_dedup._rows() * 3 + [test_dedup._conversation(f'question {i} about budgets') for i in range(20)]\n"
+        "_, _, kept = deduplicate(Dataset.from_dict({'messages': rows}), sys.argv[1], mode='near', batch_size=7)\n"
+        "print(json.dumps(kept))\n"
+    )
+    outputs = []
+    for seed in ('0', '1', '12345'):
+        env = {**os.environ, 'PYTHONHASHSEED': seed}
+        (tmp_path / seed).mkdir()
+        completed = subprocess.run(
+            [sys.executable, '-c', script, str(tmp_path / seed)],
+            cwd=HERE, env=env, capture_output=True, text=True, check=True,
+        )
+        outputs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def test_shared_prefix_rows_are_verified_in_bounded_time(tmp_path, monkeypatch):
+    # Long shared system prompt: most pairs collide in some band but stay below the threshold
+    rng = random.Random(7)
+    prompt = ' '.join(f"policy{i}" for i in range(140))
+    rows = [
+        _conversation(prompt + ' ' + ' '.join(f"w{rng.randrange(10 ** 6)}" for _ in range(30)))
+        for _ in range(1500)
+    ]
+    # Near copies of early rows (one word changed) must still be found
+    copies = [
+        _conversation(rows[i][1]['content'].rsplit(' ', 1)[0] + ' changed')
+        for i in (3, 50, 700)
+    ]
+    dataset = Dataset.from_dict({"messages": rows + copies})
+    
+    calls = []
+    similarity = dedup._LSHIndex.similarity
+    monkeypatch.setattr(
+        dedup._LSHIndex, 'similarity',
+        lambda self, *args: calls.append(1) or similarity(self, *args)
+    )
+    
+    _, stats, kept = deduplicate(
+        dataset, str(tmp_path), mode='near', threshold=0.85, max_bucket_rows=16, max_candidates=32
+    )
+    
+    assert stats['near_removed'] >= 3
+    assert not set(range(1500, 1503)) & set(kept)
+    assert len(calls) <= len(dataset) * 32
@@ -0,0 +1,111 @@
+"""
+Tests for distributed.py: launch_distributed on CPU with the gloo backend.
+
+Targets are module-level functions so spawned ranks can import them.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import torch.distributed as dist
+
+from distributed import launch_distributed, resolve_world_size
+
+
+class _RecordingStatusManager:
+    def __init__(self):
+        self.updates = []
+
+    def update_status(self, job_id: str, **kwargs) -> None:
+        self.updates.append(dict(kwargs, job_id=job_id))
+
+    def get_status(self, job_id: str):
+        return {}
+
+
+def _all_reduce_target(job_id: str, value: float, status_manager, dist_context):
+    """Shares a value from rank 0, then sums the ranks' contributions."""
+    shared = dist_context.broadcast({'value': value} if dist_context.is_main else None)
+    tensor = torch.tensor([shared['value'] * (dist_context.rank + 1)])
+    dist.all_reduce(tensor)
+
+    # Rank 0 prepares files in the shared work dir; the others read them after the barrier
+    marker = os.path.join(dist_context.work_dir, 'prepared')
+    if dist_context.is_main:
+        with open(marker, 'w') as f:
+            f.write('ok')
+    dist_context.barrier()
+    with open(marker) as f:
+        prepared = f.read()
+
+    status_manager.update_status(job_id=job_id, status='running', stage='training', progress=50)
+    status_manager.update_status(job_id=job_id, status='completed', progress=100)
+    return {
+        'status': 'completed',
+        'job_id': job_id,
+        'rank': dist_context.rank,
+        'world_size': dist_context.world_size,
+        'backend': dist_context.backend,
+        'total': tensor.item(),
+        'prepared': prepared,
+    }
+
+
+def _failing_target(job_id: str, status_manager, dist_context):
+    if dist_context.rank == 1:
+        raise RuntimeError("boom")
+    # Stands in for a rank stuck waiting on its failed peer; the launcher must terminate it
+    time.sleep(600)
+    return {'status': 'completed', 'job_id': job_id}
+
+
+def test_two_ranks_on_gloo():
+    status_manager = _RecordingStatusManager()
+    result = launch_distributed(
+        _all_reduce_target,
+        world_size=2,
+        kwargs={'job_id': 'job-dist', 'value': 2.0},
+        status_manager=status_manager,
+        backend='gloo',
+        timeout_minutes=2,
+    )
+
+    assert result['status'] == 'completed'
+    assert result['rank'] == 0
+    assert result['world_size'] == 2
+    assert result['backend'] == 'gloo'
+    assert result['total'] == pytest.approx(2.0 * 1 + 2.0 * 2)
+    assert result['prepared'] == 'ok'
+
+    # Only rank 0 reports, and the parent receives its updates in order
+    assert [u['status'] for u in status_manager.updates] == ['running', 'completed']
+    assert all(u['job_id'] == 'job-dist' for u in status_manager.updates)
+
+
+def test_failing_rank_fails_the_job():
+    status_manager = _RecordingStatusManager()
+    result = launch_distributed(
+        _failing_target,
+        world_size=2,
+        kwargs={'job_id': 'job-fail'},
+        status_manager=status_manager,
+        backend='gloo',
+        timeout_minutes=2,
+    )
+
+    assert result['status'] == 'failed'
+    assert result['error_message'] == 'Rank 1: boom'
+    assert status_manager.updates[-1]['status'] == 'failed'
+
+
+def test_resolve_world_size_without_cuda():
+    if torch.cuda.is_available():
+        pytest.skip("CUDA devices visible")
+    assert resolve_world_size(4) == 4
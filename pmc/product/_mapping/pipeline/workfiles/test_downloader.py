@@ -0,0 +1,208 @@
+"""
+Tests for downloader.py against a local HTTP server: parallel ranges, resume,
+single-stream fallback and size / checksum verification.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import hashlib
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloader
+from downloader import RangedDownloader, DownloadError, ChecksumError
+
+DATA = os.urandom(10_000)
+PART_SIZE = 1_000
+
+
+class _ObjectServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data, ranges=True, etag=None, advertised_size=None):
+        super().__init__(('127.0.0.1', 0), _ObjectHandler)
+        self.data = data
+        self.ranges = ranges
+        self.etag = etag
+        self.advertised_size = advertised_size or len(data)
+        # Range offsets to cut short once each, and every Range header served
+        self.fail_offsets = set()
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/bucket/dataset.jsonl"
+
+
+class _ObjectHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        range_header = self.headers.get('Range')
+        with server.lock:
+            server.requests[range_header] += 1
+
+        if not server.ranges or not range_header:
+            self._send(200, data, {})
+            return
+
+        start, _, end = range_header[len('bytes='):].partition('-')
+        start = int(start)
+        end = int(end) if end else len(data) - 1
+        body = data[start:end + 1]
+
+        with server.lock:
+            truncate = start in server.fail_offsets
+            server.fail_offsets.discard(start)
+
+        headers = {'Content-Range': f"bytes {start}-{end}/{server.advertised_size}"}
+        if truncate:
+            # Promise the whole part, send half of it and drop the connection
+            self._send(206, body[:len(body) // 2], headers, content_length=len(body))
+            self.close_connection = True
+            return
+        self._send(206, body, headers)
+
+    def _send(self, status, body, headers, content_length=None):
+        self.send_response(status)
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if self.server.etag:
+            self.send_header('ETag', self.server.etag)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body) if content_length is None else content_length))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    # Retry backoff is not under test
+    monkeypatch.setattr(downloader.time, 'sleep', lambda seconds: None)
+    servers = []
+
+    def start(data=DATA, **kwargs):
+        server = _ObjectServer(data, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _downloader(**kwargs):
+    kwargs.setdefault('part_size', PART_SIZE)
+    kwargs.setdefault('max_workers', 4)
+    kwargs.setdefault('min_parallel_size', PART_SIZE)
+    kwargs.setdefault('timeout', 10)
+    return RangedDownloader(**kwargs)
+
+
+def _part_requests(server):
+    return {header: count for header, count in server.requests.items() if header not in (None, 'bytes=0-0')}
+
+
+def test_parallel_ranged_download(serve, tmp_path):
+    server = serve()
+    output = str(tmp_path / 'dataset.jsonl')
+
+    result = _downloader().download(server.url, output, expected_sha256=hashlib.sha256(DATA).hexdigest())
+
+    assert result['ranged'] and result['parts'] == len(DATA) // PART_SIZE
+    assert result['verified']
+    with open(output, 'rb') as f:
+        assert f.read() == DATA
+    assert not os.path.exists(f"{output}.parts.json")
+    # Every part fetched exactly once
+    assert sorted(_part_requests(server).values()) == [1] * (len(DATA) // PART_SIZE)
+
+
+def test_failed_part_is_resumed_without_refetching_completed_parts(serve, tmp_path):
+    server = serve()
+    server.fail_offsets = {3_000, 7_000}
+    output = str(tmp_path / 'dataset.jsonl')
+
+    with pytest.raises(DownloadError):
+        _downloader(max_attempts=1).download(server.url, output)
+    assert os.path.exists(f"{output}.parts.json")
+
+    # A retried job with the same output path picks up the sidecar state
+    result = _downloader(max_attempts=1).download(server.url, output)
+
+    assert result['bytes'] == len(DATA)
+    with open(output, 'rb') as f:
+        assert f.read() == DATA
+    parts = _part_requests(server)
+    assert parts.pop('bytes=3000-3999') == 2
+    assert parts.pop('bytes=7000-7999') == 2
+    assert set(parts.values()) == {1}
+
+
+def test_failed_part_is_retried_within_one_download(serve, tmp_path):
+    server = serve()
+    server.fail_offsets = {5_000}
+    output = str(tmp_path / 'dataset.jsonl')
+
+    result = _downloader(max_attempts=2).download(server.url, output)
+
+    with open(output, 'rb') as f:
+        assert f.read() == DATA
+    assert result['parts'] == len(DATA) // PART_SIZE
+    assert _part_requests(server)['bytes=5000-5999'] == 2
+
+
+def test_server_without_ranges_falls_back_to_one_stream(serve, tmp_path):
+    server = serve(ranges=False)
+    output = str(tmp_path / 'dataset.jsonl')
+
+    result = _downloader().download(server.url, output, expected_sha256=hashlib.sha256(DATA).hexdigest())
+
+    assert not result['ranged'] and result['parts'] == 1
+    with open(output, 'rb') as f:
+        assert f.read() == DATA
+    assert _part_requests(server) == {}
+
+
+def test_size_mismatch_is_rejected(serve, tmp_path):
+    # The probe advertises more bytes than the object streams
+    server = serve(advertised_size=len(DATA) + 100)
+    output = str(tmp_path / 'dataset.jsonl')
+
+    with pytest.raises(DownloadError, match='Size mismatch'):
+        _downloader(min_parallel_size=len(DATA) * 2, max_attempts=2).download(server.url, output)
+
+
+def test_sha256_mismatch_is_rejected_and_discarded(serve, tmp_path):
+    server = serve()
+    output = str(tmp_path / 'dataset.jsonl')
+
+    with pytest.raises(ChecksumError):
+        _downloader().download(server.url, output, expected_sha256=hashlib.sha256(b'other').hexdigest())
+
+    assert not os.path.exists(output)
+    assert not os.path.exists(f"{output}.parts.json")
+
+
+def test_md5_etag_mismatch_is_rejected(serve, tmp_path):
+    server = serve(etag=f'"{hashlib.md5(b"other").hexdigest()}"')
+    output = str(tmp_path / 'dataset.jsonl')
+
+    with pytest.raises(ChecksumError, match='ETag'):
+        _downloader().download(server.url, output)
+
+    assert not os.path.exists(output)
@@ -0,0 +1,178 @@
+"""
+Tests for model_registry.py: warm reuse, LRU eviction and adapter cleanup.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from model_registry import ModelRegistry, model_key
+
+
+class _FakeModel(torch.nn.Module):
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.linear = torch.nn.Linear(2, 2)
+
+
+class _FakePeftModel:
+    """Stands in for a PeftModel; unload() returns the base, optionally with LoRA left behind."""
+
+    def __init__(self, base, leave_lora: bool = False, fail: bool = False):
+        self.base = base
+        self.leave_lora = leave_lora
+        self.fail = fail
+
+    def unload(self):
+        if self.fail:
+            raise RuntimeError("unload failed")
+        if self.leave_lora:
+            self.base.lora_A = torch.nn.Linear(2, 1)
+        return self.base
+
+
+class _CountingLoader:
+    def __init__(self):
+        self.loads = []
+
+    def __call__(self, model_path, quantization_config=None, **model_kwargs):
+        self.loads.append(model_path)
+        return f"tokenizer-{model_path}", _FakeModel(model_path)
+
+
+def _registry(max_models=1, memory=None):
+    loader = _CountingLoader()
+    registry = ModelRegistry(loader=loader, max_models=max_models, memory_probe=lambda: memory)
+    return registry, loader
+
+
+def test_model_key_depends_on_load_arguments():
+    assert model_key('m', None, torch_dtype='bf16') == model_key('m', None, torch_dtype='bf16')
+    assert model_key('m', None) != model_key('m', {'load_in_4bit': True})
+    assert model_key('m', None, device_map={'': 0}) != model_key('m', None, device_map={'': 1})
+
+
+def test_second_job_reuses_the_warm_model():
+    registry, loader = _registry()
+    first = registry.acquire('base')
+    model = first.model
+    registry.release(first)
+
+    second = registry.acquire('base')
+    assert second.reused and second.cached
+    assert second.model is model
+    assert loader.loads == ['base']
+
+
+def test_concurrent_lease_loads_a_private_copy():
+    registry, loader = _registry()
+    first = registry.acquire('base')
+    second = registry.acquire('base')
+
+    assert not second.cached
+    assert second.model is not first.model
+    registry.release(second)
+    registry.release(first)
+    assert registry.acquire('base').reused
+    assert loader.loads == ['base', 'base']
+
+
+def test_least_recently_used_idle_model_is_evicted():
+    registry, loader = _registry(max_models=2)
+    for path in ('a', 'b', 'a', 'c'):
+        registry.release(registry.acquire(path))
+
+    assert [entry['model'].name for entry in registry.entries.values()] == ['a', 'c']
+    assert loader.loads == ['a', 'b', 'c']
+
+
+def test_release_unloads_adapter_and_keeps_model():
+    registry, _ = _registry()
+    lease = registry.acquire('base')
+    model = lease.model
+    lease.peft_model = _FakePeftModel(model)
+    registry.release(lease)
+
+    assert lease.model is None
+    assert registry.acquire('base').model is model
+
+
+@pytest.mark.parametrize("peft_model_kwargs", [{'leave_lora': True}, {'fail': True}])
+def test_model_with_leftover_adapter_is_discarded(peft_model_kwargs):
+    registry, loader = _registry()
+    lease = registry.acquire('base')
+    lease.peft_model = _FakePeftModel(lease.model, **peft_model_kwargs)
+    registry.release(lease)
+
+    assert registry.entries == {}
+    assert not registry.acquire('base').reused
+    assert loader.loads == ['base', 'base']
+
+
+def test_discard_and_memory_pressure_evict():
+    registry, _ = _registry()
+    registry.release(registry.acquire('base'), discard=True)
+    assert registry.entries == {}
+
+    low_memory, _ = _registry(memory=(1, 100))
+    low_memory.release(low_memory.acquire('base'))
+    assert low_memory.entries == {}
+
+
+def test_max_models_zero_disables_caching():
+    registry, loader = _registry(max_models=0)
+    registry.release(registry.acquire('base'))
+    registry.release(registry.acquire('base'))
+    assert registry.entries == {}
+    assert loader.loads == ['base', 'base']
+
+
+def _tiny_llama_loader(model_path, quantization_config=None, **model_kwargs):
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=64,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=1,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=64,
+    )
+    return None, LlamaForCausalLM(config)
+
+
+def test_real_adapter_is_removed_on_release():
+    pytest.importorskip("peft")
+    from peft import LoraConfig
+
+    registry = ModelRegistry(loader=_tiny_llama_loader, memory_probe=lambda: None)
+    lease = registry.acquire('tiny-llama')
+    base = lease.model
+    before = {name: tensor.clone() for name, tensor in base.state_dict().items()}
+
+    model = lease.attach_adapter(LoraConfig(
+        r=4, lora_alpha=8, lora_dropout=0.0, target_modules=["q_proj", "v_proj"], task_type="CAUSAL_LM"
+    ))
+    assert any('lora_' in name for name, _ in base.named_modules())
+
+    # One real training step so the adapter weights are no longer at their init
+    optimizer = torch.optim.SGD([p for p in model.parameters() if p.requires_grad], lr=0.1)
+    input_ids = torch.randint(0, 64, (2, 8))
+    model(input_ids=input_ids, labels=input_ids).loss.backward()
+    optimizer.step()
+    registry.release(lease)
+
+    second = registry.acquire('tiny-llama')
+    assert second.reused
+    assert second.model is base
+    assert not any('lora_' in name for name, _ in base.named_modules())
+    assert not hasattr(base, 'peft_config')
+    after = base.state_dict()
+    assert list(after) == list(before)
+    assert all(torch.equal(before[name], after[name]) for name in before)
@@ -0,0 +1,130 @@
+"""
+Tests for model_store.py through LocalDirSource: ensure, prefetch and verify.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import json
+import threading
+
+import pytest
+
+from model_store import (
+    MANIFEST_NAME,
+    LocalDirSource,
+    ModelStore,
+    PrefetchMissError,
+    prefetch_models,
+)
+
+MODEL_ID = 'org/tiny-model'
+
+
+class _CountingSource(LocalDirSource):
+    """LocalDirSource that counts downloads."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.downloads = 0
+        self.lock = threading.Lock()
+
+    def download(self, model_id, revision, dest_dir):
+        with self.lock:
+            self.downloads += 1
+        return super().download(model_id, revision, dest_dir)
+
+
+@pytest.fixture
+def source(tmp_path):
+    model_dir = tmp_path / 'hub' / MODEL_ID
+    (model_dir / 'sub').mkdir(parents=True)
+    (model_dir / 'config.json').write_text(json.dumps({'model_type': 'llama'}))
+    (model_dir / 'model.safetensors').write_bytes(os.urandom(4096))
+    (model_dir / 'sub' / 'tokenizer.json').write_text('{}')
+    return _CountingSource(str(tmp_path / 'hub'))
+
+
+@pytest.fixture
+def store(tmp_path, source):
+    return ModelStore(str(tmp_path / 'store'), source)
+
+
+def test_ensure_fetches_once_and_writes_manifest(store, source):
+    path = store.ensure(MODEL_ID)
+
+    assert path == store.snapshot_path(MODEL_ID)
+    assert sorted(store.read_manifest(MODEL_ID)['files']) == [
+        'config.json', 'model.safetensors', os.path.join('sub', 'tokenizer.json')
+    ]
+    assert store.ensure(MODEL_ID) == path
+    assert source.downloads == 1
+    assert os.listdir(store.staging_dir) == []
+
+
+def test_concurrent_ensure_downloads_once(store, source):
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(store.ensure(MODEL_ID))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert paths == [store.snapshot_path(MODEL_ID)] * 4
+    assert source.downloads == 1
+
+
+def test_ensure_without_fetch_fails_fast_on_a_miss(store, source):
+    with pytest.raises(PrefetchMissError):
+        store.ensure(MODEL_ID, fetch=False)
+    assert source.downloads == 0
+
+    store.ensure(MODEL_ID)
+    assert store.ensure(MODEL_ID, fetch=False) == store.snapshot_path(MODEL_ID)
+
+
+def test_prefetch_reports_failures_per_model(store):
+    results = prefetch_models(store, [MODEL_ID, 'org/missing@v1'])
+
+    assert results == {MODEL_ID: store.snapshot_path(MODEL_ID), 'org/missing@v1': None}
+    assert store.resolve(MODEL_ID) is not None
+    assert store.read_manifest('org/missing', 'v1') is None
+
+
+def test_verify_detects_missing_truncated_and_corrupt_files(store):
+    path = store.ensure(MODEL_ID)
+    weights = os.path.join(path, 'model.safetensors')
+    assert store.verify(MODEL_ID, deep=True)
+
+    # Same size, different bytes: only the deep check sees it
+    with open(weights, 'r+b') as f:
+        f.write(b'\0' * 16)
+    assert store.verify(MODEL_ID)
+    assert not store.verify(MODEL_ID, deep=True)
+
+    with open(weights, 'ab') as f:
+        f.write(b'extra')
+    assert not store.verify(MODEL_ID)
+    assert store.resolve(MODEL_ID) is None
+
+    os.remove(weights)
+    assert not store.verify(MODEL_ID)
+
+
+def test_broken_snapshot_is_refetched(store, source):
+    path = store.ensure(MODEL_ID)
+    os.remove(os.path.join(path, 'config.json'))
+
+    assert store.ensure(MODEL_ID) == path
+    assert source.downloads == 2
+    assert store.verify(MODEL_ID, deep=True)
+
+
+def test_snapshot_without_manifest_is_not_complete(store):
+    path = store.ensure(MODEL_ID)
+    os.remove(os.path.join(path, MANIFEST_NAME))
+
+    assert store.resolve(MODEL_ID) is None
+    with pytest.raises(PrefetchMissError):
+        store.ensure(MODEL_ID, fetch=False)
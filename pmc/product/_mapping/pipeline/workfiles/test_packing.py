@@ -0,0 +1,137 @@
+"""
+Tests for packing.py: bin packing, batching modes and boundary-safe attention.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from datasets import Dataset
+
+from packing import (
+    IGNORE_INDEX,
+    PACKED_ATTENTION_IMPLEMENTATION,
+    PackedBlockCollator,
+    pack_dataset,
+    pack_lengths,
+    padding_efficiency,
+    resolve_batching_mode,
+)
+
+
+def _tiny_llama(attn_implementation: str):
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=50,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=64,
+        attn_implementation=attn_implementation,
+    )
+    config._attn_implementation = attn_implementation
+    return LlamaForCausalLM(config).eval()
+
+
+def test_resolve_batching_mode():
+    assert resolve_batching_mode({}) == 'padded'
+    assert resolve_batching_mode({'packing': True}) == 'packing'
+    assert resolve_batching_mode({'group_by_length': True}) == 'group_by_length'
+    assert resolve_batching_mode({'batching': 'packing', 'group_by_length': True}) == 'packing'
+    with pytest.raises(ValueError):
+        resolve_batching_mode({'batching': 'bucketed'})
+
+
+def test_pack_lengths_fills_blocks():
+    lengths = [7, 5, 3, 3, 2, 1, 6]
+    blocks = pack_lengths(lengths, 10)
+    assert sorted(i for block in blocks for i in block) == list(range(len(lengths)))
+    assert all(sum(lengths[i] for i in block) <= 10 for block in blocks)
+    assert len(blocks) == 3
+    assert padding_efficiency(lengths, 2, 'packing', 10) == pytest.approx(27 / 30)
+
+
+def test_pack_dataset_restarts_positions_and_masks_first_labels():
+    dataset = Dataset.from_dict({"input_ids": [[1, 2, 3], [4, 5], [6, 7, 8, 9]], "length": [3, 2, 4]})
+    packed = pack_dataset(dataset, 5)
+
+    assert len(packed) == 2
+    for row in packed:
+        starts = [i for i, position in enumerate(row["position_ids"]) if position == 0]
+        assert all(row["labels"][i] == IGNORE_INDEX for i in starts)
+        assert row["length"] == len(row["input_ids"]) <= 5
+
+
+def test_collator_mask_is_block_diagonal_and_causal():
+    collator = PackedBlockCollator(pad_token_id=0)
+    batch = collator([
+        {"input_ids": [11, 12, 13, 21, 22], "labels": [-100, 12, 13, -100, 22], "position_ids": [0, 1, 2, 0, 1]},
+        {"input_ids": [31, 32, 33], "labels": [-100, 32, 33], "position_ids": [0, 1, 2]},
+    ])
+
+    assert batch["input_ids"].shape == (2, 5)
+    assert batch["labels"][1].tolist() == [-100, 32, 33, -100, -100]
+    assert batch["attention_mask"].shape == (2, 1, 5, 5)
+
+    mask = batch["attention_mask"][0, 0].bool()
+    expected = torch.tensor([
+        [1, 0, 0, 0, 0],
+        [1, 1, 0, 0, 0],
+        [1, 1, 1, 0, 0],
+        [0, 0, 0, 1, 0],
+        [0, 0, 0, 1, 1],
+    ], dtype=torch.bool)
+    assert torch.equal(mask, expected)
+
+    # Padding attends only to itself, never to real tokens
+    padded = batch["attention_mask"][1, 0].bool()
+    assert padded[3].tolist() == [False, False, False, True, False]
+    assert not padded[:3, 3:].any()
+
+
+@pytest.mark.parametrize("attn_implementation", sorted({PACKED_ATTENTION_IMPLEMENTATION, 'eager'}))
+def test_attention_does_not_cross_conversation_boundaries(attn_implementation):
+    model = _tiny_llama(attn_implementation)
+    first, second = [5, 9, 3, 7], [8, 2, 6]
+    collator = PackedBlockCollator(pad_token_id=0)
+    batch = collator([{
+        "input_ids": first + second,
+        "labels": [IGNORE_INDEX] + first[1:] + [IGNORE_INDEX] + second[1:],
+        "position_ids": list(range(len(first))) + list(range(len(second))),
+    }])
+
+    with torch.no_grad():
+        packed = model(
+            input_ids=batch["input_ids"],
+            attention_mask=batch["attention_mask"],
+            position_ids=batch["position_ids"],
+        ).logits[0]
+        alone_first = model(input_ids=torch.tensor([first])).logits[0]
+        alone_second = model(input_ids=torch.tensor([second])).logits[0]
+
+    assert torch.allclose(packed[:len(first)], alone_first, atol=1e-5)
+    assert torch.allclose(packed[len(first):], alone_second, atol=1e-5)
+
+    # Without the mask the second conversation would see the first one
+    with torch.no_grad():
+        leaky = model(input_ids=batch["input_ids"], position_ids=batch["position_ids"]).logits[0]
+    assert not torch.allclose(leaky[len(first):], alone_second, atol=1e-5)
+
+
+def test_packed_batch_trains():
+    model = _tiny_llama(PACKED_ATTENTION_IMPLEMENTATION).train()
+    dataset = Dataset.from_dict({"input_ids": [[1, 2, 3], [4, 5], [6, 7, 8, 9]], "length": [3, 2, 4]})
+    features = list(pack_dataset(dataset, 5))
+    batch = PackedBlockCollator(pad_token_id=0)(features)
+    batch.pop("length", None)
+
+    loss = model(**batch).loss
+    loss.backward()
+    assert torch.isfinite(loss)
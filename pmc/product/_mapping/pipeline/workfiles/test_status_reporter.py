@@ -0,0 +1,222 @@
+"""
+Tests for status_reporter.py: coalescing, flush cadence, the pending-queue
+bound and never blocking the caller.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import time
+import types
+import threading
+
+import pytest
+
+from status_reporter import AsyncStatusReporter
+
+
+class _RecordingManager:
+    """Status manager stand-in that records deliveries and can be held up."""
+
+    def __init__(self, blocked=False):
+        self.updates = []
+        self.lock = threading.Lock()
+        self.unblocked = threading.Event()
+        self.entered = threading.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    def update_status(self, job_id, **kwargs):
+        self.entered.set()
+        self.unblocked.wait()
+        with self.lock:
+            self.updates.append({'job_id': job_id, **kwargs})
+
+    def get_status(self, job_id):
+        return {}
+
+    def delivered(self):
+        with self.lock:
+            return list(self.updates)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def make_reporter():
+    reporters = []
+
+    def make(manager, **kwargs):
+        kwargs.setdefault('flush_seconds', 60.0)
+        kwargs.setdefault('flush_steps', 0)
+        reporter = AsyncStatusReporter(manager, **kwargs)
+        reporters.append((reporter, manager))
+        return reporter
+
+    yield make
+    for reporter, manager in reporters:
+        manager.unblocked.set()
+        reporter.close(timeout=5)
+
+
+def test_updates_within_a_stage_are_coalesced(make_reporter):
+    manager = _RecordingManager()
+    reporter = make_reporter(manager)
+
+    reporter.update_status('job', status='running', stage='training', current_step=0)
+    assert _wait_for(lambda: len(manager.delivered()) == 1)
+
+    for step in range(1, 11):
+        reporter.update_status('job', current_step=step, progress=step * 10.0, metrics={'loss': 1.0 / step})
+    reporter.update_status('job', metrics={'lr': 0.1})
+    assert reporter.flush(timeout=5)
+
+    updates = manager.delivered()
+    assert len(updates) == 2
+    assert updates[1]['current_step'] == 10 and updates[1]['progress'] == 100.0
+    assert updates[1]['metrics'] == {'loss': 0.1, 'lr': 0.1}
+    assert reporter.stats['coalesced'] == 10
+    assert reporter.get_status('job')['current_step'] == 10
+
+
+def test_stage_change_is_delivered_after_the_update_before_it(make_reporter):
+    manager = _RecordingManager(blocked=True)
+    reporter = make_reporter(manager)
+
+    reporter.update_status('job', status='running', stage='preparing', progress=5.0)
+    assert manager.entered.wait(5)
+    reporter.update_status('job', status='running', stage='training', current_step=1)
+    reporter.update_status('job', current_step=2)
+    reporter.update_status('job', status='running', stage='saving', progress=95.0)
+    manager.unblocked.set()
+
+    # Transitions are urgent: delivered without flush() despite the 60s cadence
+    assert _wait_for(lambda: len(manager.delivered()) == 3)
+    assert [u['stage'] for u in manager.delivered()] == ['preparing', 'training', 'saving']
+    assert manager.delivered()[1]['current_step'] == 2
+
+
+def test_step_cadence_triggers_delivery(make_reporter):
+    manager = _RecordingManager()
+    reporter = make_reporter(manager, flush_steps=5)
+
+    reporter.update_status('job', status='running', stage='training', current_step=1)
+    assert _wait_for(lambda: len(manager.delivered()) == 1)
+
+    for step in range(2, 6):
+        reporter.update_status('job', current_step=step)
+    time.sleep(0.2)
+    assert len(manager.delivered()) == 1
+
+    reporter.update_status('job', current_step=6)
+    assert _wait_for(lambda: len(manager.delivered()) == 2)
+    assert manager.delivered()[1]['current_step'] == 6
+
+
+def test_time_cadence_triggers_delivery(make_reporter):
+    manager = _RecordingManager()
+    reporter = make_reporter(manager, flush_seconds=0.2)
+
+    reporter.update_status('job', status='running', stage='training', current_step=1)
+    assert _wait_for(lambda: len(manager.delivered()) == 1)
+
+    reporter.update_status('job', current_step=2)
+    assert _wait_for(lambda: len(manager.delivered()) == 2)
+    assert manager.delivered()[1]['current_step'] == 2
+
+
+def test_update_status_never_waits_for_delivery(make_reporter):
+    manager = _RecordingManager(blocked=True)
+    reporter = make_reporter(manager, max_pending=8)
+
+    reporter.update_status('job', status='running', stage='training')
+    assert manager.entered.wait(5)
+
+    started = time.perf_counter()
+    for step in range(1000):
+        # Alternating stages so every call is a transition that cannot be merged
+        reporter.update_status('job', status='running', stage=f"stage-{step % 2}", current_step=step)
+        assert len(reporter.pending) <= 8
+    assert time.perf_counter() - started < 1.0
+
+    manager.unblocked.set()
+    assert reporter.flush(timeout=5)
+    assert manager.delivered()[-1]['current_step'] == 999
+
+
+def test_queue_stays_bounded_when_no_update_can_be_folded(make_reporter):
+    manager = _RecordingManager(blocked=True)
+    reporter = make_reporter(manager, max_pending=3)
+
+    reporter.update_status('job-0', status='running', stage='training')
+    assert manager.entered.wait(5)
+
+    reporter.update_status('job-1', status='completed', stage='completed', progress=100.0)
+    for index in range(2, 9):
+        reporter.update_status(f"job-{index}", status='running', stage='training', metrics={'loss': 1.0})
+        reporter.update_status(f"job-{index}", metrics={'step': index})
+        assert len(reporter.pending) <= 3
+    assert reporter.stats['dropped'] > 0
+
+    manager.unblocked.set()
+    assert reporter.flush(timeout=5)
+
+    latest = {}
+    for update in manager.delivered():
+        latest[update['job_id']] = update
+    # The terminal update survived, and every job's newest state was delivered
+    assert latest['job-1']['status'] == 'completed'
+    for index in range(2, 9):
+        assert latest[f"job-{index}"]['stage'] == 'training'
+        assert latest[f"job-{index}"]['metrics'] == {'loss': 1.0, 'step': index}
+
+
+def test_dropped_job_resends_its_full_state_with_the_next_update(make_reporter):
+    manager = _RecordingManager(blocked=True)
+    reporter = make_reporter(manager, max_pending=1)
+
+    reporter.update_status('job-0', status='running', stage='training')
+    assert manager.entered.wait(5)
+
+    reporter.update_status('job-a', status='running', stage='training', progress=20.0, metrics={'loss': 2.0})
+    reporter.update_status('job-b', status='running', stage='training', progress=30.0)
+    assert reporter.resync == {'job-a'}
+
+    reporter.update_status('job-a', status='running', stage='saving', metrics={'eval_loss': 1.5})
+    assert 'job-a' not in reporter.resync
+
+    manager.unblocked.set()
+    assert reporter.flush(timeout=5)
+    job_a = [u for u in manager.delivered() if u['job_id'] == 'job-a']
+    assert job_a[-1]['stage'] == 'saving'
+    assert job_a[-1]['progress'] == 20.0
+    assert job_a[-1]['metrics'] == {'loss': 2.0, 'eval_loss': 1.5}
+
+
+def test_on_step_end_does_not_wait_for_the_status_manager(make_reporter):
+    train_lora = pytest.importorskip("train_lora")
+
+    manager = _RecordingManager(blocked=True)
+    reporter = make_reporter(manager, flush_steps=1)
+    callback = train_lora.ProgressCallback(reporter, 'job', total_steps=200)
+
+    reporter.update_status('job', status='running', stage='training')
+    assert manager.entered.wait(5)
+
+    state = types.SimpleNamespace(global_step=0, epoch=0.5, log_history=[{'loss': 1.0, 'learning_rate': 1e-4}])
+    started = time.perf_counter()
+    for step in range(1, 201):
+        state.global_step = step
+        callback.on_step_end(None, state, None)
+    assert time.perf_counter() - started < 1.0
+
+    manager.unblocked.set()
+    assert reporter.flush(timeout=5)
+    assert manager.delivered()[-1]['current_step'] == 200
@@ -0,0 +1,178 @@
+"""
+Tests for telemetry.py with scripted backends: ring buffer, report windows,
+per-device fields and partially supported NVML readings.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import sys
+import types
+
+import pytest
+
+from telemetry import FakeBackend, NvmlBackend, TelemetrySampler
+
+GB = 1024 ** 3
+
+
+def _gpu(utilization, memory_gb, temperature=50.0, power=100.0):
+    return {
+        'utilization': utilization,
+        'memory_used': memory_gb * GB,
+        'memory_total': 24 * GB,
+        'temperature': temperature,
+        'power_watts': power,
+    }
+
+
+def _sampler(script, capacity=100):
+    backend = FakeBackend(device_count=len(script[0]), script=script)
+    return TelemetrySampler(backend, interval=60, capacity=capacity)
+
+
+def test_ring_buffer_keeps_the_latest_samples():
+    sampler = _sampler([[_gpu(float(i), 1.0)] for i in range(10)], capacity=4)
+    for _ in range(10):
+        sampler.sample_once()
+
+    assert len(sampler.buffer) == 4
+    summary = sampler.summary()
+    assert summary['telemetry_samples'] == 4
+    # Samples 6..9 remain
+    assert summary['gpu_utilization'] == pytest.approx(7.5)
+    assert summary['gpu_utilization_max'] == 9.0
+
+
+def test_report_covers_samples_since_the_previous_report():
+    sampler = _sampler([
+        [_gpu(10.0, 2.0, temperature=60.0)],
+        [_gpu(30.0, 6.0, temperature=70.0)],
+        [_gpu(80.0, 4.0, temperature=65.0)],
+    ])
+    sampler.sample_once()
+    sampler.sample_once()
+
+    first = sampler.report()
+    assert first['telemetry_samples'] == 2
+    assert first['gpu_utilization'] == pytest.approx(20.0)
+    assert first['gpu_utilization_max'] == 30.0
+    assert first['gpu_temperature_max'] == 70.0
+    assert first['gpu_memory_used_gb_max'] == pytest.approx(6.0)
+
+    assert sampler.report() == {}
+
+    sampler.sample_once()
+    second = sampler.report()
+    assert second['telemetry_samples'] == 1
+    assert second['gpu_utilization'] == pytest.approx(80.0)
+    assert second['gpu_memory_used_gb_max'] == pytest.approx(4.0)
+    # The peak outlives the window it was seen in
+    assert second['gpu_memory_peak_gb'] == pytest.approx(6.0)
+
+    # summary() is unaffected by reporting
+    assert sampler.summary()['telemetry_samples'] == 3
+
+
+def test_per_device_fields():
+    sampler = _sampler([
+        [_gpu(10.0, 2.0, temperature=55.0, power=100.0), _gpu(90.0, 20.0, temperature=80.0, power=300.0)],
+        [_gpu(30.0, 3.0, temperature=60.0, power=120.0), _gpu(70.0, 18.0, temperature=75.0, power=280.0)],
+    ])
+    sampler.sample_once()
+    sampler.sample_once()
+    report = sampler.report()
+
+    first, second = report['gpus']
+    assert first['index'] == 0 and second['index'] == 1
+    assert first['utilization_mean'] == pytest.approx(20.0)
+    assert second['utilization_max'] == 90.0
+    assert first['memory_peak_gb'] == pytest.approx(3.0)
+    assert second['memory_peak_gb'] == pytest.approx(20.0)
+    assert second['memory_total_gb'] == pytest.approx(24.0)
+    assert first['temperature_max'] == 60.0
+    assert second['power_watts_mean'] == pytest.approx(290.0)
+
+    # Flat values: utilization averaged across devices, power summed
+    assert report['gpu_utilization'] == pytest.approx(50.0)
+    assert report['gpu_temperature_max'] == 80.0
+    assert report['gpu_power_watts'] == pytest.approx(400.0)
+
+
+def test_unsupported_readings_are_left_out_of_aggregates():
+    sampler = _sampler([
+        [_gpu(40.0, 2.0, temperature=None, power=None), _gpu(60.0, 2.0, temperature=70.0, power=None)],
+    ])
+    sampler.sample_once()
+    report = sampler.report()
+
+    assert report['gpus'][0]['temperature_max'] is None
+    assert report['gpus'][0]['power_watts_mean'] is None
+    assert report['gpu_temperature_max'] == 70.0
+    assert report['gpu_power_watts'] is None
+    assert report['gpu_utilization'] == pytest.approx(50.0)
+
+
+def test_failed_backend_sample_still_records_host_metrics():
+    class BrokenBackend(FakeBackend):
+        def sample(self):
+            raise RuntimeError("driver gone")
+
+    sampler = TelemetrySampler(BrokenBackend(), interval=60)
+    sampler.sample_once()
+    report = sampler.report()
+
+    assert sampler.errors == 1
+    assert report['telemetry_samples'] == 1
+    assert 'gpus' not in report and 'host_cpu_percent_mean' in report
+
+
+@pytest.fixture
+def fake_pynvml(monkeypatch):
+    class NVMLError(Exception):
+        pass
+
+    module = types.SimpleNamespace(
+        NVMLError=NVMLError,
+        NVML_TEMPERATURE_GPU=0,
+        nvmlInit=lambda: None,
+        nvmlShutdown=lambda: None,
+        nvmlDeviceGetCount=lambda: 2,
+        nvmlDeviceGetHandleByIndex=lambda index: index,
+        nvmlDeviceGetMemoryInfo=lambda handle: types.SimpleNamespace(used=4 * GB, total=24 * GB),
+        nvmlDeviceGetUtilizationRates=lambda handle: types.SimpleNamespace(gpu=50 + handle),
+        nvmlDeviceGetPowerUsage=lambda handle: 150_000,
+    )
+
+    def temperature(handle, sensor):
+        # Device 1 has no temperature sensor
+        if handle == 1:
+            raise NVMLError("Not Supported")
+        return 65
+
+    module.nvmlDeviceGetTemperature = temperature
+    monkeypatch.setitem(sys.modules, 'pynvml', module)
+    return module
+
+
+def test_nvml_unsupported_reading_keeps_the_rest_of_the_sample(fake_pynvml):
+    backend = NvmlBackend()
+    readings = backend.sample()
+
+    assert readings[0] == {
+        'utilization': 50.0,
+        'memory_used': 4.0 * GB,
+        'memory_total': 24.0 * GB,
+        'temperature': 65.0,
+        'power_watts': 150.0,
+    }
+    assert readings[1]['temperature'] is None
+    assert readings[1]['utilization'] == 51.0
+    assert readings[1]['power_watts'] == 150.0
+
+    sampler = TelemetrySampler(backend, interval=60)
+    sampler.sample_once()
+    report = sampler.report()
+    assert sampler.errors == 0
+    assert report['gpu_temperature_max'] == 65.0
+    assert report['gpus'][1]['temperature_max'] is None
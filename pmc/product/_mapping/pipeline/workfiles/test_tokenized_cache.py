@@ -0,0 +1,58 @@
+"""
+Tests for tokenized_cache.py: request-derived keys and metadata kept with entries.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+from datasets import Dataset
+
+from tokenized_cache import TokenizedDatasetCache, tokenized_cache_key
+
+
+class _VocabTokenizer:
+    """Slow-tokenizer stand-in: no backend_tokenizer, so the vocab is fingerprinted."""
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.special_tokens_map = {'eos_token': '</s>'}
+        self.padding_side = 'right'
+
+    def get_vocab(self):
+        return dict(self.vocab)
+
+
+def test_key_covers_tokenizer_template_and_request():
+    tokenizer = _VocabTokenizer({'a': 0, 'b': 1})
+    selection = {'dedup': 'none', 'length_policy': 'truncate'}
+    key = tokenized_cache_key('hash', tokenizer, '{{ messages }}', 'auto', selection)
+
+    assert key == tokenized_cache_key('hash', _VocabTokenizer({'b': 1, 'a': 0}), '{{ messages }}', 'auto', selection)
+    assert key != tokenized_cache_key('hash', _VocabTokenizer({'a': 0, 'c': 1}), '{{ messages }}', 'auto', selection)
+    assert key != tokenized_cache_key('hash', tokenizer, '{{ other }}', 'auto', selection)
+    assert key != tokenized_cache_key('hash', tokenizer, '{{ messages }}', 2048, selection)
+    assert key != tokenized_cache_key('hash', tokenizer, '{{ messages }}', 'auto', {**selection, 'dedup': 'near'})
+    assert key != tokenized_cache_key('other', tokenizer, '{{ messages }}', 'auto', selection)
+
+
+def test_save_and_load_with_metadata(tmp_path):
+    cache = TokenizedDatasetCache(str(tmp_path))
+    key = 'k' * 64
+    assert cache.load(key) is None
+    assert cache.load_metadata(key) is None
+
+    dataset = Dataset.from_dict({'input_ids': [[1, 2], [3]], 'length': [2, 1]})
+    meta = {'max_seq_length': 512, 'dedup_stats': {'kept': 2}, 'token_length_stats': {'histogram': {'0-64': 2}}}
+    saved = cache.save(key, dataset, meta)
+
+    assert saved['length'] == [2, 1]
+    assert cache.load(key)['input_ids'] == [[1, 2], [3]]
+    assert cache.load_metadata(key) == meta
+    assert [name for name in tmp_path.iterdir() if name.name.startswith('.tmp-')] == []
+
+
+def test_entry_without_metadata(tmp_path):
+    cache = TokenizedDatasetCache(str(tmp_path))
+    cache.save('plain', Dataset.from_dict({'x': [1]}))
+    assert cache.load('plain') is not None
+    assert cache.load_metadata('plain') is None
@@ -0,0 +1,248 @@
+"""
+Tests for webhooks.py: batching, retries and draining against a local HTTP server.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import hmac
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import webhooks
+from webhooks import WebhookDispatcher, WebhookStatusManager
+
+
+class _Receiver:
+    """Local webhook endpoint that answers with queued status codes, then 200."""
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.requests = []
+        self.lock = threading.Lock()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with receiver.lock:
+                    receiver.requests.append({'headers': dict(self.headers), 'body': body})
+                    status = receiver.responses.pop(0) if receiver.responses else 200
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def batches(self):
+        with self.lock:
+            return [json.loads(request['body']) for request in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def receiver():
+    server = _Receiver()
+    yield server
+    server.close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(webhooks, 'BACKOFF_BASE_SECONDS', 0.01)
+
+
+def _dispatcher(url, **kwargs):
+    options = {'secret': '', 'batch_seconds': 60, 'max_retries': 3, 'timeout': 5}
+    options.update(kwargs)
+    return WebhookDispatcher(url, 'job-1', **options)
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_metrics_are_batched_and_flushed_in_order(receiver):
+    dispatcher = _dispatcher(receiver.url)
+    for step in range(3):
+        dispatcher.emit('metrics', {'step': step})
+    time.sleep(0.2)
+    assert receiver.batches() == []
+
+    # Any other event type flushes the queued metrics with it, in order
+    dispatcher.emit('checkpoint', {'step': 3})
+    assert _wait_for(lambda: len(receiver.batches()) == 1)
+    dispatcher.close(timeout=10)
+
+    batch = receiver.batches()[0]
+    assert batch['job_id'] == 'job-1'
+    assert [event['type'] for event in batch['events']] == ['metrics'] * 3 + ['checkpoint']
+    assert [event['data']['step'] for event in batch['events']] == [0, 1, 2, 3]
+    assert len({event['id'] for event in batch['events']}) == 4
+
+
+def test_batch_window_and_max_batch(receiver):
+    dispatcher = _dispatcher(receiver.url, batch_seconds=0.1, max_batch=2)
+    for step in range(5):
+        dispatcher.emit('metrics', {'step': step})
+    assert _wait_for(lambda: sum(len(b['events']) for b in receiver.batches()) == 5)
+    dispatcher.close(timeout=10)
+
+    assert all(len(batch['events']) <= 2 for batch in receiver.batches())
+    assert dispatcher.stats['delivered'] == 5
+
+
+def test_transient_failures_are_retried_with_one_idempotency_key():
+    receiver = _Receiver(responses=[503, 429, 200])
+    try:
+        dispatcher = _dispatcher(receiver.url)
+        dispatcher.emit('status', {'status': 'running'})
+        dispatcher.close(timeout=10)
+    finally:
+        receiver.close()
+
+    assert len(receiver.requests) == 3
+    keys = {request['headers']['Idempotency-Key'] for request in receiver.requests}
+    assert len(keys) == 1
+    assert keys == {json.loads(receiver.requests[0]['body'])['batch_id']}
+    assert dispatcher.stats['retries'] == 2
+    assert dispatcher.stats['delivered'] == 1
+    assert dispatcher.stats['failed'] == 0
+
+
+def test_client_errors_are_not_retried():
+    receiver = _Receiver(responses=[400])
+    try:
+        dispatcher = _dispatcher(receiver.url)
+        dispatcher.emit('error', {'error_message': 'bad'})
+        dispatcher.close(timeout=10)
+    finally:
+        receiver.close()
+
+    assert len(receiver.requests) == 1
+    assert dispatcher.stats['failed'] == 1
+    assert dispatcher.stats['retries'] == 0
+
+
+def test_retries_give_up_after_max_retries():
+    receiver = _Receiver(responses=[500] * 10)
+    try:
+        dispatcher = _dispatcher(receiver.url, max_retries=2)
+        dispatcher.emit('completed', {})
+        dispatcher.close(timeout=10)
+    finally:
+        receiver.close()
+
+    assert len(receiver.requests) == 3
+    assert dispatcher.stats['failed'] == 1
+
+
+def test_close_drains_the_queue(receiver):
+    dispatcher = _dispatcher(receiver.url)
+    for step in range(10):
+        dispatcher.emit('metrics', {'step': step})
+    started = time.monotonic()
+    dispatcher.close(timeout=10)
+
+    # Queued metrics go out on close without waiting for the batch window
+    assert time.monotonic() - started < 5
+    assert sum(len(batch['events']) for batch in receiver.batches()) == 10
+    assert dispatcher.stats['dropped'] == 0
+
+    dispatcher.emit('metrics', {'step': 10})
+    assert dispatcher.stats['events'] == 10
+
+
+def test_close_gives_up_on_an_unreachable_endpoint(monkeypatch):
+    monkeypatch.setattr(webhooks, 'BACKOFF_BASE_SECONDS', 5.0)
+    receiver = _Receiver(responses=[503] * 100)
+    try:
+        dispatcher = _dispatcher(receiver.url, max_retries=10)
+        dispatcher.emit('status', {'status': 'running'})
+        assert _wait_for(lambda: len(receiver.requests) >= 1)
+        started = time.monotonic()
+        dispatcher.close(timeout=0.5)
+    finally:
+        receiver.close()
+
+    # The backoff sleep is cut short instead of running out the retries
+    assert time.monotonic() - started < 3
+    assert not dispatcher.thread.is_alive()
+    assert dispatcher.stats['failed'] == 1
+
+
+def test_requests_are_signed(receiver):
+    dispatcher = _dispatcher(receiver.url, secret='s3cret')
+    dispatcher.emit('status', {'status': 'running'})
+    dispatcher.close(timeout=10)
+
+    request = receiver.requests[0]
+    expected = hmac.new(b's3cret', request['body'], hashlib.sha256).hexdigest()
+    assert request['headers']['X-Webhook-Signature'] == f"sha256={expected}"
+
+
+def test_full_queue_drops_oldest_metrics_first(receiver):
+    dispatcher = _dispatcher(receiver.url, max_queue=3)
+    dispatcher.emit('metrics', {'step': 0})
+    dispatcher.emit('metrics', {'step': 1})
+    with dispatcher.condition:
+        # Hold the lock so the events stay queued while the bound is hit
+        dispatcher.queue.appendleft({'id': 'x', 'type': 'status', 'job_id': 'job-1', 'timestamp': '', 'data': {}})
+    dispatcher.emit('metrics', {'step': 2})
+    dispatcher.close(timeout=10)
+
+    events = [event for batch in receiver.batches() for event in batch['events']]
+    assert [event['type'] for event in events] == ['status', 'metrics', 'metrics']
+    assert [event['data']['step'] for event in events[1:]] == [1, 2]
+    assert dispatcher.stats['dropped'] == 1
+
+
+def test_unknown_event_type():
+    dispatcher = _dispatcher('http://127.0.0.1:9/hook')
+    with pytest.raises(ValueError):
+        dispatcher.emit('progress', {})
+    dispatcher.close(timeout=1)
+
+
+def test_status_manager_emits_transitions_and_metrics(receiver):
+    class Recorder:
+        def __init__(self):
+            self.updates = []
+
+        def update_status(self, job_id, **kwargs):
+            self.updates.append(kwargs)
+
+        def get_status(self, job_id):
+            return {}
+
+    inner = Recorder()
+    dispatcher = _dispatcher(receiver.url)
+    manager = WebhookStatusManager(inner, dispatcher)
+    manager.update_status('job-1', status='running', stage='training', progress=10)
+    manager.update_status('job-1', progress=20, current_step=5, metrics={'loss': 1.5})
+    manager.update_status('job-1', status='completed', progress=100, metrics={'loss': 1.0})
+    dispatcher.close(timeout=10)
+
+    assert len(inner.updates) == 3
+    events = [event for batch in receiver.batches() for event in batch['events']]
+    assert [event['type'] for event in events] == ['status', 'metrics', 'completed']
+    assert events[1]['data']['metrics'] == {'loss': 1.5}
+    assert events[2]['data']['metrics'] == {'loss': 1.0}
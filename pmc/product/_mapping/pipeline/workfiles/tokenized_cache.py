@@ -0,0 +1,202 @@
+"""
+Tokenized Dataset Cache for LoRA Training Jobs
+
+Stores the chat-template-rendered and tokenized training set as Arrow files
+on the worker volume. Repeat jobs and hyperparameter-only retries
+memory-map the cached copy instead of re-rendering and re-tokenizing.
+
+The cache key combines everything that affects the token ids:
+- dataset content hash
+- tokenizer fingerprint (class, vocabulary/backend definition, special tokens)
+- chat template text
+- max_seq_length as requested (a length or 'auto')
+- any row-selection settings (e.g. the length policy, dedup mode)
+
+Because the key only uses request settings, it can be checked before any
+pass over the data. Results of those passes (the chosen max_seq_length,
+length and dedup stats) are stored as metadata next to the entry.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Any, Optional, Union
+
+from datasets import Dataset, load_from_disk
+
+logger = logging.getLogger(__name__)
+
+METADATA_NAME = 'cache_metadata.json'
+
+
+def tokenizer_fingerprint(tokenizer: Any) -> str:
+    """
+    Fingerprint a tokenizer by the things that determine its output.
+    
+    Args:
+        tokenizer: Hugging Face tokenizer
+        
+    Returns:
+        SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(type(tokenizer).__name__.encode('utf-8'))
+    
+    backend = getattr(tokenizer, 'backend_tokenizer', None)
+    if backend is not None:
+        digest.update(backend.to_str().encode('utf-8'))
+    else:
+        vocab = tokenizer.get_vocab()
+        digest.update(json.dumps(sorted(vocab.items())).encode('utf-8'))
+    
+    special = {
+        'special_tokens_map': tokenizer.special_tokens_map,
+        'padding_side': getattr(tokenizer, 'padding_side', None),
+        'truncation_side': getattr(tokenizer, 'truncation_side', None),
+        'add_bos': getattr(tokenizer, 'add_bos_token', None),
+        'add_eos': getattr(tokenizer, 'add_eos_token', None),
+    }
+    digest.update(json.dumps(special, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def tokenized_cache_key(
+    dataset_hash: str,
+    tokenizer: Any,
+    chat_template: Optional[str],
+    max_seq_length: Union[int, str],
+    extra: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Build the cache key for a tokenized dataset.
+    
+    Args:
+        dataset_hash: Content hash of the source dataset file
+        tokenizer: Tokenizer used for rendering and tokenization
+        chat_template: Chat template text applied to each conversation
+        max_seq_length: Truncation length, or the request ('auto') it is chosen from
+        extra: Other settings that change which rows are tokenized
+        
+    Returns:
+        SHA-256 hex digest
+    """
+    parts = {
+        'dataset': dataset_hash,
+        'tokenizer': tokenizer_fingerprint(tokenizer),
+        'chat_template': chat_template or '',
+        'max_seq_length': max_seq_length,
+        'extra': extra or {},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class TokenizedDatasetCache:
+    """Directory of saved Arrow datasets, one per cache key."""
+    
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+    
+    @classmethod
+    def from_env(cls) -> Optional['TokenizedDatasetCache']:
+        """
+        Build the cache from TOKENIZED_CACHE_DIR.
+        
+        Returns:
+            TokenizedDatasetCache instance, or None when caching is not configured
+        """
+        root = os.environ.get('TOKENIZED_CACHE_DIR')
+        if not root:
+            return None
+        
+        try:
+            return cls(root)
+        except OSError as e:
+            logger.warning(f"Tokenized cache disabled - cannot use {root}: {e}")
+            return None
+    
+    def path(self, key: str) -> str:
+        """Directory holding the dataset for a key."""
+        return os.path.join(self.root, key)
+    
+    def load(self, key: str) -> Optional[Dataset]:
+        """
+        Memory-map a cached dataset.
+        
+        Args:
+            key: Key from tokenized_cache_key()
+            
+        Returns:
+            Dataset, or None on a miss or unreadable entry
+        """
+        path = self.path(key)
+        if not os.path.isdir(path):
+            return None
+        
+        try:
+            dataset = load_from_disk(path)
+        except Exception as e:
+            logger.warning(f"Tokenized cache entry {key[:12]} unreadable, discarding: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        
+        os.utime(path)
+        logger.info(f"Tokenized cache hit: {key[:12]} ({len(dataset)} examples)")
+        return dataset
+    
+    def load_metadata(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Read the metadata saved with an entry.
+        
+        Args:
+            key: Key from tokenized_cache_key()
+            
+        Returns:
+            Metadata dict, or None if the entry is missing or has none
+        """
+        try:
+            with open(os.path.join(self.path(key), METADATA_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save(self, key: str, dataset: Dataset, metadata: Optional[Dict[str, Any]] = None) -> Dataset:
+        """
+        Write a dataset into the cache and return the memory-mapped copy.
+        
+        The dataset is written to a temporary directory and renamed into
+        place, so concurrent readers never see a partial entry.
+        
+        Args:
+            key: Key from tokenized_cache_key()
+            dataset: Rendered and tokenized dataset
+            metadata: JSON-serializable results to keep with the entry
+            
+        Returns:
+            Dataset loaded back from the cache
+        """
+        path = self.path(key)
+        tmp_path = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        
+        try:
+            dataset.save_to_disk(tmp_path)
+            if metadata is not None:
+                with open(os.path.join(tmp_path, METADATA_NAME), 'w', encoding='utf-8') as f:
+                    json.dump(metadata, f, default=str)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # Another worker finished the same entry first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        
+        logger.info(f"Tokenized dataset cached: {key[:12]}")
+        return load_from_disk(path)
@@ -5,7 +5,7 @@ This script handles the actual training process:
 - Loads base model with 4-bit quantization
 - Downloads dataset from Supabase Storage
 - Configures LoRA adapters using PEFT
-- Trains with SFTTrainer
+- Trains with the transformers Trainer on the pre-tokenized dataset
 - Reports progress and metrics
 - Uploads trained adapter to Supabase Storage
 
@@ -15,28 +15,62 @@ Date: December 28, 2025
 
 import os
 import json
+import math
+import hashlib
+import shutil
 import logging
 import tempfile
-import tarfile
 import time
-import subprocess
 from pathlib import Path
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
 import torch
-import requests
 from transformers import (
-    AutoTokenizer,
-    AutoModelForCausalLM,
     BitsAndBytesConfig,
+    DataCollatorForLanguageModeling,
+    Trainer,
     TrainingArguments,
-    TrainerCallback
+    TrainerCallback,
+    EarlyStoppingCallback
 )
-from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
-from trl import SFTTrainer
-from datasets import Dataset
-from supabase import create_client, Client
+from peft import LoraConfig
+from datasets import Dataset, Features, Value, load_from_disk
+
+from artifact_packer import CONTENT_TYPES, EXTENSIONS, LocalFileSink, TusUploader, pack_directory, resolve_codec
+from batch_tuning import StepMemoryProbe, plan_batching
+from checkpoint_sync import CheckpointStore, CheckpointSyncCallback
+from dataset_cache import DatasetCache, file_sha256
+from dataset_parser import (
+    detect_compression,
+    iter_conversations,
+    iter_conversations_parallel,
+    resolve_parse_workers,
+)
+from dedup import deduplicate
+from downloader import RangedDownloader, DownloadError
+from length_profile import (
+    apply_length_policy,
+    length_stats,
+    profile_token_lengths,
+    select_max_seq_length,
+)
+from model_registry import get_model_registry
+from model_store import ModelStore
+from packing import (
+    PACKED_ATTENTION_IMPLEMENTATION,
+    PackedBlockCollator,
+    pack_dataset,
+    padding_efficiency,
+    resolve_batching_mode,
+)
+from stage_profiler import StageProfiler
+from status_reporter import AsyncStatusReporter
+from step_metrics import StepMetricsCallback, start_metrics_server
+from telemetry import TelemetrySampler
+from tokenized_cache import TokenizedDatasetCache, tokenized_cache_key
+from webhooks import WebhookCallback, WebhookDispatcher, WebhookStatusManager
 
 # Configure logging
 logging.basicConfig(
@@ -45,18 +79,75 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Arrow schema for converted conversations
+CONVERSATION_FEATURES = Features({
+    "messages": [{"role": Value("string"), "content": Value("string")}]
+})
+
+# Seconds of telemetry and step metrics aggregated into each progress report
+TELEMETRY_REPORT_SECONDS = 5.0
+
+# Columns handed to the trainer once the dataset is tokenized
+TRAINING_COLUMNS = ["input_ids", "attention_mask", "length"]
+
+# Marks held-out rows until the train/validation split after tokenization
+VALIDATION_COLUMN = "is_validation"
+
+# Conversations rendered per Dataset.map call
+FORMAT_BATCH_SIZE = 1000
+
+# Datasets smaller than this are rendered in-process
+FORMAT_PARALLEL_MIN_EXAMPLES = 20000
+
+# Hyperparameters that change the prepared training set (everything else is per-adapter)
+DATA_HYPERPARAMETERS = (
+    'base_model', 'max_seq_length', 'max_seq_length_percentile', 'max_seq_length_cap',
+    'length_policy', 'length_profile', 'dedup', 'dedup_threshold',
+    'batching', 'packing', 'group_by_length', 'validation_split',
+)
+
 
 class ProgressCallback(TrainerCallback):
-    """Custom callback to report training progress."""
+    """
+    Custom callback to report training progress.
     
-    def __init__(self, status_manager, job_id: str, total_steps: int):
+    Runs on the training loop, so it must stay cheap: status updates go to
+    an AsyncStatusReporter, and GPU/host metrics are aggregated from the
+    TelemetrySampler's buffer (mean/max since the previous report) rather
+    than queried. Token throughput and step-phase times come from a
+    StepMetricsCallback. Time spent in the callback is accumulated in
+    callback_seconds.
+    """
+    
+    def __init__(
+        self,
+        status_manager,
+        job_id: str,
+        total_steps: int,
+        telemetry: Optional[TelemetrySampler] = None,
+        step_metrics: Optional[StepMetricsCallback] = None
+    ):
         self.status_manager = status_manager
         self.job_id = job_id
         self.total_steps = total_steps
         self.start_time = time.time()
+        self.start_step = 0
+        self.eval_metrics: Dict[str, float] = {}
+        self.callback_seconds = 0.0
+        self.callback_calls = 0
+        self.telemetry = telemetry
+        self.step_metrics = step_metrics
+        self.telemetry_metrics: Dict[str, Any] = {}
+        self._telemetry_reported = float('-inf')
+    
+    def on_train_begin(self, args, state, control, **kwargs):
+        """Called once training starts (after any checkpoint has been restored)."""
+        self.start_time = time.time()
+        self.start_step = state.global_step
         
     def on_step_end(self, args, state, control, **kwargs):
         """Called at the end of each training step."""
+        started = time.perf_counter()
         current_step = state.global_step
         current_epoch = int(state.epoch) if state.epoch else 0
         
@@ -70,10 +161,10 @@ class ProgressCallback(TrainerCallback):
         
         # Calculate throughput
         elapsed_time = time.time() - self.start_time
-        throughput = current_step / elapsed_time if elapsed_time > 0 else 0
+        throughput = (current_step - self.start_step) / elapsed_time if elapsed_time > 0 else 0
         
-        # Get GPU utilization
-        gpu_util = self._get_gpu_utilization()
+        # GPU/host telemetry and throughput aggregated over the last report window
+        telemetry_metrics = self._telemetry_nowait()
         
         # Update status
         self.status_manager.update_status(
@@ -87,7 +178,9 @@ class ProgressCallback(TrainerCallback):
                 'training_loss': training_loss,
                 'learning_rate': learning_rate,
                 'throughput': throughput,
-                'gpu_utilization': gpu_util,
+                'gpu_utilization': telemetry_metrics.get('gpu_utilization', 0.0),
+                **telemetry_metrics,
+                **self.eval_metrics,
             }
         )
         
@@ -97,32 +190,146 @@ class ProgressCallback(TrainerCallback):
                 f"Step {current_step}/{self.total_steps} "
                 f"({progress:.1f}%) - Loss: {training_loss:.4f}"
             )
+        
+        self.callback_seconds += time.perf_counter() - started
+        self.callback_calls += 1
+    
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        """Called after each evaluation on the validation split."""
+        if not metrics or 'eval_loss' not in metrics:
+            return
+        
+        eval_loss = metrics['eval_loss']
+        self.eval_metrics = {
+            'eval_loss': eval_loss,
+            'eval_perplexity': math.exp(eval_loss) if eval_loss < 50 else float('inf'),
+        }
+        if state.best_metric is not None:
+            self.eval_metrics['best_eval_loss'] = min(state.best_metric, eval_loss)
+        
+        logger.info(
+            f"Eval at step {state.global_step}: loss {eval_loss:.4f}, "
+            f"perplexity {self.eval_metrics['eval_perplexity']:.2f}"
+        )
+        
+        self.status_manager.update_status(
+            job_id=self.job_id,
+            status='running',
+            stage='training',
+            progress=(state.global_step / self.total_steps) * 100,
+            current_epoch=int(state.epoch) if state.epoch else 0,
+            current_step=state.global_step,
+            metrics=dict(self.eval_metrics)
+        )
     
     def on_epoch_end(self, args, state, control, **kwargs):
         """Called at the end of each epoch."""
         current_epoch = int(state.epoch) if state.epoch else 0
         logger.info(f"Completed epoch {current_epoch}")
     
-    def _get_gpu_utilization(self) -> float:
-        """Get current GPU utilization percentage."""
-        try:
-            result = subprocess.run(
-                ['nvidia-smi', '--query-gpu=utilization.gpu', '--format=csv,noheader,nounits'],
-                capture_output=True,
-                text=True,
-                timeout=2
-            )
-            if result.returncode == 0:
-                return float(result.stdout.strip().split('\n')[0])
-        except Exception as e:
-            logger.warning(f"Failed to get GPU utilization: {e}")
-        return 0.0
+    @property
+    def callback_ms_per_step(self) -> float:
+        """Mean time the training loop spent in on_step_end."""
+        return self.callback_seconds * 1000 / self.callback_calls if self.callback_calls else 0.0
+    
+    def _telemetry_nowait(self) -> Dict[str, Any]:
+        """Aggregate buffered telemetry once per TELEMETRY_REPORT_SECONDS; otherwise reuse the last window."""
+        now = time.monotonic()
+        if now - self._telemetry_reported >= TELEMETRY_REPORT_SECONDS:
+            self._telemetry_reported = now
+            if self.telemetry:
+                self.telemetry_metrics.update(self.telemetry.report())
+            if self.step_metrics:
+                # Histograms stay out of status updates; they are in the final result
+                snapshot = self.step_metrics.snapshot()
+                snapshot.pop('step_phase_histograms')
+                self.telemetry_metrics.update(snapshot)
+        return self.telemetry_metrics
+
+
+class BestCheckpointGuard(TrainerCallback):
+    """
+    Keeps load_best_model_at_end pointed at a checkpoint that exists.
+    
+    A resumed job's trainer state can name a best checkpoint from the
+    previous attempt's temp dir. It is re-pointed to the same checkpoint
+    under the current output_dir when present, or cleared (so the next
+    evaluation becomes the best) when it is gone. After every save the
+    best checkpoint is checked again, and `restorable` reports whether
+    the end-of-training restore has a checkpoint to load.
+    """
+    
+    def __init__(self):
+        self.restorable = False
+    
+    def _check(self, args, state) -> None:
+        best = state.best_model_checkpoint
+        if not best:
+            self.restorable = False
+            return
+        if not os.path.isdir(best):
+            local = os.path.join(args.output_dir, os.path.basename(os.path.normpath(best)))
+            if os.path.isdir(local):
+                logger.info(f"Best checkpoint re-pointed to {local}")
+                state.best_model_checkpoint = best = local
+            else:
+                logger.warning(f"Best checkpoint {best} is missing - best-model tracking restarts")
+                state.best_model_checkpoint = None
+                state.best_metric = None
+                self.restorable = False
+                return
+        self.restorable = True
+    
+    def on_train_begin(self, args, state, control, **kwargs):
+        """Runs after a resumed trainer state has been loaded."""
+        self._check(args, state)
+    
+    def on_save(self, args, state, control, **kwargs):
+        self._check(args, state)
+
+
+class PreparedDataCache:
+    """
+    Prepared training sets shared by the adapters of one sweep job.
+    
+    Entries are keyed by the dataset URL and DATA_HYPERPARAMETERS, so
+    adapters that only differ in rank, alpha, learning rate, batch size or
+    epochs reuse one parsed, deduplicated and tokenized dataset.
+    """
+    
+    def __init__(self, root: str):
+        self.datasets = TokenizedDatasetCache(root)
+        self.meta: Dict[str, Dict[str, Any]] = {}
+    
+    @staticmethod
+    def key(dataset_url: str, hyperparameters: Dict[str, Any]) -> str:
+        settings = {name: hyperparameters.get(name) for name in DATA_HYPERPARAMETERS}
+        payload = json.dumps({'dataset_url': dataset_url, 'settings': settings}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str):
+        """Return (dataset, eval_dataset, meta) for a key, or None."""
+        if key not in self.meta:
+            return None
+        dataset = self.datasets.load(key)
+        eval_dataset = self.datasets.load(f"{key}-eval") if self.meta[key]['has_eval'] else None
+        return (dataset, eval_dataset, self.meta[key]) if dataset is not None else None
+    
+    def put(self, key: str, dataset: Dataset, eval_dataset: Optional[Dataset], meta: Dict[str, Any]):
+        """Store a prepared train/eval pair and return the memory-mapped copies."""
+        self.meta[key] = dict(meta, has_eval=eval_dataset is not None)
+        if eval_dataset is not None:
+            eval_dataset = self.datasets.save(f"{key}-eval", eval_dataset)
+        return self.datasets.save(key, dataset), eval_dataset
 
 
 def download_dataset(dataset_url: str, output_path: str) -> bool:
     """
     Download dataset from Supabase Storage.
     
+    Large objects are fetched with parallel ranged requests and resumed
+    from completed parts on retry; see downloader.RangedDownloader.
+    
     Args:
         dataset_url: Signed URL to dataset file
         output_path: Local path to save dataset
@@ -133,27 +340,19 @@ def download_dataset(dataset_url: str, output_path: str) -> bool:
     logger.info(f"Downloading dataset from: {dataset_url[:60]}...")
     
     try:
-        response = requests.get(dataset_url, stream=True, timeout=300)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    
-                    # Log progress every 10MB
-                    if downloaded % (10 * 1024 * 1024) == 0:
-                        progress = (downloaded / total_size * 100) if total_size > 0 else 0
-                        logger.info(f"Downloaded: {downloaded / 1024 / 1024:.1f}MB ({progress:.1f}%)")
-        
-        logger.info(f"Dataset downloaded successfully: {downloaded / 1024 / 1024:.1f}MB")
+        downloader = RangedDownloader(
+            max_workers=int(os.environ.get('DATASET_DOWNLOAD_CONNECTIONS', 8))
+        )
+        result = downloader.download(dataset_url, output_path)
+        
+        logger.info(
+            f"Dataset downloaded successfully: {result['bytes'] / 1024 / 1024:.1f}MB "
+            f"in {result['elapsed_seconds']:.1f}s ({result['parts']} part(s), "
+            f"checksum {'verified' if result['verified'] else 'not available'})"
+        )
         return True
         
-    except requests.RequestException as e:
+    except DownloadError as e:
         logger.error(f"Failed to download dataset: {e}")
         return False
     except Exception as e:
@@ -161,7 +360,12 @@ def download_dataset(dataset_url: str, output_path: str) -> bool:
         return False
 
 
-def load_and_prepare_dataset(dataset_path: str) -> Optional[Dataset]:
+def load_and_prepare_dataset(
+    dataset_path: str,
+    cache_dir: Optional[str] = None,
+    num_workers: Optional[int] = None,
+    validation_split: float = 0.0
+) -> Optional[Dataset]:
     """
     Load JSONL dataset and prepare for training.
     
@@ -169,8 +373,24 @@ def load_and_prepare_dataset(dataset_path: str) -> Optional[Dataset]:
     1. OpenAI Chat format: {"messages": [{"role": "user", "content": "..."}, ...]}
     2. BrightRun format: {"system_prompt": "...", "current_user_input": "...", "target_response": "..."}
     
+    Rows are converted one at a time and written straight into an Arrow
+    file under ``cache_dir``; the returned Dataset is memory-mapped from
+    that file, so peak memory stays flat regardless of dataset size.
+    Large files are split into line-aligned chunks and parsed in a process
+    pool, with results merged back in original order. Gzip and zstd files
+    are decompressed as a stream while parsing.
+    
+    With ``validation_split`` set, a boolean ``is_validation`` column marks
+    the held-out rows. Rows are assigned by a hash of their content, so the
+    split is stable across retries and identical conversations always land
+    on the same side; the column is used to split the set once it has been
+    deduplicated and tokenized.
+    
     Args:
-        dataset_path: Path to JSONL file
+        dataset_path: Path to JSONL file (plain, .gz or .zst)
+        cache_dir: Parent directory for this call's Arrow cache (defaults to the dataset's directory)
+        num_workers: Parser processes (None picks from DATASET_PARSE_WORKERS / file size)
+        validation_split: Fraction of rows to hold out for evaluation (0 disables)
         
     Returns:
         Hugging Face Dataset object or None if failed
@@ -178,110 +398,55 @@ def load_and_prepare_dataset(dataset_path: str) -> Optional[Dataset]:
     logger.info(f"Loading dataset from: {dataset_path}")
     
     try:
-        conversations = []
-        openai_loaded = 0
-        brightrun_converted = 0
-        skipped = 0
-        
-        with open(dataset_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                try:
-                    data = json.loads(line)
-                    
-                    # Skip metadata line (BrightRun format has _meta header)
-                    if '_meta' in data:
-                        logger.info(f"Line {line_num}: Skipping metadata header")
-                        continue
-                    
-                    # OpenAI Chat format (standard)
-                    if 'messages' in data:
-                        if isinstance(data['messages'], list) and len(data['messages']) > 0:
-                            conversations.append(data)
-                            openai_loaded += 1
-                            continue
-                        else:
-                            logger.warning(f"Line {line_num}: Empty 'messages' array")
-                            skipped += 1
-                            continue
-                    
-                    # BrightRun format - convert to OpenAI format
-                    if 'target_response' in data and 'current_user_input' in data:
-                        messages = []
-                        
-                        # Add system prompt if present
-                        system_prompt = data.get('system_prompt')
-                        if system_prompt and isinstance(system_prompt, str) and system_prompt.strip():
-                            messages.append({
-                                "role": "system", 
-                                "content": system_prompt.strip()
-                            })
-                        
-                        # Add conversation history (previous turns)
-                        conversation_history = data.get('conversation_history', [])
-                        if isinstance(conversation_history, list):
-                            for msg in conversation_history:
-                                if isinstance(msg, dict) and 'content' in msg:
-                                    role = msg.get('role', 'user')
-                                    content = msg.get('content', '')
-                                    if content:
-                                        messages.append({
-                                            "role": role,
-                                            "content": content
-                                        })
-                        
-                        # Add current user input
-                        user_input = data.get('current_user_input', '')
-                        if user_input:
-                            messages.append({
-                                "role": "user",
-                                "content": user_input
-                            })
-                        
-                        # Add target response (training target)
-                        target = data.get('target_response', '')
-                        if target:
-                            messages.append({
-                                "role": "assistant", 
-                                "content": target
-                            })
-                        
-                        # Only add if we have at least user+assistant pair
-                        if len([m for m in messages if m['role'] in ['user', 'assistant']]) >= 2:
-                            conversations.append({"messages": messages})
-                            brightrun_converted += 1
-                            continue
-                        else:
-                            logger.warning(f"Line {line_num}: Insufficient messages after conversion")
-                            skipped += 1
-                            continue
-                    
-                    # Unknown format
-                    logger.warning(f"Line {line_num}: Unknown format")
-                    skipped += 1
-                    
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Line {line_num}: Invalid JSON - {e}")
-                    skipped += 1
+        # A fresh cache per call: the generator fingerprint only covers the path,
+        # so a reused cache would skip parsing (leaving stats at 0) and could
+        # serve a stale Arrow file after the dataset at that path changed
+        base_dir = cache_dir or os.path.dirname(os.path.abspath(dataset_path))
+        os.makedirs(base_dir, exist_ok=True)
+        cache_dir = tempfile.mkdtemp(prefix="arrow_cache_", dir=base_dir)
+        
+        stats = {'openai_loaded': 0, 'brightrun_converted': 0, 'skipped': 0}
+        gen_kwargs = {"dataset_path": dataset_path, "stats": stats}
+        
+        compression = detect_compression(dataset_path)
+        if compression:
+            logger.info(f"Detected {compression}-compressed dataset, decompressing while parsing")
+        
+        num_workers = resolve_parse_workers(dataset_path, num_workers)
+        if num_workers > 1:
+            generator = iter_conversations_parallel
+            gen_kwargs["num_workers"] = num_workers
+        else:
+            generator = iter_conversations
+        
+        dataset = Dataset.from_generator(
+            generator,
+            features=CONVERSATION_FEATURES,
+            cache_dir=cache_dir,
+            gen_kwargs=gen_kwargs,
+        )
         
         # Log summary
         logger.info(f"=" * 60)
         logger.info(f"Dataset loading complete:")
-        logger.info(f"  - OpenAI format loaded: {openai_loaded}")
-        logger.info(f"  - BrightRun format converted: {brightrun_converted}")
-        logger.info(f"  - Skipped/invalid: {skipped}")
-        logger.info(f"  - Total conversations: {len(conversations)}")
+        logger.info(f"  - OpenAI format loaded: {stats['openai_loaded']}")
+        logger.info(f"  - BrightRun format converted: {stats['brightrun_converted']}")
+        logger.info(f"  - Skipped/invalid: {stats['skipped']}")
+        logger.info(f"  - Total conversations: {len(dataset)}")
         logger.info(f"=" * 60)
         
-        if len(conversations) == 0:
+        if len(dataset) == 0:
             logger.error("No valid conversations found in dataset")
             return None
         
-        # Create Hugging Face Dataset
-        dataset = Dataset.from_dict({"messages": [c["messages"] for c in conversations]})
+        if validation_split > 0:
+            dataset = dataset.map(
+                assign_validation_split,
+                batched=True,
+                fn_kwargs={"validation_split": validation_split},
+            )
+            held_out = sum(dataset[VALIDATION_COLUMN])
+            logger.info(f"Validation split: {held_out} of {len(dataset)} conversations held out")
         
         return dataset
         
@@ -290,6 +455,66 @@ def load_and_prepare_dataset(dataset_path: str) -> Optional[Dataset]:
         return None
 
 
+def assign_validation_split(batch, validation_split: float):
+    """Mark rows as held out by a stable hash of their messages."""
+    threshold = int(validation_split * 10000)
+    flags = []
+    for messages in batch["messages"]:
+        digest = hashlib.blake2b(json.dumps(messages, sort_keys=True).encode('utf-8'), digest_size=8).digest()
+        flags.append(int.from_bytes(digest, 'big') % 10000 < threshold)
+    return {VALIDATION_COLUMN: flags}
+
+
+def evaluation_arguments(
+    hyperparameters: Dict[str, Any],
+    checkpoint_steps: int,
+    has_eval: bool
+) -> Dict[str, Any]:
+    """
+    TrainingArguments for the eval / save schedule.
+    
+    Without a validation split, checkpoints are saved every checkpoint_steps
+    (or each epoch). With one, evaluation runs every eval_steps (default:
+    checkpoint_steps, else each epoch), checkpoints are saved on the same
+    schedule so the best one can be restored, and the lowest eval loss wins.
+    BestCheckpointGuard keeps that restore pointed at a checkpoint that
+    exists, including after a resume from synced checkpoints.
+    
+    Args:
+        hyperparameters: Training hyperparameters
+        checkpoint_steps: Requested checkpoint interval (0 for per-epoch)
+        has_eval: Whether a validation split exists
+        
+    Returns:
+        Keyword arguments for TrainingArguments
+    """
+    if not has_eval:
+        return {
+            'save_strategy': "steps" if checkpoint_steps > 0 else "epoch",
+            'save_steps': checkpoint_steps if checkpoint_steps > 0 else 500,
+        }
+    
+    eval_steps = int(hyperparameters.get('eval_steps', 0)) or checkpoint_steps
+    if eval_steps > 0:
+        # load_best_model_at_end needs saves to line up with evaluations
+        save_steps = checkpoint_steps if checkpoint_steps and checkpoint_steps % eval_steps == 0 else eval_steps
+        schedule = {
+            'evaluation_strategy': "steps",
+            'eval_steps': eval_steps,
+            'save_strategy': "steps",
+            'save_steps': save_steps,
+        }
+    else:
+        schedule = {'evaluation_strategy': "epoch", 'save_strategy': "epoch"}
+    
+    return {
+        **schedule,
+        'load_best_model_at_end': True,
+        'metric_for_best_model': "eval_loss",
+        'greater_is_better': False,
+    }
+
+
 def format_chat_template(example, tokenizer):
     """Format messages for training."""
     messages = example["messages"]
@@ -297,71 +522,316 @@ def format_chat_template(example, tokenizer):
     return {"text": text}
 
 
+def format_chat_template_batch(batch, tokenizer):
+    """Format a batch of conversations for training."""
+    texts = [
+        tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
+        for messages in batch["messages"]
+    ]
+    return {"text": texts}
+
+
+def render_and_tokenize_batch(batch, tokenizer, max_seq_length: int):
+    """Render a batch of conversations with the chat template and tokenize them for causal LM training."""
+    texts = format_chat_template_batch(batch, tokenizer)["text"]
+    encoded = tokenizer(
+        texts,
+        add_special_tokens=True,
+        truncation=True,
+        padding=False,
+        max_length=max_seq_length,
+    )
+    encoded["length"] = [len(ids) for ids in encoded["input_ids"]]
+    return {"text": texts, **encoded}
+
+
+def resolve_format_num_proc(num_examples: int) -> int:
+    """
+    Decide how many processes to use for chat-template rendering.
+    
+    Small datasets stay in-process; worker start-up would cost more than it saves.
+    
+    Args:
+        num_examples: Number of conversations to render
+        
+    Returns:
+        Process count for Dataset.map (1 means in-process)
+    """
+    env_num_proc = int(os.environ.get('FORMAT_NUM_PROC', 0))
+    if env_num_proc > 0:
+        return env_num_proc
+    if num_examples < FORMAT_PARALLEL_MIN_EXAMPLES:
+        return 1
+    return max(1, min(os.cpu_count() or 1, num_examples // FORMAT_BATCH_SIZE, 16))
+
+
+def tokenize_dataset(
+    dataset: Dataset,
+    tokenizer,
+    max_seq_length: int,
+    num_proc: Optional[int] = None,
+    fingerprint: Optional[str] = None
+) -> Dataset:
+    """
+    Render and tokenize conversations in batches, optionally across processes.
+    
+    The map function is a module-level callable with the tokenizer passed
+    through fn_kwargs, so the result fingerprint is deterministic.
+    
+    Args:
+        dataset: Dataset with a "messages" column
+        tokenizer: Tokenizer for the base model
+        max_seq_length: Truncation length
+        num_proc: Worker processes (None picks from FORMAT_NUM_PROC / dataset size)
+        fingerprint: Explicit fingerprint for the resulting dataset
+        
+    Returns:
+        Dataset with text, input_ids, attention_mask and length columns
+    """
+    if num_proc is None:
+        num_proc = resolve_format_num_proc(len(dataset))
+    
+    logger.info(f"Rendering {len(dataset)} conversations (batch size {FORMAT_BATCH_SIZE}, {num_proc} process(es))")
+    
+    return dataset.map(
+        render_and_tokenize_batch,
+        batched=True,
+        batch_size=FORMAT_BATCH_SIZE,
+        num_proc=num_proc if num_proc > 1 else None,
+        fn_kwargs={"tokenizer": tokenizer, "max_seq_length": max_seq_length},
+        # The validation flag rides along until the train/eval split
+        remove_columns=[c for c in dataset.column_names if c != VALIDATION_COLUMN],
+        new_fingerprint=fingerprint,
+        desc="Rendering chat template",
+    )
+
+
+def resolve_model_path(base_model: str) -> Tuple[str, bool]:
+    """
+    Decide where to load the base model from.
+    
+    Priority: 1) MODEL_PATH if it exists locally, 2) a snapshot in the local
+    model store (waiting for an in-progress prefetch), 3) the Hub model ID,
+    which downloads inline.
+    
+    A model store without a snapshot is a prefetch miss: the snapshot is
+    fetched inline, or with MODEL_STORE_REQUIRE_PREFETCH=1 the job fails.
+    
+    Args:
+        base_model: Hugging Face model ID from the hyperparameters
+        
+    Returns:
+        Tuple of (local directory or model ID to pass to from_pretrained,
+        whether the model store missed)
+        
+    Raises:
+        PrefetchMissError: If a prefetch is required and the snapshot is missing
+    """
+    env_model_path = os.environ.get('MODEL_PATH')
+    if env_model_path and os.path.exists(env_model_path):
+        logger.info(f"Using cached model from: {env_model_path}")
+        return env_model_path, False
+    
+    model_store = ModelStore.from_env()
+    if model_store:
+        prefetch_miss = model_store.resolve(base_model) is None
+        if prefetch_miss:
+            require_prefetch = os.environ.get('MODEL_STORE_REQUIRE_PREFETCH', '').lower() in ('1', 'true', 'yes')
+            logger.warning(
+                f"Prefetch miss: no snapshot of {base_model} in the model store - "
+                f"{'waiting for an in-progress prefetch only' if require_prefetch else 'fetching inline'}"
+            )
+            model_path = model_store.ensure(base_model, fetch=not require_prefetch)
+        else:
+            model_path = model_store.ensure(base_model)
+        logger.info(f"Using model snapshot from: {model_path}")
+        return model_path, prefetch_miss
+    
+    logger.info(f"Downloading model from HuggingFace: {base_model}")
+    return base_model, False
+
+
 def train_lora_model(
     job_id: str,
     dataset_url: str,
     hyperparameters: Dict[str, Any],
     gpu_config: Dict[str, Any],
     callback_url: Optional[str],
-    status_manager
+    status_manager,
+    dist_context=None,
+    prepared_data: Optional[PreparedDataCache] = None,
+    webhooks: Optional[WebhookDispatcher] = None
 ) -> Dict[str, Any]:
     """
     Main training function.
     
+    With a DistributedContext (see distributed.py) this runs as one rank of
+    a data-parallel job: rank 0 prepares the dataset and shares it through
+    the job's shared work dir, every rank trains, and only rank 0 saves and
+    uploads the adapter.
+    
     Args:
         job_id: Unique job identifier
         dataset_url: Signed URL to dataset
         hyperparameters: Training hyperparameters
         gpu_config: GPU configuration
-        callback_url: URL for status callbacks
+        callback_url: Webhook URL for job events (see webhooks.py)
         status_manager: StatusManager instance
+        dist_context: DistributedContext when launched as a rank, else None
+        prepared_data: Cache of prepared datasets shared across a sweep's adapters
+        webhooks: Dispatcher owned by the caller (a sweep); status events are then the caller's
         
     Returns:
         Dictionary with training results
     """
+    is_main = dist_context is None or dist_context.is_main
+    validation_split = float(hyperparameters.get('validation_split', 0.0))
+    eval_dataset = None
     temp_dir = None
+    model_executor = None
+    model_future = None
+    model_lease = None
+    trainer = None
+    checkpoint_sync = None
+    status_reporter = None
+    telemetry = None
+    step_metrics = None
+    metrics_server = None
+    stage_profiler = None
+    owned_webhooks = None
+    discard_model = False
+    
+    # Push job events to callback_url; only rank 0 reports
+    if is_main and callback_url and webhooks is None:
+        webhooks = owned_webhooks = WebhookDispatcher(callback_url, job_id)
+        status_manager = WebhookStatusManager(status_manager, webhooks)
     
     try:
-        # Create temporary directory for this job
-        temp_dir = tempfile.mkdtemp(prefix=f"job_{job_id}_")
-        logger.info(f"Working directory: {temp_dir}")
+        stage_profiler = StageProfiler(job_id)
+        stage_profiler.start('setup')
         
-        # Step 1: Download dataset
-        logger.info("=" * 80)
-        logger.info("STEP 1: Downloading dataset")
-        logger.info("=" * 80)
+        # Create temporary directory for this job (ranks share the launcher's)
+        temp_dir = dist_context.work_dir if dist_context else tempfile.mkdtemp(prefix=f"job_{job_id}_")
+        logger.info(f"Working directory: {temp_dir}")
         
-        status_manager.update_status(
-            job_id=job_id,
-            status='running',
-            stage='downloading',
-            progress=5.0
-        )
+        # GPU/host sampling for the whole job; only rank 0 reports it
+        if is_main:
+            telemetry = TelemetrySampler.from_env().start()
         
-        dataset_path = os.path.join(temp_dir, "dataset.jsonl")
-        if not download_dataset(dataset_url, dataset_path):
-            raise Exception("Dataset download failed - please check URL and retry")
+        # Start loading the base model now so it overlaps download and parsing;
+        # Step 3 joins it. Warm workers reuse the model from the previous job.
+        batching_mode = resolve_batching_mode(hyperparameters)
+        model_kwargs = {}
+        if batching_mode == 'packing':
+            # The collator's block-diagonal 4-D mask keeps packed conversations apart
+            model_kwargs['attn_implementation'] = PACKED_ATTENTION_IMPLEMENTATION
         
-        # Step 2: Load and prepare dataset
-        logger.info("=" * 80)
-        logger.info("STEP 2: Loading and preparing dataset")
-        logger.info("=" * 80)
+        base_model = hyperparameters.get('base_model', 'mistralai/Mistral-7B-v0.1')
         
-        status_manager.update_status(
-            job_id=job_id,
-            status='running',
-            stage='preparing',
-            progress=10.0
+        # Configure 4-bit quantization (QLoRA)
+        quantization_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_compute_dtype=torch.float16,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_use_double_quant=True
         )
         
-        dataset = load_and_prepare_dataset(dataset_path)
-        if dataset is None:
-            raise Exception("Dataset loading failed - invalid format or empty file")
+        model_source = {'prefetch_miss': False}
+        
+        def load_base_model():
+            model_path, model_source['prefetch_miss'] = resolve_model_path(base_model)
+            return get_model_registry().acquire(
+                model_path,
+                quantization_config,
+                device_map=dist_context.device_map if dist_context else "auto",
+                torch_dtype=torch.float16,
+                **model_kwargs
+            )
+        
+        model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-load')
+        model_future = model_executor.submit(load_base_model)
+        
+        # An earlier adapter of the same sweep may already have prepared this dataset
+        prepared_key = PreparedDataCache.key(dataset_url, hyperparameters) if prepared_data else None
+        prepared = prepared_data.get(prepared_key) if prepared_data else None
+        if prepared:
+            logger.info("Reusing dataset prepared for an earlier adapter in this job - skipping steps 1, 2 and 5")
+        
+        # Only rank 0 fetches and parses the dataset
+        if is_main and not prepared:
+            # Step 1: Download dataset (or reuse the worker's dataset cache)
+            logger.info("=" * 80)
+            logger.info("STEP 1: Downloading dataset")
+            logger.info("=" * 80)
+            stage_profiler.start('download')
+            
+            dataset_cache = DatasetCache.from_env()
+            cache_key = dataset_cache.object_key(dataset_url) if dataset_cache else None
+            dataset_path = dataset_cache.lookup(cache_key) if cache_key else None
+            
+            if dataset_path:
+                logger.info(f"Dataset cache hit - skipping download: {dataset_path}")
+            else:
+                status_manager.update_status(
+                    job_id=job_id,
+                    status='running',
+                    stage='downloading',
+                    progress=5.0
+                )
+            
+                if dataset_cache:
+                    dataset_path = dataset_cache.staging_path(cache_key)
+                else:
+                    dataset_path = os.path.join(temp_dir, "dataset.jsonl")
+            
+                if not download_dataset(dataset_url, dataset_path):
+                    # Keyed staging files are kept so a retried job can resume them
+                    if dataset_cache:
+                        dataset_cache.release_staging(dataset_path)
+                        if not dataset_path.endswith('.part') and os.path.exists(dataset_path):
+                            os.remove(dataset_path)
+                    raise Exception("Dataset download failed - please check URL and retry")
+            
+                if dataset_cache:
+                    dataset_path = dataset_cache.put(dataset_path, cache_key)
+                stage_profiler.add_bytes(os.path.getsize(dataset_path))
+            
+            # The cached blob stays pinned against eviction until it has been parsed
+            try:
+                # Fail fast if the background model load has already failed
+                if model_future.done():
+                    model_future.result()
+                
+                # Step 2: Load and prepare dataset
+                logger.info("=" * 80)
+                logger.info("STEP 2: Loading and preparing dataset")
+                logger.info("=" * 80)
+                stage_profiler.start('parse', cpu_bound=True)
+                
+                status_manager.update_status(
+                    job_id=job_id,
+                    status='running',
+                    stage='preparing',
+                    progress=10.0
+                )
+                
+                dataset = load_and_prepare_dataset(
+                    dataset_path,
+                    cache_dir=os.path.join(temp_dir, "arrow_cache"),
+                    validation_split=validation_split
+                )
+            finally:
+                if dataset_cache:
+                    dataset_cache.release(dataset_path)
+            
+            if dataset is None:
+                raise Exception("Dataset loading failed - invalid format or empty file")
         
         # Step 3: Load model with 4-bit quantization
         logger.info("=" * 80)
         logger.info("STEP 3: Loading base model with 4-bit quantization")
         logger.info("=" * 80)
+        stage_profiler.start('model_wait')
         
         status_manager.update_status(
             job_id=job_id,
@@ -370,42 +840,18 @@ def train_lora_model(
             progress=15.0
         )
         
-        # Determine model source: environment variable, local path, or HuggingFace
-        env_model_path = os.environ.get('MODEL_PATH')
-        base_model = hyperparameters.get('base_model', 'mistralai/Mistral-7B-v0.1')
-        
-        # Priority: 1) ENV var if exists locally, 2) hyperparameters base_model
-        if env_model_path and os.path.exists(env_model_path):
-            model_path = env_model_path
-            logger.info(f"Using cached model from: {model_path}")
-        else:
-            # Use HuggingFace model ID from hyperparameters (will download)
-            model_path = base_model
-            logger.info(f"Downloading model from HuggingFace: {model_path}")
-        
-        # Configure 4-bit quantization (QLoRA)
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_compute_dtype=torch.float16,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_use_double_quant=True
+        if not model_future.done():
+            logger.info("Waiting for base model load to finish...")
+        wait_start = time.time()
+        model_lease = model_future.result()
+        model_wait_seconds = time.time() - wait_start
+        logger.info(
+            f"Base model ready ({'warm' if model_lease.reused else f'loaded in {model_lease.load_seconds:.1f}s'}, "
+            f"waited {model_wait_seconds:.1f}s after dataset preparation)"
         )
         
-        logger.info("Loading tokenizer...")
-        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
-        
-        # Set pad token if not present
-        if tokenizer.pad_token is None:
-            tokenizer.pad_token = tokenizer.eos_token
-        
-        logger.info("Loading model with 4-bit quantization...")
-        model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            quantization_config=quantization_config,
-            device_map="auto",
-            trust_remote_code=True,
-            torch_dtype=torch.float16
-        )
+        tokenizer = model_lease.tokenizer
+        model = model_lease.model
         
         logger.info(f"Model loaded successfully on device: {model.device}")
         
@@ -413,6 +859,7 @@ def train_lora_model(
         logger.info("=" * 80)
         logger.info("STEP 4: Configuring LoRA adapters")
         logger.info("=" * 80)
+        stage_profiler.start('configure_lora')
         
         status_manager.update_status(
             job_id=job_id,
@@ -436,9 +883,8 @@ def train_lora_model(
         logger.info(f"LoRA Config: r={lora_config.r}, alpha={lora_config.lora_alpha}, dropout={lora_config.lora_dropout}")
         logger.info(f"Target modules: {lora_config.target_modules}")
         
-        # Prepare model for k-bit training
-        model = prepare_model_for_kbit_training(model)
-        model = get_peft_model(model, lora_config)
+        # The registry prepared the base model for k-bit training when it was loaded
+        model = model_lease.attach_adapter(lora_config)
         
         trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
         total_params = sum(p.numel() for p in model.parameters())
@@ -448,50 +894,306 @@ def train_lora_model(
         logger.info("=" * 80)
         logger.info("STEP 5: Formatting training data")
         logger.info("=" * 80)
-        
-        dataset = dataset.map(lambda x: format_chat_template(x, tokenizer), num_proc=1)
+        stage_profiler.start('prepare_data', cpu_bound=True)
+        
+        if is_main and not prepared:
+            length_policy = hyperparameters.get('length_policy', 'truncate')
+            length_profile = hyperparameters.get('length_profile', 'auto')
+            dedup_mode = hyperparameters.get('dedup', 'none')
+            dedup_threshold = float(hyperparameters.get('dedup_threshold', 0.85))
+            requested_max_seq_length = hyperparameters.get('max_seq_length', 2048)
+            
+            # Every request setting that decides which rows are kept and how they are tokenized
+            row_selection = {
+                'length_policy': length_policy,
+                'length_profile': length_profile,
+                'dedup': dedup_mode,
+                'dedup_threshold': dedup_threshold if dedup_mode == 'near' else None,
+                'validation_split': validation_split or None,
+            }
+            if requested_max_seq_length == 'auto':
+                row_selection['max_seq_length_percentile'] = float(hyperparameters.get('max_seq_length_percentile', 99))
+                row_selection['max_seq_length_cap'] = int(hyperparameters.get('max_seq_length_cap', 2048))
+            
+            # Checked before any pass over the data, so a hit skips profiling, dedup and tokenization
+            tokenized_cache = TokenizedDatasetCache.from_env()
+            tokenized_key = None
+            tokenized = None
+            
+            if tokenized_cache:
+                if dataset_cache and os.path.dirname(dataset_path) == dataset_cache.blob_dir:
+                    dataset_hash = os.path.basename(dataset_path)
+                else:
+                    dataset_hash = file_sha256(dataset_path)
+                tokenized_key = tokenized_cache_key(
+                    dataset_hash, tokenizer, tokenizer.chat_template, requested_max_seq_length, row_selection
+                )
+                cached_meta = tokenized_cache.load_metadata(tokenized_key)
+                if cached_meta is not None:
+                    tokenized = tokenized_cache.load(tokenized_key)
+            
+            if tokenized is not None:
+                max_seq_length = cached_meta['max_seq_length']
+                token_length_stats = cached_meta['token_length_stats']
+                dedup_stats = cached_meta['dedup_stats']
+                logger.info("Reusing tokenized dataset - skipping length profiling, deduplication and tokenization")
+            else:
+                # Token-length pre-pass: histogram, max_seq_length selection, outlier policy
+                lengths, profile_mode = profile_token_lengths(dataset, tokenizer, mode=length_profile)
+                
+                # Remove exact and near-duplicate conversations before formatting
+                dataset, dedup_stats, kept_rows = deduplicate(
+                    dataset, temp_dir, mode=dedup_mode, lengths=lengths, threshold=dedup_threshold
+                )
+                if len(kept_rows) != len(lengths):
+                    lengths = [lengths[i] for i in kept_rows]
+                
+                logger.info("=" * 60)
+                logger.info(f"Deduplication ({dedup_mode}):")
+                logger.info(f"  - Exact duplicates removed: {dedup_stats['exact_removed']}")
+                logger.info(f"  - Near duplicates removed: {dedup_stats['near_removed']}")
+                logger.info(f"  - Tokens saved: {dedup_stats['tokens_saved']}")
+                logger.info(f"  - Conversations kept: {dedup_stats['kept']}")
+                logger.info("=" * 60)
+                
+                if requested_max_seq_length == 'auto':
+                    max_seq_length = select_max_seq_length(
+                        lengths,
+                        percentile=row_selection['max_seq_length_percentile'],
+                        cap=row_selection['max_seq_length_cap']
+                    )
+                else:
+                    max_seq_length = int(requested_max_seq_length)
+                
+                token_length_stats = length_stats(lengths, max_seq_length)
+                dataset, lengths, dropped = apply_length_policy(dataset, lengths, max_seq_length, length_policy)
+                token_length_stats.update({
+                    'profile_mode': profile_mode,
+                    'max_seq_length': max_seq_length,
+                    'length_policy': length_policy,
+                    'dropped': dropped,
+                })
+                
+                fingerprint = tokenized_key or tokenized_cache_key(
+                    dataset._fingerprint, tokenizer, tokenizer.chat_template, max_seq_length, row_selection
+                )
+                tokenized = tokenize_dataset(dataset, tokenizer, max_seq_length, fingerprint=fingerprint[:32])
+                if tokenized_cache:
+                    tokenized = tokenized_cache.save(tokenized_key, tokenized, {
+                        'max_seq_length': max_seq_length,
+                        'token_length_stats': token_length_stats,
+                        'dedup_stats': dedup_stats,
+                    })
+            
+            logger.info(
+                f"Token lengths ({token_length_stats['profile_mode']}): mean {token_length_stats['mean']:.0f}, "
+                f"p50 {token_length_stats['p50']}, p95 {token_length_stats['p95']}, "
+                f"p99 {token_length_stats['p99']}, max {token_length_stats['max']}"
+            )
+            logger.info(f"Token length histogram: {token_length_stats['histogram']}")
+            logger.info(
+                f"max_seq_length: {max_seq_length} - {token_length_stats['over_max_seq_length']} "
+                f"conversation(s) longer ({length_policy}), {token_length_stats['dropped']} dropped"
+            )
+            
+            status_manager.update_status(
+                job_id=job_id,
+                status='running',
+                stage='configuring',
+                progress=22.0,
+                metrics={'token_length_stats': token_length_stats, 'dedup': dedup_stats}
+            )
+            
+            if validation_split > 0:
+                held_out = tokenized[VALIDATION_COLUMN]
+                eval_dataset = tokenized.select([i for i, flag in enumerate(held_out) if flag])
+                tokenized = tokenized.select([i for i, flag in enumerate(held_out) if not flag])
+                eval_dataset = eval_dataset.remove_columns(
+                    [c for c in eval_dataset.column_names if c not in TRAINING_COLUMNS]
+                )
+                logger.info(f"Train/validation split: {len(tokenized)} / {len(eval_dataset)} conversations")
+                if len(eval_dataset) == 0:
+                    logger.warning("Validation split is empty - evaluation and early stopping disabled")
+                    eval_dataset = None
+            
+            dataset = tokenized.remove_columns([c for c in tokenized.column_names if c not in TRAINING_COLUMNS])
+            
+            # Padding efficiency: real tokens / tokens processed per step
+            lengths = dataset["length"]
+            padding_before = padding_efficiency(lengths, hyperparameters['batch_size'], 'padded')
+            padding_after = padding_efficiency(lengths, hyperparameters['batch_size'], batching_mode, max_seq_length)
+            logger.info(
+                f"Batching mode: {batching_mode} - padding efficiency "
+                f"{padding_before:.1%} (padded) -> {padding_after:.1%} ({batching_mode})"
+            )
+            
+            if batching_mode == 'packing':
+                dataset = pack_dataset(dataset, max_seq_length)
+                if eval_dataset is not None:
+                    eval_dataset = pack_dataset(eval_dataset, max_seq_length)
+            
+            if prepared_data:
+                dataset, eval_dataset = prepared_data.put(prepared_key, dataset, eval_dataset, {
+                    'max_seq_length': max_seq_length,
+                    'lengths': lengths,
+                    'token_length_stats': token_length_stats,
+                    'dedup_stats': dedup_stats,
+                })
+        elif prepared:
+            dataset, eval_dataset, prepared_meta = prepared
+            max_seq_length = prepared_meta['max_seq_length']
+            token_length_stats = prepared_meta['token_length_stats']
+            dedup_stats = prepared_meta['dedup_stats']
+            lengths = prepared_meta['lengths']
+            padding_before = padding_efficiency(lengths, hyperparameters['batch_size'], 'padded')
+            padding_after = padding_efficiency(lengths, hyperparameters['batch_size'], batching_mode, max_seq_length)
+        
+        # Hand the prepared dataset and its settings to the other ranks
+        if dist_context:
+            shared_dataset_dir = os.path.join(temp_dir, "train_dataset")
+            shared_eval_dir = os.path.join(temp_dir, "eval_dataset")
+            if is_main:
+                dataset.save_to_disk(shared_dataset_dir)
+                if eval_dataset is not None:
+                    eval_dataset.save_to_disk(shared_eval_dir)
+            shared = dist_context.broadcast({
+                'has_eval': eval_dataset is not None,
+                'max_seq_length': max_seq_length,
+                'batching_mode': batching_mode,
+                'token_length_stats': token_length_stats,
+                'dedup_stats': dedup_stats,
+                'padding_before': padding_before,
+                'padding_after': padding_after,
+            } if is_main else None)
+            if not is_main:
+                dataset = load_from_disk(shared_dataset_dir)
+                eval_dataset = load_from_disk(shared_eval_dir) if shared['has_eval'] else None
+                max_seq_length = shared['max_seq_length']
+                batching_mode = shared['batching_mode']
+                token_length_stats = shared['token_length_stats']
+                dedup_stats = shared['dedup_stats']
+                padding_before = shared['padding_before']
+                padding_after = shared['padding_after']
+        
+        # Labels are input_ids with padding masked out (packed blocks carry their own labels)
+        if batching_mode == 'packing':
+            data_collator = PackedBlockCollator(pad_token_id=tokenizer.pad_token_id)
+        else:
+            data_collator = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
         
         # Step 6: Configure training
         logger.info("=" * 80)
         logger.info("STEP 6: Configuring training parameters")
         logger.info("=" * 80)
+        stage_profiler.start('training_setup')
         
         output_dir = os.path.join(temp_dir, "output")
         os.makedirs(output_dir, exist_ok=True)
         
+        # Fit the requested batch into memory with micro-batches + gradient accumulation
+        batch_size = hyperparameters['batch_size']
+        batch_plan = {
+            'micro_batch_size': batch_size,
+            'gradient_accumulation_steps': 1,
+            'effective_batch_size': batch_size,
+        }
+        if hyperparameters.get('auto_batch_size', False):
+            # Ranks must agree on the plan, so rank 0 probes and shares it
+            if is_main:
+                batch_plan = plan_batching(batch_size, StepMemoryProbe(model, max_seq_length))
+            if dist_context:
+                batch_plan = dist_context.broadcast(batch_plan if is_main else None)
+            logger.info(
+                f"Auto batch size: micro-batch {batch_plan['micro_batch_size']} x "
+                f"{batch_plan['gradient_accumulation_steps']} accumulation steps "
+                f"= effective batch {batch_plan['effective_batch_size']}"
+            )
+        
         # Calculate total steps for progress tracking
-        steps_per_epoch = len(dataset) // hyperparameters['batch_size']
+        world_size = dist_context.world_size if dist_context else 1
+        steps_per_epoch = len(dataset) // (batch_plan['effective_batch_size'] * world_size)
         total_steps = steps_per_epoch * hyperparameters.get('epochs', hyperparameters.get('num_epochs', 3))
         
-        logger.info(f"Dataset size: {len(dataset)}")
-        logger.info(f"Batch size: {hyperparameters['batch_size']}")
+        logger.info(f"Dataset size: {len(dataset)}{' packed blocks' if batching_mode == 'packing' else ''}")
+        logger.info(f"Batch size: {batch_size}")
         logger.info(f"Epochs: {hyperparameters.get('epochs', hyperparameters.get('num_epochs', 3))}")
         logger.info(f"Steps per epoch: {steps_per_epoch}")
         logger.info(f"Total training steps: {total_steps}")
         
+        # Checkpoints are synced to object storage so a retried job can resume
+        checkpoint_steps = int(hyperparameters.get('checkpoint_steps', os.environ.get('CHECKPOINT_STEPS', 0)))
+        checkpoint_store = CheckpointStore.from_env(job_id)
+        resume_checkpoint = None
+        if checkpoint_store and is_main:
+            resume_checkpoint = checkpoint_store.download_latest(output_dir)
+            if resume_checkpoint:
+                logger.info(f"Resuming from checkpoint: {resume_checkpoint}")
+            snapshot_dir = os.path.join(temp_dir, "checkpoint_sync")
+            os.makedirs(snapshot_dir, exist_ok=True)
+            checkpoint_sync = CheckpointSyncCallback(
+                checkpoint_store,
+                snapshot_dir,
+                on_synced=(lambda step: webhooks.emit('checkpoint', {'step': step, 'synced': True})) if webhooks else None
+            )
+        if dist_context:
+            resume_checkpoint = dist_context.broadcast(resume_checkpoint)
+        
         training_args = TrainingArguments(
             output_dir=output_dir,
             num_train_epochs=hyperparameters.get('epochs', hyperparameters.get('num_epochs', 3)),
-            per_device_train_batch_size=hyperparameters['batch_size'],
-            gradient_accumulation_steps=1,
+            per_device_train_batch_size=batch_plan['micro_batch_size'],
+            gradient_accumulation_steps=batch_plan['gradient_accumulation_steps'],
+            per_device_eval_batch_size=batch_plan['micro_batch_size'],
             learning_rate=hyperparameters['learning_rate'],
             logging_steps=10,
-            save_strategy="epoch",
+            save_total_limit=2,
+            **evaluation_arguments(hyperparameters, checkpoint_steps, eval_dataset is not None),
             fp16=True,
             optim="adamw_torch",
             warmup_ratio=0.1,
             lr_scheduler_type="cosine",
             report_to="none",
-            remove_unused_columns=False,
+            # Only model inputs reach the collator; "length" feeds the sampler
+            remove_unused_columns=True,
+            group_by_length=batching_mode == 'group_by_length',
+            length_column_name="length",
+            # LoRA with gradient checkpointing uses every trainable parameter each step
+            ddp_find_unused_parameters=False if dist_context else None,
         )
         
-        # Create progress callback
-        progress_callback = ProgressCallback(status_manager, job_id, total_steps)
+        # Create progress callback; per-step updates are delivered off the training loop
+        status_reporter = AsyncStatusReporter(status_manager)
+        step_metrics = StepMetricsCallback()
+        progress_callback = ProgressCallback(
+            status_reporter, job_id, total_steps, telemetry=telemetry, step_metrics=step_metrics
+        )
+        callbacks = [progress_callback]
+        if checkpoint_sync:
+            callbacks.append(checkpoint_sync)
+        if webhooks and is_main:
+            callbacks.append(WebhookCallback(webhooks))
+        
+        # load_best_model_at_end is on whenever there is a validation split
+        best_checkpoint_guard = BestCheckpointGuard() if eval_dataset is not None else None
+        if best_checkpoint_guard:
+            callbacks.append(best_checkpoint_guard)
+        
+        early_stopping_patience = int(hyperparameters.get('early_stopping_patience', 0))
+        if eval_dataset is not None and early_stopping_patience > 0:
+            callbacks.append(EarlyStoppingCallback(
+                early_stopping_patience=early_stopping_patience,
+                early_stopping_threshold=float(hyperparameters.get('early_stopping_threshold', 0.0))
+            ))
+            logger.info(f"Early stopping after {early_stopping_patience} evaluations without improvement")
+        
+        # Last, so time in the other callbacks is not counted as data loading
+        callbacks.append(step_metrics)
         
         # Step 7: Train model
         logger.info("=" * 80)
         logger.info("STEP 7: Training LoRA adapters")
         logger.info("=" * 80)
+        stage_profiler.start('train')
         
         status_manager.update_status(
             job_id=job_id,
@@ -499,38 +1201,70 @@ def train_lora_model(
             stage='training',
             progress=25.0,
             current_epoch=0,
-            current_step=0
+            current_step=0,
+            metrics={
+                'batching_mode': batching_mode,
+                'padding_efficiency_before': padding_before,
+                'padding_efficiency_after': padding_after,
+                **batch_plan,
+                'resumed_from_checkpoint': resume_checkpoint is not None,
+            }
         )
         
-        trainer = SFTTrainer(
+        # The dataset is already tokenized and the model already carries the LoRA adapter
+        trainer = Trainer(
             model=model,
             args=training_args,
             train_dataset=dataset,
-            dataset_text_field="text",
-            max_seq_length=2048,
-            callbacks=[progress_callback],
+            eval_dataset=eval_dataset,
+            tokenizer=tokenizer,
+            data_collator=data_collator,
+            callbacks=callbacks,
         )
+        step_metrics.attach(trainer)
+        if is_main:
+            metrics_server = start_metrics_server(
+                lambda: {**(telemetry.summary() if telemetry else {}), **step_metrics.snapshot()}
+            )
         
         logger.info("Starting training...")
         train_start = time.time()
         
         try:
-            trainer.train()
+            trainer.train(resume_from_checkpoint=resume_checkpoint)
             train_duration = time.time() - train_start
             logger.info(f"Training completed in {train_duration/60:.2f} minutes")
         except RuntimeError as e:
             if "out of memory" in str(e).lower():
+                discard_model = True
                 raise Exception(
                     "CUDA Out of Memory: Try reducing batch_size (current: "
-                    f"{hyperparameters['batch_size']}) or lora_rank (current: "
-                    f"{hyperparameters['lora_rank']})"
+                    f"{batch_size}) or rank (current: {lora_config.r}), "
+                    "or set auto_batch_size to fit it with gradient accumulation"
                 )
             raise
+        finally:
+            # Deliver the last progress update before any later status change
+            status_reporter.close()
+        
+        logger.info(
+            f"Progress callback overhead: {progress_callback.callback_ms_per_step:.3f}ms/step "
+            f"over {progress_callback.callback_calls} steps"
+        )
+        
+        # Other ranks are done once training has finished everywhere
+        if not is_main:
+            return {
+                "status": "completed",
+                "job_id": job_id,
+                "rank": dist_context.rank,
+            }
         
         # Step 8: Save adapter
         logger.info("=" * 80)
         logger.info("STEP 8: Saving LoRA adapter")
         logger.info("=" * 80)
+        stage_profiler.start('save')
         
         status_manager.update_status(
             job_id=job_id,
@@ -547,20 +1281,11 @@ def train_lora_model(
         
         logger.info(f"Adapter saved to: {adapter_dir}")
         
-        # Step 9: Create archive
-        logger.info("Creating tar.gz archive...")
-        archive_path = os.path.join(temp_dir, f"{job_id}.tar.gz")
-        
-        with tarfile.open(archive_path, "w:gz") as tar:
-            tar.add(adapter_dir, arcname=os.path.basename(adapter_dir))
-        
-        archive_size = os.path.getsize(archive_path)
-        logger.info(f"Archive created: {archive_size / 1024 / 1024:.2f}MB")
-        
-        # Step 10: Upload to Supabase
+        # Steps 9-10: Stream the archive into storage (no temporary tarball)
         logger.info("=" * 80)
-        logger.info("STEP 10: Uploading adapter to Supabase Storage")
+        logger.info("STEP 9-10: Packing and uploading adapter to Supabase Storage")
         logger.info("=" * 80)
+        stage_profiler.start('archive_upload', cpu_bound=True)
         
         status_manager.update_status(
             job_id=job_id,
@@ -569,36 +1294,85 @@ def train_lora_model(
             progress=97.0
         )
         
+        codec = resolve_codec()
+        archive_name = f"{job_id}{EXTENSIONS[codec]}"
         supabase_url = os.environ.get('SUPABASE_URL')
         supabase_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
         
         if not supabase_url or not supabase_key:
             logger.warning("Supabase credentials not found - skipping upload")
-            adapter_path = f"local://{archive_path}"
+            sink = LocalFileSink(os.path.join(temp_dir, archive_name))
         else:
-            supabase: Client = create_client(supabase_url, supabase_key)
-            
-            storage_path = f"adapters/{job_id}.tar.gz"
-            
-            with open(archive_path, 'rb') as f:
-                response = supabase.storage.from_('lora-models').upload(
-                    storage_path,
-                    f.read(),
-                    file_options={"content-type": "application/gzip"}
-                )
-            
-            adapter_path = f"lora-models/{storage_path}"
-            logger.info(f"Adapter uploaded to: {adapter_path}")
+            sink = TusUploader(
+                supabase_url,
+                supabase_key,
+                bucket='lora-models',
+                object_name=f"adapters/{archive_name}",
+                content_type=CONTENT_TYPES[codec]
+            )
+        
+        archive = pack_directory(adapter_dir, sink, codec)
+        adapter_path = archive['path']
+        stage_profiler.add_bytes(archive['archive_bytes'])
+        logger.info(
+            f"Adapter archive ({codec}, {archive['archive_bytes'] / 1024 / 1024:.2f}MB from "
+            f"{archive['tar_bytes'] / 1024 / 1024:.2f}MB, {archive['stored_bytes'] / 1024 / 1024:.2f}MB stored) "
+            f"written to {adapter_path} in {archive['seconds']:.1f}s"
+        )
+        
+        # The finished adapter supersedes the synced checkpoints
+        if checkpoint_sync:
+            checkpoint_sync.close()
+            checkpoint_sync = None
+            try:
+                checkpoint_store.delete_all()
+            except Exception as e:
+                logger.warning(f"Failed to delete synced checkpoints: {e}")
         
         # Step 11: Complete
         logger.info("=" * 80)
         logger.info("TRAINING COMPLETE")
         logger.info("=" * 80)
         
+        stage_profile = stage_profiler.report()
+        logger.info(f"Stage profile ({stage_profile['total_seconds']:.1f}s):")
+        stage_profiler.log()
+        
+        throughput_metrics = step_metrics.snapshot()
+        logger.info(
+            f"Throughput: {throughput_metrics['tokens_per_second']:.0f} tokens/s, "
+            f"{throughput_metrics['samples_per_second']:.2f} samples/s - step phases (ms): "
+            + ", ".join(f"{phase} {ms:.1f}" for phase, ms in throughput_metrics['step_time_ms'].items())
+        )
+        
         final_metrics = {
             'training_loss': progress_callback.status_manager.get_status(job_id).get('metrics', {}).get('training_loss', 0.0),
             'total_steps': total_steps,
             'train_duration_minutes': train_duration / 60,
+            'batching_mode': batching_mode,
+            'padding_efficiency_before': padding_before,
+            'padding_efficiency_after': padding_after,
+            **batch_plan,
+            'max_seq_length': max_seq_length,
+            'world_size': world_size,
+            'token_length_stats': token_length_stats,
+            'dedup': dedup_stats,
+            **progress_callback.eval_metrics,
+            'best_eval_loss': trainer.state.best_metric,
+            'stopped_early': eval_dataset is not None and trainer.state.global_step < trainer.state.max_steps,
+            'best_checkpoint_restored': bool(best_checkpoint_guard and best_checkpoint_guard.restorable),
+            'callback_ms_per_step': progress_callback.callback_ms_per_step,
+            'telemetry': telemetry.summary() if telemetry else {},
+            **throughput_metrics,
+            'status_updates_coalesced': status_reporter.stats['coalesced'],
+            'status_updates_dropped': status_reporter.stats['dropped'],
+            'base_model_reused': model_lease.reused,
+            'base_model_load_seconds': model_lease.load_seconds,
+            'base_model_wait_seconds': model_wait_seconds,
+            'base_model_prefetch_miss': model_source['prefetch_miss'],
+            'archive_codec': archive['codec'],
+            'archive_bytes': archive['archive_bytes'],
+            'stage_profile': stage_profile,
         }
         
         status_manager.update_status(
@@ -614,6 +1388,7 @@ def train_lora_model(
             "job_id": job_id,
             "adapter_path": adapter_path,
             "metrics": final_metrics,
+            "stage_profile": stage_profile,
             "progress": 100.0
         }
         
@@ -623,30 +1398,237 @@ def train_lora_model(
         
         # Special error handling for common issues
         if "out of memory" in error_msg.lower():
+            discard_model = True
             error_msg = f"GPU Out of Memory: {error_msg}. Try reducing batch_size or lora_rank."
         elif "download" in error_msg.lower():
             error_msg = f"Download failed: {error_msg}. Please check dataset URL and retry."
         elif "nan" in error_msg.lower():
             error_msg = f"Training instability (NaN): {error_msg}. Try reducing learning_rate."
         
+        # Shows which stage the job failed in and what it cost up to then
+        stage_profile = stage_profiler.report() if stage_profiler else None
+        
         status_manager.update_status(
             job_id=job_id,
             status='failed',
-            error_message=error_msg
+            error_message=error_msg,
+            metrics={'stage_profile': stage_profile}
         )
         
         return {
             "status": "failed",
             "job_id": job_id,
-            "error_message": error_msg
+            "error_message": error_msg,
+            "stage_profile": stage_profile
         }
         
     finally:
-        # Cleanup temporary directory
-        if temp_dir and os.path.exists(temp_dir):
+        if status_reporter is not None:
+            status_reporter.close()
+        if telemetry is not None:
+            telemetry.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if step_metrics is not None:
+            step_metrics.detach()
+        
+        # Let in-flight checkpoint uploads finish so a retry can resume from them
+        if checkpoint_sync is not None:
+            checkpoint_sync.close()
+        
+        # After the status reporter and checkpoint sync, so their last events are queued
+        if owned_webhooks is not None:
+            owned_webhooks.close()
+        
+        # A failed job may leave the background load running; wait so its lease is returned
+        if model_future is not None and model_lease is None:
+            try:
+                model_lease = model_future.result()
+            except Exception:
+                pass
+        if model_executor is not None:
+            model_executor.shutdown(wait=False)
+        
+        # Strip this job's adapter and hand the base model back for the next job
+        if model_lease is not None:
+            trainer = None
+            model = None
+            try:
+                get_model_registry().release(model_lease, discard=discard_model)
+            except Exception as e:
+                logger.warning(f"Failed to release base model: {e}")
+        
+        # Cleanup temporary directory (the launcher owns a shared one)
+        if temp_dir and not dist_context and os.path.exists(temp_dir):
             try:
-                import shutil
                 shutil.rmtree(temp_dir)
                 logger.info(f"Cleaned up temporary directory: {temp_dir}")
             except Exception as e:
                 logger.warning(f"Failed to cleanup temp directory: {e}")
+
+
+class SweepStatusManager:
+    """
+    Status manager handed to one adapter of a sweep job.
+    
+    Records the adapter's own status and metrics, and reports them on the
+    sweep job as overall progress plus a per-adapter summary. An adapter
+    finishing or failing does not end the sweep, so those states are
+    reported as 'running' on the sweep job.
+    """
+    
+    def __init__(self, status_manager, job_id: str, index: int, adapters: List[Dict[str, Any]]):
+        self.status_manager = status_manager
+        self.job_id = job_id
+        self.index = index
+        self.adapters = adapters
+    
+    def update_status(self, job_id: str, status: str = None, progress: float = None,
+                      metrics: Optional[Dict[str, Any]] = None, error_message: str = None, **kwargs):
+        entry = self.adapters[self.index]
+        if status:
+            entry['status'] = status
+        if progress is not None:
+            entry['progress'] = progress
+        if metrics:
+            entry['metrics'].update(metrics)
+        if error_message:
+            entry['error_message'] = error_message
+        
+        overall = (self.index + entry['progress'] / 100.0) / len(self.adapters) * 100.0
+        if kwargs.get('stage') in ('completed', 'failed'):
+            kwargs['stage'] = f"adapter_{kwargs['stage']}"
+        self.status_manager.update_status(
+            job_id=self.job_id,
+            status='running',
+            progress=overall,
+            metrics={
+                **(metrics or {}),
+                'current_adapter': self.index,
+                'adapters': sweep_summary(self.adapters),
+            },
+            **kwargs
+        )
+    
+    def get_status(self, job_id: str) -> Dict[str, Any]:
+        return self.adapters[self.index]
+
+
+def sweep_summary(adapters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Compact per-adapter view for status metrics."""
+    return [
+        {
+            'adapter_id': entry['adapter_id'],
+            'status': entry['status'],
+            'progress': entry['progress'],
+            'training_loss': entry['metrics'].get('training_loss'),
+            'error_message': entry.get('error_message'),
+        }
+        for entry in adapters
+    ]
+
+
+def train_lora_sweep(
+    job_id: str,
+    dataset_url: str,
+    hyperparameters: Dict[str, Any],
+    hyperparameter_sets: List[Dict[str, Any]],
+    gpu_config: Dict[str, Any],
+    callback_url: Optional[str],
+    status_manager
+) -> Dict[str, Any]:
+    """
+    Train one adapter per hyperparameter set against a single loaded base model.
+    
+    Each set is merged over the shared hyperparameters and trained in turn
+    as adapter "<job_id>-<index>" with its own artifacts. The base model stays
+    resident in the model registry between adapters, and adapters with the
+    same data settings reuse one prepared dataset. A failed adapter does not
+    stop the sweep.
+    
+    Args:
+        job_id: Unique job identifier
+        dataset_url: Signed URL to dataset
+        hyperparameters: Hyperparameters shared by every adapter
+        hyperparameter_sets: Per-adapter overrides
+        gpu_config: GPU configuration
+        callback_url: Webhook URL for job events (see webhooks.py)
+        status_manager: StatusManager instance
+        
+    Returns:
+        Dictionary with per-adapter results
+    """
+    sweep_dir = tempfile.mkdtemp(prefix=f"sweep_{job_id}_")
+    prepared_data = PreparedDataCache(os.path.join(sweep_dir, "prepared"))
+    adapters = [
+        {
+            'index': index,
+            'adapter_id': f"{job_id}-{index}",
+            'hyperparameters': overrides,
+            'status': 'pending',
+            'progress': 0.0,
+            'metrics': {},
+        }
+        for index, overrides in enumerate(hyperparameter_sets)
+    ]
+    results = []
+    sweep_start = time.time()
+    
+    # One dispatcher for the whole sweep, reporting on the sweep job
+    webhooks = WebhookDispatcher(callback_url, job_id) if callback_url else None
+    if webhooks:
+        status_manager = WebhookStatusManager(status_manager, webhooks)
+    
+    logger.info(f"Sweep job {job_id}: training {len(adapters)} adapters")
+    
+    try:
+        for entry in adapters:
+            logger.info("=" * 80)
+            logger.info(f"ADAPTER {entry['index'] + 1}/{len(adapters)}: {entry['adapter_id']} {entry['hyperparameters']}")
+            logger.info("=" * 80)
+            
+            result = train_lora_model(
+                job_id=entry['adapter_id'],
+                dataset_url=dataset_url,
+                hyperparameters={**hyperparameters, **entry['hyperparameters']},
+                gpu_config=gpu_config,
+                callback_url=callback_url,
+                status_manager=SweepStatusManager(status_manager, job_id, entry['index'], adapters),
+                prepared_data=prepared_data,
+                webhooks=webhooks,
+            )
+            entry['status'] = result['status']
+            results.append(result)
+    finally:
+        shutil.rmtree(sweep_dir, ignore_errors=True)
+    
+    completed = [result for result in results if result['status'] == 'completed']
+    status = 'completed' if completed else 'failed'
+    metrics = {
+        'adapters': sweep_summary(adapters),
+        'adapters_completed': len(completed),
+        'adapters_failed': len(results) - len(completed),
+        'sweep_duration_minutes': (time.time() - sweep_start) / 60,
+    }
+    
+    logger.info(f"Sweep job {job_id} finished: {len(completed)}/{len(results)} adapters completed")
+    
+    status_manager.update_status(
+        job_id=job_id,
+        status=status,
+        stage=status,
+        progress=100.0,
+        metrics=metrics,
+        **({} if completed else {'error_message': "Every adapter in the sweep failed"})
+    )
+    if webhooks:
+        webhooks.close()
+    
+    return {
+        "status": status,
+        "job_id": job_id,
+        "adapters": results,
+        "metrics": metrics,
+        "progress": 100.0,
+        **({} if completed else {"error_message": "Every adapter in the sweep failed"}),
+    }
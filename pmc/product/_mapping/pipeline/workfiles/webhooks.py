@@ -0,0 +1,341 @@
+"""
+Webhook Delivery for Job callback_url
+
+WebhookDispatcher pushes job events to the callback_url given with the
+job, so the app does not have to poll for status. emit() only appends to
+an in-memory queue; a background thread batches and delivers events over
+one pooled HTTP session, so training never waits on the network.
+
+Delivery:
+- Events are POSTed as {"job_id", "batch_id", "sent_at", "events": [...]}.
+  Each event has a unique id, a type (status, metrics, checkpoint, error,
+  completed), a timestamp and a data object.
+- Metric events are batched for up to WEBHOOK_BATCH_SECONDS (default 2s,
+  at most WEBHOOK_MAX_BATCH events per request). Any other event is sent
+  right away, after the metric events queued before it, so order is kept.
+- A batch keeps its batch_id across retries and sends it as the
+  Idempotency-Key header, so the receiver can drop duplicate deliveries.
+- Connection errors, timeouts, 408, 429 and 5xx are retried with
+  exponential backoff and jitter (Retry-After is honoured), up to
+  WEBHOOK_MAX_RETRIES times. Other 4xx responses are not retried.
+- If WEBHOOK_SECRET is set, requests are signed with an
+  X-Webhook-Signature header: sha256=<HMAC-SHA256 of the body>.
+- The queue is bounded (WEBHOOK_QUEUE_SIZE). When it is full, the oldest
+  metric event is dropped first. close() drains the queue for up to
+  WEBHOOK_DRAIN_SECONDS.
+
+WebhookStatusManager turns status_manager updates into events, and
+WebhookCallback reports checkpoint saves from the Trainer.
+
+Author: Bright Run AI
+Date: December 28, 2025
+"""
+
+import os
+import hmac
+import json
+import time
+import uuid
+import random
+import hashlib
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from transformers import TrainerCallback
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('status', 'metrics', 'checkpoint', 'error', 'completed')
+
+DEFAULT_BATCH_SECONDS = 2.0
+DEFAULT_MAX_BATCH = 100
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_DRAIN_SECONDS = 30.0
+DEFAULT_TIMEOUT_SECONDS = 10.0
+
+# Backoff between attempts: BACKOFF_BASE * 2**attempt, capped, with +-50% jitter
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+RETRY_STATUS_CODES = (408, 429)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_webhook_session() -> requests.Session:
+    """Pooled session for webhook delivery; retries are handled by the dispatcher."""
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Content-Type'] = 'application/json'
+    return session
+
+
+class WebhookDispatcher:
+    """
+    Delivers job events to a webhook URL from a background thread.
+
+    Args:
+        url: Webhook endpoint (the job's callback_url)
+        job_id: Job the events belong to
+        session: HTTP session (default: create_webhook_session())
+        secret: HMAC key for request signatures (default: WEBHOOK_SECRET)
+        batch_seconds: Longest time metric events are held for batching
+        max_batch: Most events per request
+        max_retries: Retries per batch after the first attempt
+        max_queue: Bound on queued events
+        timeout: Per-request timeout in seconds
+    """
+
+    def __init__(
+        self,
+        url: str,
+        job_id: str,
+        session: Optional[requests.Session] = None,
+        secret: Optional[str] = None,
+        batch_seconds: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        self.url = url
+        self.job_id = job_id
+        self.session = session or create_webhook_session()
+        self.secret = secret if secret is not None else os.environ.get('WEBHOOK_SECRET')
+        self.batch_seconds = batch_seconds if batch_seconds is not None else float(
+            os.environ.get('WEBHOOK_BATCH_SECONDS', DEFAULT_BATCH_SECONDS)
+        )
+        self.max_batch = max_batch or int(os.environ.get('WEBHOOK_MAX_BATCH', DEFAULT_MAX_BATCH))
+        self.max_retries = max_retries if max_retries is not None else int(
+            os.environ.get('WEBHOOK_MAX_RETRIES', DEFAULT_MAX_RETRIES)
+        )
+        self.max_queue = max_queue or int(os.environ.get('WEBHOOK_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+        self.timeout = timeout or float(os.environ.get('WEBHOOK_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS))
+
+        self.queue: Deque[Dict[str, Any]] = deque()
+        self.condition = threading.Condition()
+        self.batch_started = time.monotonic()
+        self.urgent = False
+        self.closing = False
+        self.abort = threading.Event()
+        self.stats = {'events': 0, 'dropped': 0, 'batches': 0, 'delivered': 0, 'failed': 0, 'retries': 0}
+
+        self.thread = threading.Thread(target=self._run, name='webhook-dispatcher', daemon=True)
+        self.thread.start()
+
+    def emit(self, event_type: str, data: Dict[str, Any]) -> None:
+        """Queue an event; never blocks on the network."""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown webhook event type: {event_type}")
+
+        event = {
+            'id': str(uuid.uuid4()),
+            'type': event_type,
+            'job_id': self.job_id,
+            'timestamp': _now(),
+            'data': data,
+        }
+        with self.condition:
+            if self.closing:
+                logger.debug(f"Webhook dispatcher closed - dropping {event_type} event")
+                return
+
+            if len(self.queue) >= self.max_queue and not self._drop_oldest_metrics():
+                self.queue.popleft()
+                self.stats['dropped'] += 1
+
+            if not self.queue:
+                self.batch_started = time.monotonic()
+            self.queue.append(event)
+            self.stats['events'] += 1
+            if event_type != 'metrics':
+                self.urgent = True
+            self.condition.notify()
+
+    def _drop_oldest_metrics(self) -> bool:
+        """Make room by dropping the oldest metrics event. Caller holds the lock."""
+        for index, event in enumerate(self.queue):
+            if event['type'] == 'metrics':
+                del self.queue[index]
+                self.stats['dropped'] += 1
+                return True
+        return False
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Deliver everything queued, then stop.
+
+        Args:
+            timeout: Seconds to spend draining (default: WEBHOOK_DRAIN_SECONDS);
+                undelivered events are dropped after that
+        """
+        if timeout is None:
+            timeout = float(os.environ.get('WEBHOOK_DRAIN_SECONDS', DEFAULT_DRAIN_SECONDS))
+        with self.condition:
+            if self.closing:
+                return
+            self.closing = True
+            self.condition.notify()
+
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            # Cut short any backoff sleep and in-flight retries
+            self.abort.set()
+            self.thread.join(self.timeout)
+            with self.condition:
+                self.stats['dropped'] += len(self.queue)
+                self.queue.clear()
+        self.session.close()
+
+        logger.info(
+            f"Webhooks: {self.stats['events']} events in {self.stats['batches']} batches, "
+            f"{self.stats['delivered']} delivered, {self.stats['failed']} failed, "
+            f"{self.stats['retries']} retries, {self.stats['dropped']} dropped"
+        )
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while True:
+                    if self.queue and (self.urgent or self.closing or len(self.queue) >= self.max_batch):
+                        break
+                    if self.queue:
+                        remaining = self.batch_seconds - (time.monotonic() - self.batch_started)
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    elif self.closing:
+                        return
+                    else:
+                        self.condition.wait()
+
+                batch = [self.queue.popleft() for _ in range(min(self.max_batch, len(self.queue)))]
+                if self.queue:
+                    self.batch_started = time.monotonic()
+                else:
+                    self.urgent = False
+
+            self._deliver(batch)
+
+    def _deliver(self, events: List[Dict[str, Any]]) -> bool:
+        """POST one batch, retrying transient failures under a fixed idempotency key."""
+        batch_id = str(uuid.uuid4())
+        body = json.dumps({
+            'job_id': self.job_id,
+            'batch_id': batch_id,
+            'sent_at': _now(),
+            'events': events,
+        }, default=str).encode('utf-8')
+
+        headers = {'Idempotency-Key': batch_id}
+        if self.secret:
+            signature = hmac.new(self.secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+            headers['X-Webhook-Signature'] = f"sha256={signature}"
+
+        self.stats['batches'] += 1
+        for attempt in range(self.max_retries + 1):
+            if self.abort.is_set():
+                break
+
+            retry_after = None
+            try:
+                response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+                if response.status_code < 300:
+                    self.stats['delivered'] += len(events)
+                    return True
+                if response.status_code < 500 and response.status_code not in RETRY_STATUS_CODES:
+                    logger.warning(f"Webhook rejected with HTTP {response.status_code} - not retrying")
+                    break
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get('Retry-After')
+            except requests.RequestException as e:
+                error = str(e)
+
+            if attempt == self.max_retries:
+                break
+
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.5)
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            logger.warning(f"Webhook delivery failed ({error}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            self.stats['retries'] += 1
+            if self.abort.wait(delay):
+                break
+
+        self.stats['failed'] += len(events)
+        return False
+
+
+class WebhookStatusManager:
+    """
+    Status manager wrapper that also emits webhook events.
+
+    Status and stage changes emit 'status', metric updates emit 'metrics',
+    and the terminal updates emit 'completed' or 'error'. Updates always
+    reach the wrapped status manager first.
+    """
+
+    def __init__(self, status_manager, dispatcher: WebhookDispatcher):
+        self.status_manager = status_manager
+        self.dispatcher = dispatcher
+        self.last: Dict[str, Any] = {}
+
+    def update_status(self, job_id: str, **kwargs) -> None:
+        self.status_manager.update_status(job_id=job_id, **kwargs)
+
+        status = kwargs.get('status', self.last.get('status'))
+        stage = kwargs.get('stage', self.last.get('stage'))
+        progress = kwargs.get('progress')
+
+        if status == 'completed':
+            self.dispatcher.emit('completed', {'metrics': kwargs.get('metrics', {}), 'progress': progress})
+        elif status == 'failed':
+            self.dispatcher.emit('error', {
+                'error_message': kwargs.get('error_message'),
+                'stage': self.last.get('stage'),
+                'metrics': kwargs.get('metrics', {}),
+            })
+        else:
+            if status != self.last.get('status') or stage != self.last.get('stage'):
+                self.dispatcher.emit('status', {'status': status, 'stage': stage, 'progress': progress})
+            if kwargs.get('metrics'):
+                self.dispatcher.emit('metrics', {
+                    'stage': stage,
+                    'progress': progress,
+                    'current_epoch': kwargs.get('current_epoch'),
+                    'current_step': kwargs.get('current_step'),
+                    'metrics': kwargs['metrics'],
+                })
+
+        self.last.update({'status': status, 'stage': stage})
+
+    def get_status(self, job_id: str) -> Dict[str, Any]:
+        return self.status_manager.get_status(job_id)
+
+
+class WebhookCallback(TrainerCallback):
+    """Emits a 'checkpoint' event whenever the Trainer saves a checkpoint."""
+
+    def __init__(self, dispatcher: WebhookDispatcher):
+        self.dispatcher = dispatcher
+
+    def on_save(self, args, state, control, **kwargs):
+        if state.is_world_process_zero:
+            self.dispatcher.emit('checkpoint', {
+                'step': state.global_step,
+                'epoch': state.epoch,
+                'synced': False,
+            })